@@ -8,8 +8,14 @@ from app.extensions import (
     socketio,
     ma,
     init_milvus_client, 
-    init_embed_model
+    init_embed_model,
+    encode_batch
 )
+from app.rag.embedding_cache import init_embedding_cache
+from app.rag.embed_batcher import init_embed_batcher
+from app.rag.dedup import init_dedup_index
+from app.rag.bm25 import init_bm25_index
+from app.rag.reranker import init_reranker
 from app.auth.models import User
 # from app.learning.models import *
 # from app.engagement.models import *
@@ -92,8 +98,25 @@ def create_app():
                 db_path=milvus_db_path,
                 collection=milvus_collection,
                 dim=milvus_dimension,
+                backend=app.config.get("VECTOR_STORE_BACKEND", "milvus"),
+                store_dir=app.config.get("VECTOR_STORE_DIR") or None,
+                read_only=app.config.get("VECTOR_STORE_READ_ONLY", False),
+                ivf_nlist=app.config.get("VECTOR_STORE_IVF_NLIST", 0),
+                ivf_nprobe=app.config.get("VECTOR_STORE_IVF_NPROBE", 8),
+                ivf_min_rows=app.config.get("VECTOR_STORE_IVF_MIN_ROWS", 50000),
+                partitioned=app.config.get("VECTOR_STORE_PARTITIONED", True),
+                max_partitions=app.config.get("VECTOR_STORE_MAX_PARTITIONS", 1000),
             )
             app.logger.info("Milvus client initialized successfully.")
+            if app.config.get("INGEST_DEDUP_ENABLED", True):
+                init_dedup_index(
+                    milvus_db_path,
+                    milvus_collection,
+                    threshold=app.config.get("INGEST_DEDUP_THRESHOLD", 0.85),
+                    num_perm=app.config.get("INGEST_DEDUP_NUM_PERM", 128),
+                )
+            if app.config.get("RAG_HYBRID_ENABLED", True):
+                init_bm25_index(milvus_db_path, milvus_collection)
         except Exception as e:
             app.logger.error(f"Failed to initialize Milvus client: {e}", exc_info=True)
             # Depending on criticality, you might want to re-raise or sys.exit(1)
@@ -104,11 +127,41 @@ def create_app():
             if not embed_model_name:
                 app.logger.error("Missing Embedding Model configuration (EMBED_MODEL_NAME).")
                 raise RuntimeError("Embedding Model configuration missing.")
-            init_embed_model(model_name=embed_model_name)
+            embed_model = init_embed_model(
+                model_name=embed_model_name,
+                backend=app.config.get("EMBED_BACKEND", "torch"),
+                onnx_dir=app.config.get("EMBED_ONNX_DIR"),
+                quantized=app.config.get("EMBED_ONNX_QUANTIZED", True),
+                num_threads=app.config.get("EMBED_NUM_THREADS"),
+            )
             app.logger.info("Embedding model initialized successfully.")
+            if app.config.get("EMBED_CACHE_ENABLED", True):
+                init_embedding_cache(
+                    embed_model.name,
+                    dim=embed_model.get_sentence_embedding_dimension(),
+                    max_memory_entries=app.config.get("EMBED_CACHE_MAX_ENTRIES", 10000),
+                    disk_dir=app.config.get("EMBED_CACHE_DIR") or None,
+                    disk_capacity=app.config.get("EMBED_CACHE_DISK_CAPACITY", 100000),
+                )
+            if app.config.get("EMBED_BATCHER_ENABLED", True):
+                init_embed_batcher(
+                    encode_batch,
+                    max_batch=app.config.get("EMBED_BATCH_MAX_SIZE", 32),
+                    max_wait_ms=app.config.get("EMBED_BATCH_MAX_WAIT_MS", 5.0),
+                )
         except Exception as e:
             app.logger.error(f"Failed to initialize embedding model: {e}", exc_info=True)
 
+        if app.config.get("RAG_RERANK_ENABLED", False):
+            try:
+                init_reranker(
+                    app.config.get("RAG_RERANK_MODEL"),
+                    batch_size=app.config.get("RAG_RERANK_BATCH_SIZE", 16),
+                    max_length=app.config.get("RAG_RERANK_MAX_LENGTH", 256),
+                )
+            except Exception as e:
+                app.logger.error(f"Failed to initialize reranker, retrieval will not be reranked: {e}", exc_info=True)
+
         # Llama Model - using lazy loading to prevent segfault
         app.logger.info("Llama model will be loaded on first use (lazy loading).")
         
@@ -1,16 +1,77 @@
-from app.extensions import llama_model
 from app.llm.model import generate_response
+from app.llm.scheduler import AdmissionRejected, DEFAULT_PRIORITY
+from app.llm.prefix_cache import register_prefix
 from typing import Optional
 from flask import current_app
 import json
 import logging
 
+# Rough token cost of one generated card, used to size max_tokens
+CARD_TOKEN_ESTIMATE = 160
+MAX_FLASHCARD_TOKENS = 3072
+
+def flashcard_schema(num_cards: int) -> dict:
+    """JSON schema for the flashcard array; compiled to a GBNF grammar by llama.cpp."""
+    return {
+        "type": "array",
+        "minItems": num_cards,
+        "maxItems": num_cards,
+        "items": {
+            "type": "object",
+            "properties": {
+                "question": {"type": "string", "minLength": 1},
+                "answer": {"type": "string", "minLength": 1},
+            },
+            "required": ["question", "answer"],
+            "additionalProperties": False,
+        },
+    }
+
+def iter_array_objects(pieces):
+    """
+    Incrementally parse a streamed JSON array and yield each element object
+    as soon as its closing brace arrives.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    current = []
+    for piece in pieces:
+        for ch in piece:
+            if depth >= 2:
+                current.append(ch)
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if ch == '"':
+                in_string = True
+            elif ch in '[{':
+                depth += 1
+                if depth == 2 and ch == '{':
+                    current = ['{']
+            elif ch in ']}':
+                depth -= 1
+                if depth == 1 and ch == '}':
+                    try:
+                        yield json.loads(''.join(current))
+                    except json.JSONDecodeError:
+                        pass
+                    current = []
+
 class BaseAgent:
-    def __init__(self, system_prompt: str, max_tokens: int = 512):
+    def __init__(self, system_prompt: str, max_tokens: int = 512, model_name: Optional[str] = None):
         self.system_prompt = system_prompt.strip()
         self.max_tokens = max_tokens
+        # Name from LLM_MODELS; None uses LLM_DEFAULT_MODEL
+        self.model_name = model_name
+        register_prefix(self.system_prompt)
 
-    def generate_response(self, user_query: str, context: Optional[str] = None) -> str:
+    def build_messages(self, user_query: str, context: Optional[str] = None) -> list:
         messages = [{"role": "system", "content": self.system_prompt}]
         
         user_content = user_query
@@ -18,13 +79,34 @@ class BaseAgent:
             user_content = f"Context: {context}\n\nQuestion: {user_query}"
         
         messages.append({"role": "user", "content": user_content})
+        return messages
+
+    def generate_response(self, user_query: str, context: Optional[str] = None) -> str:
+        messages = self.build_messages(user_query, context)
         
         try:
-            return generate_response(messages, max_tokens=self.max_tokens)
+            return generate_response(messages, max_tokens=self.max_tokens, model_name=self.model_name)
+        except AdmissionRejected:
+            raise
         except Exception as e:
             current_app.logger.error(f"Agent error: {e}")
             return self.fallback_response()
 
+    def stream_response(self, user_query: str, context: Optional[str] = None):
+        """Yield the reply token by token; falls back if nothing was produced."""
+        messages = self.build_messages(user_query, context)
+        produced = False
+        try:
+            for piece in generate_response(messages, max_tokens=self.max_tokens, stream=True, model_name=self.model_name):
+                produced = True
+                yield piece
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            current_app.logger.error(f"Agent streaming error: {e}")
+        if not produced:
+            yield self.fallback_response()
+
     def fallback_response(self) -> str:
         return "I'm here to help with your learning. Could you please rephrase your question?"
 
@@ -44,46 +126,48 @@ class FlashcardAgent(BaseAgent):
         )
         super().__init__(system_prompt, max_tokens=1024)
 
-    def generate(self, topic: str, num_cards: int = 5) -> list[dict]:
+    def generate(self, topic: str, num_cards: int = 5, priority: str = DEFAULT_PRIORITY,
+                 context: Optional[str] = None) -> list[dict]:
+        cards = list(self.stream_cards(topic, num_cards, priority=priority, context=context))
+        return cards if cards else self._fallback_cards(topic, num_cards)
+
+    def stream_cards(self, topic: str, num_cards: int = 5, priority: str = DEFAULT_PRIORITY,
+                     context: Optional[str] = None):
+        """
+        Yield validated cards one by one as each JSON object closes in the stream.
+        Decoding is constrained by a JSON-schema grammar for the card array, so
+        the output always parses; a reply cut off by max_tokens still yields
+        every card completed before the cut. context (e.g. retrieved material)
+        is added to the prompt as reference.
+        """
         prompt = f"Generate exactly {num_cards} flashcards about: {topic}. Return only valid JSON array format: [{{\"question\": \"...\", \"answer\": \"...\"}}]"
-        
+        messages = self.build_messages(prompt, context)
+        max_tokens = min(max(self.max_tokens, CARD_TOKEN_ESTIMATE * num_cards), MAX_FLASHCARD_TOKENS)
+
+        produced = 0
         try:
-            response = self.generate_response(prompt)
-            
-            # Clean and extract JSON from response
-            json_start = response.find('[')
-            json_end = response.rfind(']')
-            
-            if json_start != -1 and json_end != -1:
-                json_string = response[json_start:json_end + 1]
-                
-                # Clean common JSON issues
-                json_string = json_string.replace('\n', ' ').replace('\r', '')
-                json_string = json_string.replace('\\\'', '\"')
-                
-                try:
-                    cards = json.loads(json_string)
-                except json.JSONDecodeError:
-                    # Try to fix common issues and parse again
-                    json_string = json_string.replace(',}', '}').replace(',]', ']')
-                    cards = json.loads(json_string)
-                
-                # Validate format
-                validated = []
-                for card in cards:
-                    if isinstance(card, dict) and 'question' in card and 'answer' in card:
-                        validated.append({
-                            "question": str(card['question']).strip()[:500],  # Limit length
-                            "answer": str(card['answer']).strip()[:500]
-                        })
-                
-                return validated[:num_cards] if validated else self._fallback_cards(topic, num_cards)
-                
+            pieces = generate_response(
+                messages,
+                max_tokens=max_tokens,
+                stream=True,
+                response_format={"type": "json_object", "schema": flashcard_schema(num_cards)},
+                priority=priority,
+                model_name=self.model_name,
+            )
+            for card in iter_array_objects(pieces):
+                if isinstance(card, dict) and card.get('question') and card.get('answer'):
+                    produced += 1
+                    yield {
+                        "question": str(card['question']).strip()[:500],  # Limit length
+                        "answer": str(card['answer']).strip()[:500]
+                    }
+                    if produced >= num_cards:
+                        return
+        except AdmissionRejected:
+            raise
         except Exception as e:
             current_app.logger.error(f"Flashcard generation error: {e}")
-        
-        return self._fallback_cards(topic, num_cards)
-    
+
     def _fallback_cards(self, topic: str, num_cards: int) -> list[dict]:
         """Generate simple fallback cards when AI generation fails"""
         return [
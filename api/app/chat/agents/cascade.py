@@ -0,0 +1,216 @@
+"""
+Cascade routing: try a small model first and escalate to the large one.
+
+Before generation, the intent and shape of the query decide whether the
+small model gets a go at all (flashcard requests, long or multi-part
+questions and "explain in detail" style asks go straight to the large
+model), as does a prompt that would not fit the small model's context
+window, which is often smaller than the one chat packed the context for.
+After generation the small model's answer is scored: hedging or
+refusals, a reply cut off by max_tokens, a near-empty or highly repetitive
+reply all lower its confidence, and anything below the threshold is
+escalated. Every decision is logged with its latency, and the stats track
+the estimated time saved against the large model's running average.
+"""
+from flask import current_app
+from app.llm.model import get_model_registry, submit_request
+from app.llm.context_packer import TEMPLATE_OVERHEAD_TOKENS, get_token_counter
+from app.llm.scheduler import AdmissionRejected
+import threading
+import time
+
+# Asks that need the large model regardless of length
+ESCALATE_KEYWORDS = (
+    "in detail", "step by step", "compare", "contrast", "derive", "prove",
+    "analyze", "analyse", "essay", "write a", "code", "calculate", "solve",
+)
+# Phrases that signal the small model is out of its depth
+HEDGE_PHRASES = (
+    "i'm not sure", "i am not sure", "i don't know", "i do not know",
+    "cannot answer", "can't answer", "not enough information", "as an ai",
+    "i'm unable", "i am unable",
+)
+MIN_ANSWER_CHARS = 20
+# Intents the small model may answer
+SMALL_MODEL_INTENTS = ("learning", "study")
+
+
+class CascadeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.small_answered = 0
+        self.escalated = 0
+        self.direct_large = 0
+        self.small_seconds = 0.0
+        self.large_calls = 0
+        self.large_seconds = 0.0
+        self.saved_seconds = 0.0
+        self.wasted_seconds = 0.0
+
+    def record_large(self, seconds: float):
+        with self._lock:
+            self.large_calls += 1
+            self.large_seconds += seconds
+
+    def avg_large_seconds(self) -> float:
+        with self._lock:
+            return self.large_seconds / self.large_calls if self.large_calls else 0.0
+
+    def record(self, route: str, small_seconds: float = 0.0):
+        avg_large = self.avg_large_seconds()
+        with self._lock:
+            self.small_seconds += small_seconds
+            if route == "small":
+                self.small_answered += 1
+                if avg_large:
+                    self.saved_seconds += max(0.0, avg_large - small_seconds)
+            elif route == "escalated":
+                self.escalated += 1
+                self.wasted_seconds += small_seconds
+            else:
+                self.direct_large += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            tried = self.small_answered + self.escalated
+            total = tried + self.direct_large
+            return {
+                "queries": total,
+                "small_answered": self.small_answered,
+                "escalated": self.escalated,
+                "direct_large": self.direct_large,
+                "small_answer_rate": round(self.small_answered / total, 4) if total else 0.0,
+                "escalation_rate": round(self.escalated / tried, 4) if tried else 0.0,
+                "avg_large_seconds": round(self.large_seconds / self.large_calls, 3) if self.large_calls else 0.0,
+                "estimated_saved_seconds": round(self.saved_seconds - self.wasted_seconds, 2),
+            }
+
+
+_stats = CascadeStats()
+
+
+def cascade_stats() -> dict:
+    return _stats.as_dict()
+
+
+def record_large_latency(seconds: float):
+    """Feed the large model's latency into the savings estimate."""
+    _stats.record_large(seconds)
+
+
+def cascade_enabled() -> bool:
+    config = current_app.config
+    if not config.get("LLM_CASCADE_ENABLED", False):
+        return False
+    small_model = config.get("LLM_CASCADE_SMALL_MODEL", "small")
+    if small_model not in get_model_registry().specs:
+        current_app.logger.warning(f"Cascade model '{small_model}' is not in LLM_MODELS; cascade disabled.")
+        return False
+    return True
+
+
+def route_to_small(user_query: str, intent: str) -> tuple:
+    """Pre-generation check: (use_small_model, reason)."""
+    if intent not in SMALL_MODEL_INTENTS:
+        return False, f"intent:{intent}"
+    query = user_query.lower()
+    if len(query.split()) > current_app.config.get("LLM_CASCADE_MAX_QUERY_WORDS", 30):
+        return False, "long_query"
+    if query.count("?") > 1:
+        return False, "multi_part"
+    for keyword in ESCALATE_KEYWORDS:
+        if keyword in query:
+            return False, f"keyword:{keyword}"
+    return True, "simple"
+
+
+def small_model_n_ctx() -> int:
+    config = current_app.config
+    spec = get_model_registry().spec(config.get("LLM_CASCADE_SMALL_MODEL", "small"))
+    return spec.get("n_ctx", config.get("LLAMA_N_CTX", 4096))
+
+
+def fits_small_model(messages: list, max_tokens: int, n_ctx: int = None, counter=None) -> bool:
+    """Whether the prompt plus max_tokens of reply fit the small model's context window."""
+    counter = counter or get_token_counter()
+    n_ctx = n_ctx or small_model_n_ctx()
+    prompt_tokens = sum(counter.count(message["content"]) for message in messages)
+    return prompt_tokens + TEMPLATE_OVERHEAD_TOKENS + max_tokens <= n_ctx
+
+
+def answer_confidence(text: str, finish_reason: str = None) -> tuple:
+    """Post-generation score in [0, 1] for a small-model answer, with the reasons it was lowered."""
+    confidence, reasons = 1.0, []
+    stripped = (text or "").strip()
+    lowered = stripped.lower()
+    if not stripped:
+        return 0.0, ["empty"]
+    if finish_reason == "length":
+        confidence -= 0.5
+        reasons.append("truncated")
+    if len(stripped) < MIN_ANSWER_CHARS:
+        confidence -= 0.5
+        reasons.append("too_short")
+    if any(phrase in lowered for phrase in HEDGE_PHRASES):
+        confidence -= 0.5
+        reasons.append("hedging")
+    words = lowered.split()
+    if len(words) >= 20 and len(set(words)) / len(words) < 0.3:
+        confidence -= 0.3
+        reasons.append("repetitive")
+    return max(0.0, confidence), reasons
+
+
+def try_small_model(agent, user_query: str, context: str, intent: str):
+    """
+    Run the cascade's first stage. Returns the small model's answer when it
+    is confident enough, or None when the query should go to the large model.
+    """
+    config = current_app.config
+    use_small, reason = route_to_small(user_query, intent)
+    if not use_small:
+        _stats.record("direct")
+        current_app.logger.info(f"Cascade route=large intent={intent} reason={reason}")
+        return None
+
+    messages = agent.build_messages(user_query, context)
+    max_tokens = config.get("LLM_CASCADE_SMALL_MAX_TOKENS", 256)
+    if not fits_small_model(messages, max_tokens):
+        # Would overflow and fail after a wasted attempt; the context was packed for the large model
+        _stats.record("direct")
+        current_app.logger.info(f"Cascade route=large intent={intent} reason=context_too_long")
+        return None
+
+    started = time.monotonic()
+    try:
+        response = submit_request(
+            messages,
+            max_tokens=max_tokens,
+            model_name=config.get("LLM_CASCADE_SMALL_MODEL", "small"),
+        ).result()
+        choice = (response.get("choices") or [{}])[0]
+        text = (choice.get("message", {}).get("content") or "").strip()
+        confidence, reasons = answer_confidence(text, choice.get("finish_reason"))
+    except AdmissionRejected as e:
+        text, confidence, reasons = "", 0.0, [f"rejected:{e.status}"]
+    except Exception as e:
+        current_app.logger.warning(f"Cascade small model failed: {e}")
+        text, confidence, reasons = "", 0.0, ["error"]
+    small_seconds = time.monotonic() - started
+
+    threshold = config.get("LLM_CASCADE_MIN_CONFIDENCE", 0.6)
+    if confidence >= threshold:
+        _stats.record("small", small_seconds)
+        saved = max(0.0, _stats.avg_large_seconds() - small_seconds)
+        current_app.logger.info(
+            f"Cascade route=small intent={intent} confidence={confidence:.2f} "
+            f"latency={small_seconds:.2f}s est_saved={saved:.2f}s"
+        )
+        return text
+
+    _stats.record("escalated", small_seconds)
+    current_app.logger.info(
+        f"Cascade route=escalated intent={intent} confidence={confidence:.2f} "
+        f"reasons={','.join(reasons)} wasted={small_seconds:.2f}s"
+    )
+    return None
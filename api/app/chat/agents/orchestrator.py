@@ -1,7 +1,17 @@
 from flask import current_app
+from app.extensions import init_embed_model, embed_text
+from app.llm.scheduler import AdmissionRejected
 from .agents import AGENTS
+from .semantic_cache import SemanticCache, context_fingerprint
+from .cascade import cascade_enabled, try_small_model, record_large_latency
+from typing import Optional
+import threading
+import time
 import re
 
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
 # Intent classification keywords
 INTENT_KEYWORDS = {
     "flashcard": ["flashcard", "card", "quiz", "test", "review", "memorize"],
@@ -25,26 +35,138 @@ def classify_intent(user_query: str) -> str:
     best_intent = max(scores, key=scores.get) if max(scores.values()) > 0 else "learning"
     return best_intent
 
-def supervisor_agent(user_query: str, context: str = "") -> str:
-    """Route user query to appropriate agent"""
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the shared semantic response cache, or None when disabled."""
+    global _semantic_cache
+    if not current_app.config.get("SEMANTIC_CACHE_ENABLED", True):
+        return None
+    if _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache(
+                    threshold=current_app.config.get("SEMANTIC_CACHE_THRESHOLD", 0.9),
+                    ttl_seconds=current_app.config.get("SEMANTIC_CACHE_TTL", 3600),
+                    max_entries=current_app.config.get("SEMANTIC_CACHE_MAX_ENTRIES", 1000),
+                )
+    return _semantic_cache
+
+def _cache_lookup(user_query: str, intent: str, fingerprint: str):
+    """Return (query_vector, cached_response); query_vector is None when caching is off."""
+    cache = get_semantic_cache()
+    if cache is None:
+        return None, None
+    try:
+        init_embed_model()
+        query_vector = embed_text(user_query, normalize=True)
+        cached = cache.lookup(query_vector, intent, fingerprint)
+        if cached is not None:
+            current_app.logger.info(f"Semantic cache hit for intent '{intent}'")
+        return query_vector, cached
+    except Exception as e:
+        current_app.logger.warning(f"Semantic cache lookup failed: {e}")
+        return None, None
+
+def _cache_store(query_vector, intent: str, fingerprint: str, agent, response: str):
+    if query_vector is None or response == agent.fallback_response():
+        return
+    get_semantic_cache().store(query_vector, intent, fingerprint, response)
+
+def _fingerprint(context: str, retrieved_context: Optional[str], history: Optional[str], scope) -> str:
+    # The prompt is built from the retrieved documents and the history, so both key the
+    # cache; with history, the room too, so no answer crosses into another conversation
+    if history is None and retrieved_context is None:
+        return context_fingerprint(context, scope)
+    return context_fingerprint(retrieved_context, history, scope if history else None)
+
+def _flashcard_summary(agent, user_query: str) -> str:
+    # Special handling for flashcard generation
+    topic = user_query.replace("flashcard", "").replace("card", "").strip()
+    cards = agent.generate(topic)
+    return f"Generated {len(cards)} flashcards about {topic}"
+
+def supervisor_agent(user_query: str, context: str = "", retrieved_context: Optional[str] = None,
+                     history: Optional[str] = None, scope=None) -> str:
+    """
+    Route user query to appropriate agent.
+    With LLM_CASCADE_ENABLED, simple queries are answered by the small model
+    first and only escalated to the agent's model when the answer looks weak.
+    Responses are cached by query embedding, intent and a fingerprint of
+    retrieved_context and history (falls back to the full context when
+    neither is given); scope (e.g. the chat room) keys answers that depend
+    on history.
+    """
     try:
         intent = classify_intent(user_query)
         current_app.logger.info(f"Query intent: {intent}")
-        
+
+        fingerprint = _fingerprint(context, retrieved_context, history, scope)
+        query_vector, cached = _cache_lookup(user_query, intent, fingerprint)
+        if cached is not None:
+            return cached
+
         agent = AGENTS.get(intent, AGENTS["learning"])
         
         if intent == "flashcard" and hasattr(agent, 'generate'):
-            # Special handling for flashcard generation
-            topic = user_query.replace("flashcard", "").replace("card", "").strip()
-            cards = agent.generate(topic)
-            return f"Generated {len(cards)} flashcards about {topic}"
-        
-        return agent.generate_response(user_query, context)
+            response = _flashcard_summary(agent, user_query)
+        else:
+            cascade = cascade_enabled()
+            response = try_small_model(agent, user_query, context, intent) if cascade else None
+            if response is None:
+                started = time.monotonic()
+                response = agent.generate_response(user_query, context)
+                if cascade:
+                    record_large_latency(time.monotonic() - started)
+
+        _cache_store(query_vector, intent, fingerprint, agent, response)
+        return response
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         current_app.logger.error(f"Orchestrator error: {e}")
         return "I'm having trouble processing your request. Please try again."
 
+def supervisor_agent_stream(user_query: str, context: str = "", retrieved_context: Optional[str] = None,
+                            history: Optional[str] = None, scope=None):
+    """Streaming variant of supervisor_agent: yields the reply piece by piece."""
+    try:
+        intent = classify_intent(user_query)
+        current_app.logger.info(f"Query intent: {intent}")
+
+        fingerprint = _fingerprint(context, retrieved_context, history, scope)
+        query_vector, cached = _cache_lookup(user_query, intent, fingerprint)
+        if cached is not None:
+            yield cached
+            return
+
+        agent = AGENTS.get(intent, AGENTS["learning"])
+
+        if intent == "flashcard" and hasattr(agent, 'generate'):
+            response = _flashcard_summary(agent, user_query)
+            yield response
+        else:
+            cascade = cascade_enabled()
+            response = try_small_model(agent, user_query, context, intent) if cascade else None
+            if response is not None:
+                yield response
+            else:
+                started = time.monotonic()
+                pieces = []
+                for piece in agent.stream_response(user_query, context):
+                    pieces.append(piece)
+                    yield piece
+                response = "".join(pieces).strip()
+                if cascade:
+                    record_large_latency(time.monotonic() - started)
+
+        _cache_store(query_vector, intent, fingerprint, agent, response)
+
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        current_app.logger.error(f"Orchestrator error: {e}")
+        yield "I'm having trouble processing your request. Please try again."
+
 def get_available_agents():
     """Return available agents"""
     return {
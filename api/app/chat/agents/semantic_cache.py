@@ -0,0 +1,100 @@
+"""
+Semantic response cache for supervisor_agent.
+
+Entries are bucketed by (intent, context fingerprint) and matched by cosine
+similarity of normalized query embeddings, so paraphrases of the same
+question against the same retrieved documents reuse one generation. The
+fingerprint also covers the conversation history and its room, so a
+follow-up ("explain that again") never gets an answer written for another
+conversation. Expired entries are dropped lazily, when their bucket is
+looked up or they reach the LRU end.
+"""
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import itertools
+import threading
+import time
+import numpy as np
+
+
+def context_fingerprint(context: Optional[str], *parts) -> str:
+    """Stable short fingerprint of the retrieved context and any other prompt inputs (history, scope)."""
+    digest = hashlib.sha1((context or "").encode("utf-8"))
+    for part in parts:
+        digest.update(b"\x00" + str(part or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.9, ttl_seconds: int = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # entry id -> (bucket, vector, response, created_at), LRU order
+        self._buckets = {}  # (intent, fingerprint) -> set of entry ids
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, vector, intent: str, fingerprint: str) -> Optional[str]:
+        """Return the cached response for the most similar query, if close enough."""
+        bucket = (intent, fingerprint)
+        now = time.time()
+        with self._lock:
+            entry_ids = []
+            for entry_id in list(self._buckets.get(bucket, ())):
+                if now - self._entries[entry_id][3] > self.ttl_seconds:
+                    self._remove(entry_id)
+                else:
+                    entry_ids.append(entry_id)
+            if entry_ids:
+                vectors = np.stack([self._entries[i][1] for i in entry_ids])
+                scores = vectors @ np.asarray(vector, dtype=np.float32)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = entry_ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id][2]
+            self.misses += 1
+            return None
+
+    def store(self, vector, intent: str, fingerprint: str, response: str):
+        bucket = (intent, fingerprint)
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (bucket, np.asarray(vector, dtype=np.float32), response, time.time())
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            now = time.time()
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                if now - self._entries[oldest][3] <= self.ttl_seconds:
+                    self.evictions += 1
+                self._remove(oldest)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, entry_id):
+        bucket = self._entries.pop(entry_id)[0]
+        ids = self._buckets.get(bucket)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._buckets[bucket]
@@ -8,8 +8,14 @@ from app.extensions import db
 from datetime import datetime
 from app.auth.models import User
 import logging
-from app.extensions import init_embed_model, search_vectors
-from app.chat.agents.orchestrator import supervisor_agent
+from app.rag.retriever import retrieve
+from app.chat.agents.orchestrator import supervisor_agent_stream, get_semantic_cache, classify_intent
+from app.chat.agents.agents import AGENTS
+from app.chat.agents.cascade import cascade_stats
+from app.llm.context_packer import pack_context
+from app.chat.socket import stream_bot_tokens, emit_bot_done
+from app.llm.model import check_admission, rejection_response
+from app.llm.scheduler import AdmissionRejected
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +27,9 @@ chat_rooms_schema = ChatRoomSchema(many=True)
 chat_message_schema = ChatMessageSchema()
 chat_messages_schema = ChatMessageSchema(many=True)
 
+# Stored as the reply when the model queue rejects a message mid-request
+BUSY_REPLY_TEXT = "The assistant is busy right now. Please try again in a moment."
+
 
 def get_or_create_learning_assistant():
     assistant = User.query.filter_by(username="learning_assistant").first()
@@ -127,6 +136,28 @@ def get_room_messages(room_id):
     return jsonify(messages_data)
 
 
+def save_bot_reply(room_id, text):
+    """Store an assistant reply in the room and tell connected clients it is complete."""
+    bot_msg = None
+    try:
+        assistant = get_or_create_learning_assistant()
+        bot_msg = ChatMessage(
+            room_id=room_id,
+            sender_id=assistant.id,
+            content=text,
+            role="assistant",
+            timestamp=datetime.utcnow(),
+        )
+        db.session.add(bot_msg)
+        db.session.commit()
+    except Exception as e:
+        current_app.logger.error(f"Failed to save bot message: {e}", exc_info=True)
+        db.session.rollback()
+        bot_msg = None
+
+    emit_bot_done(room_id, chat_message_schema.dump(bot_msg) if bot_msg else {"content": text, "role": "assistant"})
+    return bot_msg
+
 @chat_bp.route("/rooms/<int:room_id>/post_message", methods=["POST"])
 @jwt_required()
 def post_message_and_get_bot_reply(room_id):
@@ -148,6 +179,13 @@ def post_message_and_get_bot_reply(room_id):
 
     user_id = get_jwt_identity()
 
+    # Refuse early, before any DB or retrieval work, when chat is saturated
+    try:
+        check_admission("interactive")
+    except AdmissionRejected as e:
+        current_app.logger.warning(f"Chat message rejected: {e}")
+        return rejection_response(e)
+
     # Save user message to DB
     try:
         user_msg = ChatMessage(
@@ -168,35 +206,45 @@ def post_message_and_get_bot_reply(room_id):
     recent_msgs = ChatMessage.query.filter_by(room_id=room_id).order_by(ChatMessage.timestamp.desc()).limit(20).all()
     recent_msgs.reverse()
 
-    conversation_context = {
-        "user": "\n".join(m.content for m in recent_msgs if m.role == "user"),
-        "advisor": "\n".join(m.content for m in recent_msgs if m.role == "advisor"),
-        "admin": "\n".join(m.content for m in recent_msgs if m.role == "admin"),
-        "assistant": "\n".join(m.content for m in recent_msgs if m.role == "assistant"),
-    }
-    context_text = "\n\n".join(f"{role} messages:\n{msgs}" for role, msgs in conversation_context.items() if msgs)
+    history = [(m.role, m.content) for m in recent_msgs if m.id != user_msg.id]
 
     # Retrieve RAG context
     try:
-        embedding_model = init_embed_model()
-        embedding_vector = embedding_model.encode(content).tolist()
-        docs = search_vectors(embedding_vector, top_k=5)
-        rag_context = "\n".join(r['text'] for r in docs[0]) if docs and docs[0] else "No additional context available."
+        docs = retrieve(content, top_k=current_app.config.get("RAG_TOP_K", 5), owner_id=user_id)
     except Exception as e:
         current_app.logger.error(f"RAG retrieval failed: {e}", exc_info=True)
-        rag_context = "No additional context available."
-
-    combined_context = f"{context_text}\n\nRelevant Documents:\n{rag_context}"
+        docs = []
+
+    # Fit history and documents into the model's context window
+    agent = AGENTS.get(classify_intent(content), AGENTS["learning"])
+    packed = pack_context(
+        content,
+        history,
+        docs,
+        system_prompt=agent.system_prompt,
+        max_tokens=agent.max_tokens,
+        n_ctx=current_app.config.get("LLAMA_N_CTX", 4096),
+        document_share=current_app.config.get("CONTEXT_DOCUMENT_SHARE", 0.6),
+    )
+    combined_context = packed["context"]
+    rag_context = packed["documents_text"]
+    current_app.logger.info(f"Packed prompt context: {packed['tokens']} (dropped {packed['dropped']})")
 
+    # Stream tokens to the room over Socket.IO as they are generated
     try:
-        llm_response = supervisor_agent(content, combined_context)
-
-        chunks = []
-        for chunk in llm_response:
-            if chunk:
-                current_app.logger.debug(f"Streaming token: {chunk}")
-                chunks.append(chunk)
-        bot_reply_text = ''.join(chunks).strip()
+        llm_stream = supervisor_agent_stream(
+            content,
+            combined_context,
+            retrieved_context=rag_context,
+            history=packed["history_text"],
+            scope=f"room-{room_id}",
+        )
+        bot_reply_text = stream_bot_tokens(room_id, llm_stream)
+    except AdmissionRejected as e:
+        # The user message is already saved, so answer it rather than leave it dangling
+        current_app.logger.warning(f"Chat message rejected: {e}")
+        save_bot_reply(room_id, BUSY_REPLY_TEXT)
+        return rejection_response(e)
     except Exception as e:
         current_app.logger.error(f"LLM generation failed: {e}", exc_info=True)
         bot_reply_text = "Sorry, I couldn't process your learning query at the moment."
@@ -204,21 +252,8 @@ def post_message_and_get_bot_reply(room_id):
     if not bot_reply_text:
         bot_reply_text = "I'm here to help you with your learning journey and questions."
 
-    # Save bot reply
-    try:
-        assistant = get_or_create_learning_assistant()
-        bot_msg = ChatMessage(
-            room_id=room_id,
-            sender_id=assistant.id,
-            content=bot_reply_text,
-            role="assistant",
-            timestamp=datetime.utcnow(),
-        )
-        db.session.add(bot_msg)
-        db.session.commit()
-    except Exception as e:
-        current_app.logger.error(f"Failed to save bot message: {e}", exc_info=True)
-        db.session.rollback()
+    # Save bot reply once the stream has finished
+    save_bot_reply(room_id, bot_reply_text)
 
     messages = ChatMessage.query.filter_by(room_id=room_id).order_by(ChatMessage.timestamp.asc()).all()
     conversation = chat_messages_schema.dump(messages)
@@ -228,4 +263,18 @@ def post_message_and_get_bot_reply(room_id):
     return jsonify({
         "bot_reply": bot_reply_text,
         "conversation": conversation,
+        "context_tokens": packed["tokens"],
     })
+
+@chat_bp.route("/cache/stats", methods=["GET"])
+@jwt_required()
+def semantic_cache_stats():
+    cache = get_semantic_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cache.stats()})
+
+@chat_bp.route("/cascade/stats", methods=["GET"])
+@jwt_required()
+def cascade_routing_stats():
+    return jsonify({"enabled": current_app.config.get("LLM_CASCADE_ENABLED", False), **cascade_stats()})
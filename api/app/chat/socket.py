@@ -33,3 +33,20 @@ def handle_message(data):
         'content': content,
         'timestamp': msg.timestamp.isoformat()
     }, room=room)
+
+def stream_bot_tokens(room, tokens) -> str:
+    """
+    Emit each generated piece to the room as a 'bot_token' event and
+    return the full reply once the stream is exhausted.
+    """
+    pieces = []
+    for piece in tokens:
+        if not piece:
+            continue
+        pieces.append(piece)
+        socketio.emit('bot_token', {'room': room, 'token': piece}, room=room)
+    return ''.join(pieces).strip()
+
+def emit_bot_done(room, message: dict):
+    """Tell the room the bot reply is complete and persisted."""
+    socketio.emit('bot_done', {'room': room, 'message': message}, room=room)
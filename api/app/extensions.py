@@ -5,7 +5,15 @@ from flask_socketio import SocketIO
 from flask_marshmallow import Marshmallow
 from llama_cpp import Llama
 from pymilvus import MilvusClient
-from sentence_transformers import SentenceTransformer
+from app.rag.embedding_cache import get_embedding_cache, normalize_rows
+from app.rag.embed_batcher import get_embed_batcher
+from app.rag.embed_backends import load_embed_backend
+from app.rag.dedup import get_dedup_index
+from app.rag.partitions import MAX_PARTITIONS, get_partitions, init_partitions, partition_name
+from app.rag.vector_store import BACKENDS as VECTOR_STORE_BACKENDS, NumpyVectorStore, store_directory
+from app.rag.bm25 import HYBRID_CANDIDATES, RRF_K, get_bm25_index, reciprocal_rank_fusion
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pathlib
 import logging
 
@@ -16,61 +24,139 @@ jwt_blacklist = set() # In-memory blacklist for JTI (for single-instance dev/tes
 socketio = SocketIO(cors_allowed_origins="*") # Consider specifying async_mode="eventlet" if using eventlet
 ma = Marshmallow()
 
-# Global instances for Llama, Embedding Model, and Milvus Client
-llama_model = None
+# Global instances for the Llama tokenizer, Embedding Model, and Milvus Client
+llama_tokenizer = None
 embed_model = None
+embed_model_name = None
 _milvus_client = None
 
 db_path = "./milvus_rag.db"
 collection_name = "ultra_learning_collection"
 embedding_dim = 384
 
-def init_llama_model(model_path: str, n_ctx: int = 4096, n_gpu_layers: int = 0, n_threads: int = 4, use_mlock: bool = False, verbose: bool = False):
+# Bulk ingestion defaults: texts encoded per model call, rows per Milvus insert
+EMBED_BATCH_SIZE = 64
+INSERT_BATCH_SIZE = 512
+
+# Runs the BM25 side of hybrid_search() alongside the vector search
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-search")
+
+def load_llama_model(
+    model_path: str,
+    n_ctx: int = 4096,
+    n_gpu_layers: int = 0,
+    n_threads: int = None,
+    n_threads_batch: int = None,
+    n_batch: int = 512,
+    use_mmap: bool = True,
+    use_mlock: bool = False,
+    verbose: bool = False,
+    draft: dict = None,
+):
     """
-    Initializes the global Llama model instance.
-    Raises RuntimeError if initialization fails.
+    Loads a new Llama model instance. Models are owned by the model registry
+    (app.llm.model), which loads one per inference slot or worker process.
+    n_threads/n_threads_batch of None keep llama.cpp's defaults.
+    draft is a speculative decoding spec (see app.llm.speculative.build_draft_model).
+    """
+    from app.llm.speculative import build_draft_model
+
+    try:
+        model = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_gpu_layers=n_gpu_layers,
+            n_threads=n_threads,
+            n_threads_batch=n_threads_batch,
+            n_batch=n_batch,
+            use_mmap=use_mmap,
+            use_mlock=use_mlock,
+            verbose=verbose,
+            draft_model=build_draft_model(draft),
+        )
+        logging.info(
+            f"Llama model loaded from {model_path} with context {n_ctx} "
+            f"(threads={n_threads}, batch={n_batch}, mmap={use_mmap}, mlock={use_mlock}, "
+            f"draft={(draft or {}).get('mode', 'none')})"
+        )
+        return model
+    except Exception as e:
+        logging.error(f"Failed to load Llama model from {model_path}: {e}")
+        raise RuntimeError(f"Error loading Llama model: {e}")
+
+def init_llama_tokenizer(model_path: str):
     """
-    global llama_model
-    if llama_model is None:
+    Initializes a vocab-only Llama instance used purely for token counting.
+    Loads no weights, so it is cheap even when inference runs in worker processes.
+    """
+    global llama_tokenizer
+    if llama_tokenizer is None:
         try:
-            llama_model = Llama(
-                model_path=model_path,
-                n_ctx=n_ctx,
-                n_gpu_layers=n_gpu_layers,
-                verbose=verbose,
-            )
-            logging.info(f"Llama model loaded from {model_path} with context {n_ctx}")
+            llama_tokenizer = Llama(model_path=model_path, vocab_only=True, verbose=False)
+            logging.info(f"Llama tokenizer loaded from {model_path}")
         except Exception as e:
-            logging.error(f"Failed to load Llama model from {model_path}: {e}")
-            raise RuntimeError(f"Error loading Llama model: {e}")
-    return llama_model
+            logging.error(f"Failed to load Llama tokenizer from {model_path}: {e}")
+            raise RuntimeError(f"Error loading Llama tokenizer: {e}")
+    return llama_tokenizer
 
-def init_embed_model(model_name: str = "all-MiniLM-L6-v2"):
+def init_embed_model(model_name: str = "all-MiniLM-L6-v2", backend: str = "torch", onnx_dir: str = None,
+                     quantized: bool = False, num_threads: int = None):
     """
-    Initializes and returns the global SentenceTransformer embedding model.
+    Initializes and returns the global embedding model.
+    backend="torch" loads the SentenceTransformer; backend="onnx" runs the
+    model exported to onnx_dir with ONNX Runtime (int8 when quantized).
     Raises RuntimeError if initialization fails.
     """
-    global embed_model
+    global embed_model, embed_model_name
     if embed_model is None:
         try:
-            embed_model = SentenceTransformer(model_name)
-            logging.info(f"Embedding model '{model_name}' loaded successfully.")
+            embed_model = load_embed_backend(
+                model_name,
+                backend=backend,
+                onnx_dir=onnx_dir,
+                quantized=quantized,
+                num_threads=num_threads,
+            )
+            # Backend-qualified, so cached vectors from different backends never mix
+            embed_model_name = embed_model.name
+            logging.info(f"Embedding model '{embed_model_name}' loaded successfully.")
         except Exception as e:
             logging.error(f"Failed to load embedding model '{model_name}': {e}")
             raise RuntimeError(f"Error loading embedding model: {e}")
     return embed_model
 
-def init_milvus_client(db_path=db_path, collection=collection_name, dim=embedding_dim):
+def init_milvus_client(db_path=db_path, collection=collection_name, dim=embedding_dim, backend: str = "milvus",
+                       store_dir: str = None, read_only: bool = False, ivf_nlist: int = 0, ivf_nprobe: int = 8,
+                       ivf_min_rows: int = 50000, partitioned: bool = False, max_partitions: int = MAX_PARTITIONS):
     """
-    Initialize and return the global MilvusClient singleton.
+    Initialize and return the global vector store client singleton.
+    backend="milvus" uses MilvusClient; backend="numpy" uses the in-process
+    NumpyVectorStore (see app.rag.vector_store) in store_dir, which defaults
+    to a directory next to db_path. Both expose the same client API.
     Only creates the collection if it does not exist.
+    With partitioned, rows go to per-subject / per-owner partitions
+    (see app.rag.partitions) and subject-scoped searches only scan those.
     """
-    global _milvus_client
+    global _milvus_client, collection_name
     if _milvus_client is None:
+        if backend not in VECTOR_STORE_BACKENDS:
+            raise RuntimeError(f"Unknown vector store backend '{backend}'. Use one of {VECTOR_STORE_BACKENDS}.")
+        collection_name = collection
         # Ensure directory exists
         pathlib.Path(db_path).parent.mkdir(parents=True, exist_ok=True)
 
-        _milvus_client = MilvusClient(uri=db_path)
+        if backend == "numpy":
+            client = NumpyVectorStore(
+                store_dir or store_directory(db_path),
+                read_only=read_only,
+                ivf_nlist=ivf_nlist,
+                ivf_nprobe=ivf_nprobe,
+                ivf_min_rows=ivf_min_rows,
+            )
+            logging.info(f"NumPy vector store opened at {client.directory} (read_only={read_only}, ivf_nlist={ivf_nlist})")
+        else:
+            client = MilvusClient(uri=db_path)
+        _milvus_client = client
 
         try:
             _milvus_client.create_collection(
@@ -82,8 +168,54 @@ def init_milvus_client(db_path=db_path, collection=collection_name, dim=embeddin
             if "already exists" not in str(e).lower():
                 raise e
 
+        if partitioned:
+            manager = init_partitions(_milvus_client, collection, max_partitions=max_partitions)
+            logging.info(f"Collection '{collection}' partitioned by subject/owner ({manager.stats()['partitions']} partitions)")
+
     return _milvus_client
 
+def embed_texts(texts: list, normalize: bool = False, batch_size: int = None) -> np.ndarray:
+    """
+    Embed a list of texts as a float32 matrix, one row per text.
+    Goes through the embedding cache when one is initialized, so repeated
+    texts are not re-encoded.
+    """
+    if embed_model is None:
+        raise RuntimeError("Embedding model is not initialized. Call init_embed_model() first.")
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    cache = get_embedding_cache()
+    if cache is not None:
+        return cache.encode(embed_model, list(texts), normalize=normalize, batch_size=batch_size)
+    return np.asarray(embed_model.encode(
+        list(texts),
+        batch_size=batch_size,
+        normalize_embeddings=normalize,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    ), dtype=np.float32)
+
+def embed_text(text: str, normalize: bool = False) -> np.ndarray:
+    """
+    Embed a single text (e.g. a query); see embed_texts().
+    Cache misses go through the embedding micro-batcher when it is running,
+    so concurrent queries share one forward pass.
+    """
+    batcher = get_embed_batcher()
+    if batcher is None:
+        return embed_texts([text], normalize=normalize)[0]
+
+    cache = get_embedding_cache()
+    vector = cache.get(cache.key(text)) if cache is not None else None
+    if vector is None:
+        vector = batcher.encode(text)
+        if cache is not None:
+            cache.put(cache.key(text), vector)
+    return normalize_rows(vector) if normalize else vector
+
+def encode_batch(texts: list) -> np.ndarray:
+    """Raw model call for one micro-batch (no cache, no normalization)."""
+    return embed_model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False)
+
 def get_milvus_client():
     """
     Return the initialized MilvusClient instance.
@@ -97,44 +229,167 @@ def get_milvus_client():
         )
     return _milvus_client
 
-def insert_documents(docs: list, collection_name: str = None):
+def _collection(name: str = None) -> str:
+    """The given collection name, or the one init_milvus_client() created."""
+    return name or collection_name
+
+def _batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _insert_rows(client, collection: str, rows: list):
     """
-    Insert documents into Milvus collection.
-    docs: List of dict where each dict should have keys: 'id' (optional), 'text', 'subject' (optional).
-          Vectors will be generated from 'text' using embed_model.
+    Insert rows into Milvus (into their subject/owner partitions when the
+    collection is partitioned) and mirror them into the BM25 index.
+    Private rows keep their owner_id field either way; owner_filter() uses
+    it to keep them out of other users' searches.
+    """
+    partitions = get_partitions()
+    if partitions is None:
+        groups = {None: rows}
+    else:
+        groups = {}
+        for row in rows:
+            groups.setdefault(partitions.ensure(row.get("subject"), row.get("owner_id")), []).append(row)
+
+    bm25_index = get_bm25_index()
+    for partition, group in groups.items():
+        if partition is None:
+            result = client.insert(collection_name=collection, data=group)
+        else:
+            result = client.insert(collection_name=collection, data=group, partition_name=partition)
+        if bm25_index is not None:
+            ids = [row.get("id") for row in group]
+            if any(doc_id is None for doc_id in ids):
+                ids = list(result.get("ids", [])) if hasattr(result, "get") else []
+            if len(ids) == len(group):
+                bm25_index.add(
+                    (doc_id, row["text"], row.get("subject"), row.get("owner_id"))
+                    for doc_id, row in zip(ids, group)
+                )
+            else:
+                logging.warning(f"Milvus returned no ids for {len(group)} rows; they are not in the BM25 index.")
+    return {"insert_count": len(rows)}
+
+def _dedup_namespace(doc) -> str:
+    # A chunk is only a duplicate of one in the same partition: searches are pruned to partitions
+    return partition_name(doc.get('subject', 'general'), doc.get('owner_id'))
+
+def ingest_documents(
+    docs,
+    collection_name: str = None,
+    batch_size: int = EMBED_BATCH_SIZE,
+    insert_batch_size: int = INSERT_BATCH_SIZE,
+    normalize: bool = False,
+    progress_callback=None,
+    dedup: bool = True,
+):
+    """
+    Stream documents from any iterable (list, generator, file reader) into Milvus.
+    Texts are encoded batch_size at a time so SentenceTransformer batches them,
+    and rows are inserted insert_batch_size at a time, so memory stays constant
+    however large the corpus is.
+    docs: dicts with 'text' and optional 'id' / 'subject' / 'owner_id' (private
+          to that user) / extra metadata keys.
+    progress_callback(inserted, encoded) is called after every Milvus insert.
+    With dedup (and the MinHash index initialized), near-duplicates of chunks
+    already in the collection, or earlier in docs, with the same subject and
+    owner are skipped.
+    Returns {'insert_count', 'batches', 'skipped'}.
     """
     client = get_milvus_client()
-    current_collection = collection_name if collection_name else client.collection_name # Use passed name or default
+    current_collection = _collection(collection_name)
 
     if embed_model is None:
         raise ValueError("Embedding model not initialized. Call init_embed_model() first.")
 
-    data_to_insert = []
-    for doc in docs:
-        if 'text' not in doc:
-            raise ValueError("Document must contain 'text' field for embedding.")
-        
-        doc_vector = embed_model.encode(doc['text']).tolist() # Convert numpy array to list
-        
-        new_doc = {
-            "text": doc['text'],
-            "subject": doc.get('subject', 'general'), # Default subject if not provided
-            "vector": doc_vector
-        }
-        # Only add 'id' if it's explicitly provided and not None, otherwise Milvus auto-generates
-        if 'id' in doc and doc['id'] is not None:
-            new_doc["id"] = doc['id']
-            
-        data_to_insert.append(new_doc)
-
-    logging.info(f"Inserting {len(data_to_insert)} documents into Milvus collection '{current_collection}'.")
-    return client.insert(collection_name=current_collection, data=data_to_insert)
-
-def search_vectors(query_embedding: list, top_k=5, filter_expr=None):
+    dedup_index = get_dedup_index() if dedup else None
+    inserted = encoded = batches = skipped = 0
+    pending = []
+    pending_rows = []  # dedup index rows of docs not yet inserted, aligned with pending
+    try:
+        for doc_batch in _batched(docs, batch_size):
+            for doc in doc_batch:
+                if 'text' not in doc:
+                    raise ValueError("Document must contain 'text' field for embedding.")
+
+            if dedup_index is not None:
+                kept = []
+                for doc in doc_batch:
+                    row = dedup_index.add_if_new(doc['text'], doc.get('id'), _dedup_namespace(doc))
+                    if row is not None:
+                        kept.append(doc)
+                        pending_rows.append(row)
+                skipped += len(doc_batch) - len(kept)
+                doc_batch = kept
+                if not doc_batch:
+                    continue
+
+            vectors = embed_texts([doc['text'] for doc in doc_batch], normalize=normalize, batch_size=batch_size)
+            encoded += len(doc_batch)
+
+            for doc, vector in zip(doc_batch, vectors):
+                row = {
+                    "text": doc['text'],
+                    "subject": doc.get('subject', 'general'), # Default subject if not provided
+                    "vector": vector.tolist(),
+                }
+                # Any other metadata (source, chunk, ...) is stored as dynamic fields
+                row.update({key: value for key, value in doc.items() if key not in row and key != 'id'})
+                # Only add 'id' if it's explicitly provided and not None, otherwise Milvus auto-generates
+                if doc.get('id') is not None:
+                    row["id"] = doc['id']
+                pending.append(row)
+
+            while len(pending) >= insert_batch_size:
+                chunk, pending = pending[:insert_batch_size], pending[insert_batch_size:]
+                _insert_rows(client, current_collection, chunk)
+                pending_rows = pending_rows[len(chunk):]
+                inserted += len(chunk)
+                batches += 1
+                if progress_callback:
+                    progress_callback(inserted, encoded)
+
+        if pending:
+            _insert_rows(client, current_collection, pending)
+            pending_rows = []
+            inserted += len(pending)
+            batches += 1
+            if progress_callback:
+                progress_callback(inserted, encoded)
+    except Exception:
+        if dedup_index is not None:
+            # Only the docs that never reached the store; inserted batches stay indexed
+            dedup_index.rollback(pending_rows)
+        raise
+    finally:
+        if dedup_index is not None:
+            dedup_index.save()
+    if skipped:
+        logging.info(f"Skipped {skipped} near-duplicate documents.")
+    logging.info(f"Inserted {inserted} documents into Milvus collection '{current_collection}' in {batches} batch(es).")
+    return {"insert_count": inserted, "batches": batches, "skipped": skipped}
+
+def insert_documents(docs, collection_name: str = None, batch_size: int = EMBED_BATCH_SIZE, normalize: bool = False):
+    """
+    Insert documents into Milvus collection.
+    docs: List (or any iterable) of dict where each dict should have keys: 'id' (optional), 'text', 'subject' (optional).
+          Vectors will be generated from 'text' using embed_model, batch_size texts at a time.
+    """
+    return ingest_documents(docs, collection_name=collection_name, batch_size=batch_size, normalize=normalize)
+
+def search_vectors(query_embedding: list, top_k=5, filter_expr=None, partition_names: list = None):
     """
     Search similar vectors.
     query_embedding: a single vector (list of floats) representing the query.
     filter_expr: string filter expression, e.g. "subject == 'history'"
+    partition_names: only search these partitions (see search_partitions())
     """
     global _milvus_client
     if _milvus_client is None:
@@ -145,15 +400,178 @@ def search_vectors(query_embedding: list, top_k=5, filter_expr=None):
         data=[query_embedding], # MilvusClient.search expects a list of query vectors
         filter=filter_expr,
         limit=top_k,
-        output_fields=["text", "subject"]
+        output_fields=["text", "subject"],
+        partition_names=partition_names,
     )
 
+def search_vectors_batch(query_embeddings: list, top_k=5, filter_expr=None, partition_names: list = None) -> list:
+    """
+    Search many query vectors in one round trip.
+    Returns one extract_hits()-style list per query, in query order.
+    """
+    if _milvus_client is None:
+        raise ValueError("Milvus client not initialized")
+    if len(query_embeddings) == 0:
+        return []
+
+    results = _milvus_client.search(
+        collection_name=collection_name,
+        data=[list(vector) for vector in query_embeddings],
+        filter=filter_expr,
+        limit=top_k,
+        output_fields=["text", "subject"],
+        partition_names=partition_names,
+    )
+    return [_query_hits(query_results) for query_results in results]
+
+def search_partitions(subject: str = None, owner_id=None):
+    """
+    Partitions a search by owner_id (None: anonymous) scoped to subject has
+    to scan, or None to scan the whole collection: when it is not
+    partitioned, or for an unscoped search (listing every partition would
+    only cost more than owner_filter() does).
+    """
+    partitions = get_partitions()
+    if partitions is None or subject is None:
+        return None
+    return partitions.for_search(subject, owner_id)
+
+def owner_filter(owner_id=None) -> str:
+    """
+    Filter expression matching shared rows (no owner_id) and owner_id's
+    private ones. `owner_id >= ""` holds for every private row and is false
+    where the field is missing or null.
+    """
+    shared = 'not (owner_id >= "")'
+    return f"(owner_id == {filter_string(owner_id)} or {shared})" if owner_id is not None else shared
+
+def search_filter(subject: str = None, owner_id=None) -> str:
+    """Filter expression for a search by owner_id, optionally scoped to subject."""
+    expr = owner_filter(owner_id)
+    return f"subject == {filter_string(subject)} and {expr}" if subject is not None else expr
+
+def extract_hits(results) -> list:
+    """
+    Flatten the hits for the first query of a search_vectors() result into
+    plain dicts: {'id', 'score', 'text', 'subject'}, best match first.
+    """
+    if not results or not results[0]:
+        return []
+    return _query_hits(results[0])
+
+def _query_hits(query_results) -> list:
+    hits = []
+    for hit in query_results or []:
+        entity = (hit.get("entity") if hasattr(hit, "get") else getattr(hit, "entity", None)) or {}
+        if not entity.get("text"):
+            continue
+        hits.append({
+            "id": hit.get("id") if hasattr(hit, "get") else getattr(hit, "id", None),
+            "score": hit.get("distance") if hasattr(hit, "get") else getattr(hit, "distance", None),
+            "text": entity.get("text", ""),
+            "subject": entity.get("subject"),
+        })
+    return hits
+
+def filter_string(value) -> str:
+    """value as a quoted, escaped string literal for a Milvus filter expression."""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+def hybrid_search(query: str, top_k: int = 5, subject: str = None,
+                  candidates: int = HYBRID_CANDIDATES, rrf_k: int = RRF_K, owner_id=None) -> list:
+    """
+    Vector search and BM25 keyword search run in parallel, each fetching
+    `candidates` hits, fused with reciprocal-rank fusion into the best top_k.
+    Shared documents and owner_id's private ones are searched.
+    Returns extract_hits()-style dicts. Falls back to vector search alone
+    when the BM25 index is not initialized.
+    """
+    keyword_future = _submit_keyword_search(query, max(candidates, top_k), subject, owner_id)
+    filter_expr = search_filter(subject, owner_id)
+    fetch = max(candidates, top_k) if keyword_future is not None else top_k
+    vector_hits = extract_hits(search_vectors(
+        embed_text(query).tolist(),
+        top_k=fetch,
+        filter_expr=filter_expr,
+        partition_names=search_partitions(subject, owner_id),
+    ))
+    return _fuse(vector_hits, keyword_future, top_k, rrf_k)
+
+def hybrid_search_many(queries: list, top_k: int = 5, subject: str = None,
+                       candidates: int = HYBRID_CANDIDATES, rrf_k: int = RRF_K, owner_id=None) -> list:
+    """
+    hybrid_search() for many queries at once: all queries are embedded in one
+    forward pass and searched in one vector-store round trip, while their
+    BM25 searches run on the search pool. Returns one hit list per query.
+    """
+    if not queries:
+        return []
+    keyword_futures = [
+        _submit_keyword_search(query, max(candidates, top_k), subject, owner_id) for query in queries
+    ]
+    filter_expr = search_filter(subject, owner_id)
+    fetch = max(candidates, top_k) if get_bm25_index() is not None else top_k
+    vectors = embed_texts(queries)
+    vector_hits = search_vectors_batch(
+        [vector.tolist() for vector in vectors],
+        top_k=fetch,
+        filter_expr=filter_expr,
+        partition_names=search_partitions(subject, owner_id),
+    )
+    return [_fuse(hits, future, top_k, rrf_k) for hits, future in zip(vector_hits, keyword_futures)]
+
+def _submit_keyword_search(query: str, limit: int, subject: str = None, owner_id=None):
+    bm25_index = get_bm25_index()
+    if bm25_index is None:
+        return None
+    return _search_pool.submit(bm25_index.search, query, limit, subject, owner_id)
+
+def _fuse(vector_hits: list, keyword_future, top_k: int, rrf_k: int) -> list:
+    if keyword_future is None:
+        return vector_hits[:top_k]
+    try:
+        keyword_hits = keyword_future.result()
+    except Exception as e:
+        logging.error(f"BM25 search failed, using vector hits only: {e}")
+        return vector_hits[:top_k]
+    return reciprocal_rank_fusion([vector_hits, keyword_hits], top_k=top_k, k=rrf_k)
+
+def rebuild_bm25_index(collection_name: str = None, page_size: int = 1000) -> int:
+    """Re-index every document in the collection into BM25 (e.g. ones inserted before it existed)."""
+    client = get_milvus_client()
+    bm25_index = get_bm25_index()
+    if bm25_index is None:
+        raise RuntimeError("BM25 index not initialized. Set RAG_HYBRID_ENABLED=true.")
+    current_collection = _collection(collection_name)
+    # query_iterator pages past Milvus' offset + limit cap of 16384 rows
+    iterator = client.query_iterator(
+        collection_name=current_collection,
+        batch_size=page_size,
+        filter="id >= 0",
+        output_fields=["id", "text", "subject", "owner_id"],
+    )
+    indexed = 0
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            bm25_index.add(
+                (row["id"], row.get("text", ""), row.get("subject"), row.get("owner_id")) for row in rows
+            )
+            indexed += len(rows)
+    finally:
+        iterator.close()
+    logging.info(f"Rebuilt BM25 index from {indexed} documents in '{current_collection}'")
+    return indexed
+
 def query_documents(filter_expr: str = None, collection_name: str = None):
     """
     Query documents by filter expression (no vector similarity).
     """
     client = get_milvus_client()
-    current_collection = collection_name if collection_name else client.collection_name # Use passed name or default
+    current_collection = _collection(collection_name) # Use passed name or default
 
     logging.info(f"Querying Milvus collection '{current_collection}' with filter='{filter_expr}'")
     return client.query(
@@ -168,21 +586,36 @@ def delete_documents(filter_expr: str, collection_name: str = None):
     Filter expression is required for safety.
     """
     client = get_milvus_client()
-    current_collection = collection_name if collection_name else client.collection_name # Use passed name or default
+    current_collection = _collection(collection_name) # Use passed name or default
 
     if not filter_expr:
         raise ValueError("A filter expression is required to delete documents for safety.")
         
+    dedup_index = get_dedup_index()
+    bm25_index = get_bm25_index()
+    if dedup_index is not None or bm25_index is not None:
+        rows = client.query(collection_name=current_collection, filter=filter_expr, output_fields=["id"])
+        ids = [row["id"] for row in rows]
+        if dedup_index is not None:
+            # Deleted chunks must not keep suppressing new ones
+            dedup_index.remove_ids(ids)
+            dedup_index.save()
+        if bm25_index is not None:
+            bm25_index.remove(ids)
+
     logging.info(f"Deleting documents from Milvus collection '{current_collection}' with filter='{filter_expr}'")
     return client.delete(
         collection_name=current_collection,
         filter=filter_expr,
     )
 
-def get_rag_context(query: str, top_k: int = 5) -> str:
+def get_rag_context(query: str, top_k: int = 5, subject: str = None, owner_id=None) -> str:
     """
-    Generates a RAG context string from the Milvus vector database based on a query.
+    Generates a RAG context string for a query: hybrid (vector + BM25)
+    retrieval, reranked by the cross-encoder when one is loaded.
+    owner_id's private documents are included alongside the shared ones.
     """
+    from app.rag.retriever import retrieve
     if embed_model is None:
         raise RuntimeError("Embedding model is not initialized. Call init_embed_model() first.")
     
@@ -193,22 +626,31 @@ def get_rag_context(query: str, top_k: int = 5) -> str:
         logging.error(f"Milvus client not initialized for RAG context: {e}")
         raise
 
-    embedding = embed_model.encode(query).tolist()
-    results = search_vectors(embedding, top_k=top_k)
-
-    if not results or len(results) == 0 or not results[0]:
+    contexts = [hit["text"] for hit in retrieve(query, top_k=top_k, subject=subject, owner_id=owner_id)]
+    if not contexts:
         logging.warning(f"No relevant context found for query: '{query}'")
         return ""
 
-    # Each 'result' is a list of hits for one query (since we pass data=[query_embedding])
-    # Each 'hit' in results[0] has an 'entity' attribute (dict)
-    contexts = [
-        hit.entity.get('text', '') 
-        for hit in results[0] 
-        if hit.entity and 'text' in hit.entity
-    ]
-    
     # Concatenate contexts, using double newline for better readability
     logging.info(f"Found {len(contexts)} contexts for query: '{query}'")
     return "\n\n".join(contexts)
 
+def get_rag_context_many(queries: list, top_k: int = 5, subject: str = None, owner_id=None) -> list:
+    """
+    get_rag_context() for many queries: one embedding pass and one vector
+    search round trip for all of them, then the same reranking as
+    get_rag_context() (see app.rag.retriever.retrieve_many()).
+    Returns one context string per query, in query order.
+    """
+    from app.rag.retriever import retrieve_many
+    if embed_model is None:
+        raise RuntimeError("Embedding model is not initialized. Call init_embed_model() first.")
+    get_milvus_client()
+
+    unique = list(dict.fromkeys(queries))
+    contexts = {
+        query: "\n\n".join(hit["text"] for hit in hits)
+        for query, hits in zip(unique, retrieve_many(unique, top_k=top_k, subject=subject, owner_id=owner_id))
+    }
+    logging.info(f"Retrieved contexts for {len(unique)} distinct queries in one batch")
+    return [contexts[query] for query in queries]
@@ -28,4 +28,38 @@ def version():
         "service": "UltraLearning API",
         "version": "1.0.0",
         "environment": os.getenv('FLASK_ENV', 'production')
-    })
\ No newline at end of file
+    })
+
+@health_bp.route('/metrics/llm', methods=['GET'])
+def llm_metrics():
+    """LLM scheduler queue depth, wait-time, admission, model residency and query log metrics"""
+    from app.llm.model import llm_stats
+    from app.llm.log_writer import log_writer_stats
+    return jsonify({**llm_stats(), "query_log": log_writer_stats()})
+
+@health_bp.route('/metrics/embeddings', methods=['GET'])
+def embedding_metrics():
+    """Embedding cache, micro-batching, ingest dedup and retrieval index metrics"""
+    from app.rag.embedding_cache import get_embedding_cache
+    from app.rag.embed_batcher import get_embed_batcher
+    from app.rag.dedup import get_dedup_index
+    from app.rag.bm25 import get_bm25_index
+    from app.rag.reranker import get_reranker
+    from app.rag.partitions import get_partitions
+    from app.rag.vector_store import NumpyVectorStore
+    from app import extensions
+    cache = get_embedding_cache()
+    batcher = get_embed_batcher()
+    dedup_index = get_dedup_index()
+    bm25_index = get_bm25_index()
+    reranker = get_reranker()
+    partitions = get_partitions()
+    return jsonify({
+        "cache": cache.stats() if cache is not None else None,
+        "batcher": batcher.stats() if batcher is not None else None,
+        "dedup": dedup_index.stats() if dedup_index is not None else None,
+        "bm25": bm25_index.stats() if bm25_index is not None else None,
+        "reranker": reranker.stats() if reranker is not None else None,
+        "vector_store": extensions._milvus_client.stats() if isinstance(extensions._milvus_client, NumpyVectorStore) else None,
+        "partitions": partitions.stats() if partitions is not None else None,
+    })
@@ -1,16 +1,32 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
-from app.extensions import db, init_embed_model, search_vectors, embed_model
+from app.extensions import db, init_embed_model, search_vectors, embed_model, get_rag_context_many
 from datetime import datetime
 from flask import current_app
 import os
 from .models import Flashcard, FlashcardPack, StudySession
 from .schemas import FlashcardSchema, FlashcardPackSchema, FlashcardPackSummarySchema
 from app.chat.agents.agents import AGENTS
+from app.llm.model import check_admission, rejection_response
+from app.llm.scheduler import AdmissionRejected
+from app.rag.ingest import (
+    TEXT_EXTENSIONS,
+    chunk_text,
+    ingest_options,
+    ingest_stream,
+    read_stream,
+    read_text,
+    spread_sections,
+)
 
 learning_bp = Blueprint('learning', __name__)
 
+# Card generation for the document method is spread over at most this many sections
+MAX_DOCUMENT_SECTIONS = 5
+# Retrieved chunks given as reference for each generated textarea line
+TEXTAREA_CONTEXT_TOP_K = 3
+
 # Schema instances
 flashcard_schema = FlashcardSchema()
 flashcards_schema = FlashcardSchema(many=True)
@@ -125,6 +141,14 @@ def generate_flashcards():
         return jsonify({'error': 'Flashcard generation agent not available'}), 500
     
     flashcard_agent = AGENTS['flashcard']
+    # Document and textarea extraction are bulk work and must not starve interactive chat
+    priority = 'interactive' if method == 'topic' else 'bulk'
+    if method in ('topic', 'document', 'textarea'):
+        try:
+            check_admission(priority)
+        except AdmissionRejected as e:
+            current_app.logger.warning(f"Flashcard generation rejected: {e}")
+            return rejection_response(e)
     
     if method == 'textarea':
         content = data.get('content')
@@ -132,20 +156,29 @@ def generate_flashcards():
             return jsonify({'error': 'Content is required for textarea method'}), 400
         
         # Parse lines: "Question | Answer" or generate from content
-        for line in content.strip().split('\n'):
-            line = line.strip()
-            if not line:
-                continue
+        lines = [line.strip() for line in content.strip().split('\n') if line.strip()]
+        # Optionally retrieve reference material for every line to generate from in one batch
+        prompts = [line for line in lines if '|' not in line]
+        contexts = {}
+        if prompts and current_app.config.get('FLASHCARD_TEXTAREA_RAG', False):
+            try:
+                contexts = dict(zip(prompts, get_rag_context_many(prompts, top_k=TEXTAREA_CONTEXT_TOP_K, owner_id=user_id)))
+            except Exception as e:
+                current_app.logger.warning(f"Batch RAG retrieval for textarea lines failed: {e}")
+
+        for line in lines:
             if '|' in line:
                 q, a = line.split('|', 1)
                 cards.append(Flashcard(question=q.strip(), answer=a.strip(), owner_id=user_id, pack_id=pack_id))
             else:
                 # Generate Q&A from content line
                 try:
-                    raw_cards = flashcard_agent.generate(f"Create a flashcard about: {line}", 1)
+                    raw_cards = flashcard_agent.generate(f"Create a flashcard about: {line}", 1, priority=priority, context=contexts.get(line) or None)
                     for c in raw_cards:
                         if isinstance(c, dict) and c.get('question') and c.get('answer'):
                             cards.append(Flashcard(question=c.get('question', ''), answer=c.get('answer', ''), owner_id=user_id, pack_id=pack_id))
+                except AdmissionRejected as e:
+                    return rejection_response(e)
                 except Exception as e:
                     current_app.logger.error(f"Flashcard generation error for line '{line}': {e}")
                     continue
@@ -174,6 +207,8 @@ def generate_flashcards():
                 else:
                     current_app.logger.warning(f"Invalid card format: {c}")
                     
+        except AdmissionRejected as e:
+            return rejection_response(e)
         except Exception as e:
             current_app.logger.error(f"Flashcard generation error for topic '{topic}': {e}", exc_info=True)
             # Create fallback cards even on error
@@ -189,18 +224,39 @@ def generate_flashcards():
         if not document_text:
             return jsonify({'error': 'document_text is required for document method'}), 400
         
-        # Try RAG if embedding model is available, otherwise use direct generation
+        num_cards = data.get('num_cards', 5)
         try:
-            # Fallback to direct generation without RAG for now
-            combined_content = document_text[:2000]  # Limit content length
-            
-            # Generate flashcards from content
-            raw_cards = flashcard_agent.generate(f"Create flashcards from this content: {combined_content}", data.get('num_cards', 5))
-            
-            for c in raw_cards:
-                if isinstance(c, dict) and c.get('question') and c.get('answer'):
-                    cards.append(Flashcard(question=c.get('question', ''), answer=c.get('answer', ''), owner_id=user_id, pack_id=pack_id))
+            options = ingest_options(current_app.config)
+            if data.get('index_document'):
+                # Also make the document searchable for chat RAG; only for its owner
+                # unless it is explicitly shared
+                ingest_stream(
+                    read_text(document_text),
+                    subject=data.get('subject') or pack.title,
+                    source=data.get('source') or f"pack-{pack_id}",
+                    owner_id=user_id if data.get('private', True) else None,
+                    uploader_id=user_id,
+                    **options,
+                )
+
+            # Spread generation over the whole document instead of only its beginning
+            chunks = chunk_text(document_text, options['chunk_tokens'], options['overlap_tokens'])
+            sections = spread_sections(chunks, min(MAX_DOCUMENT_SECTIONS, num_cards))
+            current_app.logger.info(f"Document split into {len(chunks)} chunks; generating from {len(sections)} sections")
+            for i, section in enumerate(sections):
+                section_cards = num_cards // len(sections) + (1 if i < num_cards % len(sections) else 0)
+                raw_cards = flashcard_agent.generate(
+                    f"Create flashcards from this content: {section}",
+                    section_cards,
+                    priority=priority,
+                )
+                for c in raw_cards:
+                    if isinstance(c, dict) and c.get('question') and c.get('answer'):
+                        cards.append(Flashcard(question=c.get('question', ''), answer=c.get('answer', ''), owner_id=user_id, pack_id=pack_id))
                 
+        except AdmissionRejected as e:
+            current_app.logger.warning(f"Document flashcard generation rejected: {e}")
+            return rejection_response(e)
         except Exception as e:
             current_app.logger.error(f"Document processing error: {e}")
             return jsonify({'error': f'Failed to process document: {str(e)}'}), 500
@@ -219,6 +275,60 @@ def generate_flashcards():
         'flashcards': flashcards_schema.dump(cards)
     })
 
+@learning_bp.route('/documents/ingest', methods=['POST'])
+@jwt_required()
+def ingest_document():
+    """
+    Chunk, embed and index documents for RAG.
+    multipart/form-data: one or more 'files' (.txt/.md), streamed; optional 'subject', 'private'
+    JSON: {'text', 'subject', 'source', 'private'}
+    Private documents are only retrieved for the user who uploaded them.
+    """
+    options = ingest_options(current_app.config)
+    data = {} if request.files else (request.json or {})
+    private = request.form.get('private', 'false').lower() == 'true' if request.files else bool(data.get('private'))
+    owner_id = get_jwt_identity() if private else None
+    results = []
+    try:
+        if request.files:
+            subject = request.form.get('subject', 'general')
+            for upload in request.files.getlist('files'):
+                filename = secure_filename(upload.filename or '')
+                if not filename.lower().endswith(TEXT_EXTENSIONS):
+                    return jsonify({'error': f'Unsupported file type: {filename or "unnamed"}. Use {", ".join(TEXT_EXTENSIONS)}'}), 400
+                results.append(ingest_stream(
+                    read_stream(upload.stream),
+                    subject=subject,
+                    source=filename,
+                    owner_id=owner_id,
+                    uploader_id=get_jwt_identity(),
+                    **options,
+                ))
+        else:
+            text = data.get('text')
+            if not text:
+                return jsonify({'error': 'files or text is required'}), 400
+            results.append(ingest_stream(
+                read_text(text),
+                subject=data.get('subject', 'general'),
+                source=data.get('source') or f"user-{get_jwt_identity()}-{datetime.utcnow():%Y%m%d%H%M%S}",
+                owner_id=owner_id,
+                uploader_id=get_jwt_identity(),
+                **options,
+            ))
+    except (RuntimeError, ValueError) as e:
+        current_app.logger.error(f"Document ingestion unavailable: {e}")
+        return jsonify({'error': f'Document ingestion unavailable: {str(e)}'}), 503
+    except Exception as e:
+        current_app.logger.error(f"Document ingestion failed: {e}", exc_info=True)
+        return jsonify({'error': f'Failed to ingest documents: {str(e)}'}), 500
+
+    return jsonify({
+        'documents': results,
+        'total_chunks': sum(r['chunks'] for r in results),
+        'skipped_duplicates': sum(r['skipped'] for r in results),
+    }), 201
+
 # Study Session Routes
 @learning_bp.route('/sessions', methods=['POST'])
 @jwt_required()
@@ -0,0 +1,139 @@
+"""
+Token-budgeted prompt context packing.
+
+The budget is the model context (LLAMA_N_CTX) minus the tokens reserved for
+the reply, the system prompt, the question and the chat template. Retrieved
+documents are packed best-first and conversation history newest-first, each
+against its share of the budget; whatever one side leaves unused goes to
+the other. Token counts come from the model's own tokenizer.
+"""
+from flask import current_app
+from app.extensions import init_llama_tokenizer
+import logging
+
+# Chat template, "Context:/Question:" framing and section headers
+TEMPLATE_OVERHEAD_TOKENS = 64
+# Don't bother keeping a truncated document shorter than this
+MIN_DOCUMENT_TOKENS = 32
+
+_fallback_counters = {}  # model path -> estimating TokenCounter once its tokenizer failed to load
+
+
+class TokenCounter:
+    """Counts and truncates text with the Llama tokenizer, or a chars/4 estimate."""
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+
+    def encode(self, text: str) -> list:
+        return self.tokenizer.tokenize(text.encode("utf-8"), add_bos=False)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return len(text) // 4 + 1
+        return len(self.encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self.tokenizer is None:
+            return text[:max_tokens * 4]
+        tokens = self.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.tokenizer.detokenize(tokens[:max_tokens]).decode("utf-8", errors="ignore")
+
+
+def get_token_counter() -> TokenCounter:
+    """Counter for the configured model; an estimating one, remembered per path, if its tokenizer fails to load."""
+    model_path = current_app.config.get("LLAMA_MODEL_PATH")
+    fallback = _fallback_counters.get(model_path)
+    if fallback is not None:
+        return fallback
+    try:
+        return TokenCounter(init_llama_tokenizer(model_path))
+    except Exception as e:
+        logging.warning(f"Falling back to estimated token counts for {model_path}: {e}")
+        fallback = _fallback_counters[model_path] = TokenCounter()
+        return fallback
+
+
+def pack_context(
+    query: str,
+    history: list,
+    documents: list,
+    system_prompt: str = "",
+    max_tokens: int = 512,
+    n_ctx: int = 4096,
+    document_share: float = 0.6,
+    counter: TokenCounter = None,
+) -> dict:
+    """
+    Fit conversation history and retrieved documents into the prompt budget.
+
+    history: [(role, content)] oldest first.
+    documents: [{'text', 'score', ...}] most relevant first.
+    Returns the packed context strings plus a token usage report.
+    """
+    counter = counter or get_token_counter()
+    system_tokens = counter.count(system_prompt)
+    query_tokens = counter.count(query)
+    budget = max(0, n_ctx - max_tokens - system_tokens - query_tokens - TEMPLATE_OVERHEAD_TOKENS)
+
+    # Each document/message is counted once and the counts reused below
+    doc_costs = [(doc, counter.count(doc["text"])) for doc in documents]
+    history_costs = [(role, content, counter.count(f"{role}: {content}")) for role, content in history]
+
+    doc_budget = int(budget * document_share)
+    history_need = sum(cost for _, _, cost in history_costs)
+    # Give documents whatever history does not need, and vice versa
+    doc_budget = max(doc_budget, budget - history_need)
+
+    packed_docs, doc_tokens = [], 0
+    for doc, cost in doc_costs:
+        remaining = doc_budget - doc_tokens
+        if cost <= remaining:
+            packed_docs.append(doc["text"])
+            doc_tokens += cost
+        elif remaining >= MIN_DOCUMENT_TOKENS:
+            packed_docs.append(counter.truncate(doc["text"], remaining))
+            doc_tokens += remaining
+            break
+        else:
+            break
+
+    history_budget = budget - doc_tokens
+    packed_history, history_tokens = [], 0
+    for role, content, cost in reversed(history_costs):
+        if history_tokens + cost > history_budget:
+            break
+        packed_history.append(f"{role}: {content}")
+        history_tokens += cost
+    packed_history.reverse()
+
+    history_text = "\n".join(packed_history)
+    documents_text = "\n\n".join(packed_docs)
+    sections = []
+    if history_text:
+        sections.append(f"Conversation so far:\n{history_text}")
+    sections.append(f"Relevant Documents:\n{documents_text or 'No additional context available.'}")
+
+    return {
+        "context": "\n\n".join(sections),
+        "history_text": history_text,
+        "documents_text": documents_text,
+        "tokens": {
+            "budget": budget,
+            "system": system_tokens,
+            "query": query_tokens,
+            "history": history_tokens,
+            "documents": doc_tokens,
+            "total": system_tokens + query_tokens + history_tokens + doc_tokens + TEMPLATE_OVERHEAD_TOKENS,
+        },
+        "dropped": {
+            "history": len(history_costs) - len(packed_history),
+            "documents": len(doc_costs) - len(packed_docs),
+        },
+    }
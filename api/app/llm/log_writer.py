@@ -0,0 +1,150 @@
+"""
+Write-behind sink for LLMQueryLog rows.
+
+process_llm_query hands records to a bounded in-memory queue and returns
+immediately; a background thread bulk-inserts them in batches when either the
+batch fills up or the flush interval passes. When the queue runs hot, records
+are sampled, and when it is full they are dropped rather than blocking
+inference. Pending records are flushed on interpreter shutdown.
+
+Counters are updated from request threads (submit) and the writer thread
+(_write), so they are guarded by their own lock.
+"""
+from flask import current_app
+from app.extensions import db
+from app.llm.models import LLMQueryLog
+import atexit
+import logging
+import queue
+import random
+import threading
+import time
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class QueryLogWriter:
+    def __init__(self, app, max_queue: int = 1000, batch_size: int = 50, flush_interval: float = 2.0,
+                 high_water: float = 0.8, sample_rate: float = 0.1):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.high_water = int(max_queue * high_water)
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._flush_requested = threading.Event()
+        self._thread = None
+        self._io_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="llm-log-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: dict) -> bool:
+        """Queue a record without blocking; returns False if it was dropped."""
+        if self._queue.qsize() >= self.high_water and random.random() >= self.sample_rate:
+            self._count("sampled_out")
+            return False
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self._count("dropped")
+            return False
+
+    def flush(self):
+        """Synchronously write everything currently queued."""
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def shutdown(self, timeout: float = 5.0):
+        self._stop.set()
+        self._flush_requested.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "sampled_out": self.sampled_out,
+                "failed": self.failed,
+            }
+
+    def _count(self, counter: str, n: int = 1):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _run(self):
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            while len(batch) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+
+    def _drain(self, limit: int) -> list:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list):
+        with self._io_lock, self.app.app_context():
+            try:
+                db.session.bulk_insert_mappings(LLMQueryLog, batch)
+                db.session.commit()
+                self._count("written", len(batch))
+            except Exception as e:
+                db.session.rollback()
+                self._count("failed", len(batch))
+                logging.error(f"Failed to write {len(batch)} LLM query logs: {e}")
+            finally:
+                db.session.remove()
+
+
+def log_writer_stats():
+    """Counters of the running writer, or None before anything has been logged."""
+    return _writer.stats() if _writer is not None else None
+
+
+def get_log_writer() -> QueryLogWriter:
+    """Return the app's query log writer, starting it on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                config = current_app.config
+                _writer = QueryLogWriter(
+                    current_app._get_current_object(),
+                    max_queue=config.get("LLM_LOG_QUEUE_SIZE", 1000),
+                    batch_size=config.get("LLM_LOG_BATCH_SIZE", 50),
+                    flush_interval=config.get("LLM_LOG_FLUSH_INTERVAL", 2.0),
+                    sample_rate=config.get("LLM_LOG_SAMPLE_RATE", 0.1),
+                )
+                _writer.start()
+                atexit.register(_writer.shutdown)
+    return _writer
@@ -1,35 +1,246 @@
-from app.extensions import init_llama_model
-from flask import current_app
+from flask import current_app, jsonify
+from app.extensions import load_llama_model
+from app.llm.registry import ModelRegistry
+from app.llm.scheduler import InferenceScheduler, AdmissionRejected, DEFAULT_PRIORITY
+from app.llm.prefix_cache import attach_prefix_cache, warm_prefix_cache, registered_prefixes
+from app.llm.worker_pool import LlamaWorkerPool
+from app.llm.runtime_profile import RUNTIME_KEYS, llama_runtime_kwargs
+from app.llm.speculative import draft_spec_from_config
+import threading
+import atexit
+import logging
 
-_llm_instance = None  # singleton
+_llm_lock = threading.Lock()
+_registry = None
+_schedulers = {}
 
-def get_llm():
-    global _llm_instance
-    if _llm_instance is None:
-        # Access MODEL_PATH from current Flask app config inside app context
-        model_path = current_app.config.get("LLAMA_MODEL_PATH")
+def model_specs(config) -> dict:
+    """Named models from LLM_MODELS; the default model falls back to LLAMA_MODEL_PATH."""
+    specs = {name: dict(spec) for name, spec in (config.get("LLM_MODELS") or {}).items()}
+    default = config.get("LLM_DEFAULT_MODEL", "chat")
+    specs.setdefault(default, {})
+    specs[default].setdefault("path", config.get("LLAMA_MODEL_PATH"))
+    # Models that draft with a small GGUF model also pay for its weights
+    draft = draft_spec_from_config(config)
+    if draft["mode"] == "model" and draft["model_path"]:
+        for name, spec in specs.items():
+            if spec.get("speculative", name == default):
+                spec.setdefault("draft_path", draft["model_path"])
+    # Every llama.cpp context (one per instance, or per process of a worker pool) has its own
+    # KV cache, plus its prefix cache when that is enabled
+    prefix_cache_bytes = config.get("LLAMA_PREFIX_CACHE_BYTES", 0)
+    for spec in specs.values():
+        processes = max(1, spec.get("worker_pool_size", config.get("LLM_WORKER_POOL_SIZE", 0)))
+        context_mb = spec.get("context_mb", config.get("LLM_CONTEXT_MB", 512))
+        spec.setdefault("context_bytes", ((int(context_mb) << 20) + prefix_cache_bytes) * processes)
+    return specs
+
+
+def _model_loader(config):
+    """Build the registry's loader; it runs on slot threads, so config is captured here."""
+    default = config.get("LLM_DEFAULT_MODEL", "chat")
+    cache_bytes = config.get("LLAMA_PREFIX_CACHE_BYTES", 0)
+    warm_cache = config.get("LLAMA_PREFIX_CACHE_WARM", True)
+
+    def load(name, spec, instance):
+        model_path = spec.get("path")
         if not model_path:
-            raise RuntimeError("LLAMA_MODEL_PATH not configured in Flask config.")
-        _llm_instance = init_llama_model(model_path)
-    return _llm_instance
+            raise RuntimeError(f"No GGUF path configured for model '{name}'.")
+        runtime_kwargs = llama_runtime_kwargs(config, model_path)
+        runtime_kwargs.update({arg: spec[arg] for arg in RUNTIME_KEYS.values() if arg in spec})
+        if spec.get("speculative", name == default):
+            runtime_kwargs["draft"] = draft_spec_from_config(config)
 
-def generate_response(
+        pool_size = spec.get("worker_pool_size", config.get("LLM_WORKER_POOL_SIZE", 0))
+        if pool_size:
+            pool = LlamaWorkerPool(
+                {"model_path": model_path, **runtime_kwargs},
+                size=pool_size,
+                cache_bytes=cache_bytes,
+                prefixes=registered_prefixes() if warm_cache else [],
+                health_interval=config.get("LLM_WORKER_HEALTH_INTERVAL", 10.0),
+                request_timeout=config.get("LLM_WORKER_REQUEST_TIMEOUT", 0.0),
+            )
+            pool.start()
+            return pool
+
+        model = load_llama_model(model_path, **runtime_kwargs)
+        if cache_bytes and model.cache is None:
+            attach_prefix_cache(model, cache_bytes)
+            if warm_cache:
+                warm_prefix_cache(model)
+        return model
+
+    return load
+
+
+def get_model_registry() -> ModelRegistry:
+    """Returns the process-wide model registry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        with _llm_lock:
+            if _registry is None:
+                config = current_app.config
+                _registry = ModelRegistry(
+                    model_specs(config),
+                    _model_loader(config),
+                    ram_budget_bytes=config.get("LLM_RAM_BUDGET_MB", 0) << 20,
+                    idle_timeout=config.get("LLM_MODEL_IDLE_TIMEOUT", 0),
+                )
+                _registry.start_janitor()
+                atexit.register(_registry.shutdown)
+    return _registry
+
+
+def resolve_model_name(model_name=None) -> str:
+    return model_name or current_app.config.get("LLM_DEFAULT_MODEL", "chat")
+
+
+def get_scheduler(model_name=None):
+    """
+    Returns the inference scheduler for a named model, creating it on first use.
+
+    Slots lease their model from the registry for each request, so the
+    registry can unload it while it is idle. In-process, each slot leases
+    its own instance (LLM_SCHEDULER_SLOTS for the default model, or the
+    spec's "slots") with its own prefix KV cache when
+    LLAMA_PREFIX_CACHE_BYTES is non-zero. With a worker pool
+    (LLM_WORKER_POOL_SIZE > 0 or the spec's "worker_pool_size") the model
+    lives in worker processes and every slot leases the shared pool.
+    """
+    name = resolve_model_name(model_name)
+    scheduler = _schedulers.get(name)
+    if scheduler is None:
+        registry = get_model_registry()
+        spec = registry.spec(name)
+        with _llm_lock:
+            scheduler = _schedulers.get(name)
+            if scheduler is None:
+                config = current_app.config
+                pool_size = spec.get("worker_pool_size", config.get("LLM_WORKER_POOL_SIZE", 0))
+                if pool_size:
+                    num_slots = pool_size
+                    instance_for = lambda slot_index: 0
+                else:
+                    default_slots = config.get("LLM_SCHEDULER_SLOTS", 1) if name == config.get("LLM_DEFAULT_MODEL", "chat") else 1
+                    num_slots = spec.get("slots", default_slots)
+                    instance_for = lambda slot_index: slot_index
+
+                scheduler = InferenceScheduler(
+                    lambda slot_index: registry.acquire(name, instance_for(slot_index)),
+                    num_slots=num_slots,
+                    single_flight=config.get("LLM_SINGLE_FLIGHT", True),
+                    max_depth={
+                        "interactive": config.get("LLM_QUEUE_MAX_DEPTH_INTERACTIVE", 32),
+                        "bulk": config.get("LLM_QUEUE_MAX_DEPTH_BULK", 8),
+                    },
+                    deadlines={
+                        "interactive": config.get("LLM_QUEUE_DEADLINE_INTERACTIVE", 30.0),
+                        "bulk": config.get("LLM_QUEUE_DEADLINE_BULK", 300.0),
+                    },
+                    reserved_slots=config.get("LLM_RESERVED_INTERACTIVE_SLOTS", 0),
+                    model_release=lambda slot_index: registry.release(name, instance_for(slot_index)),
+                    request_timeout=config.get("LLM_REQUEST_TIMEOUT", 0.0),
+                )
+                scheduler.start()
+                atexit.register(scheduler.shutdown)
+                _schedulers[name] = scheduler
+    return scheduler
+
+
+def llm_stats() -> dict:
+    """Scheduler metrics per model plus model residency."""
+    return {
+        "default_model": resolve_model_name(),
+        "schedulers": {name: scheduler.stats() for name, scheduler in list(_schedulers.items())},
+        # Reporting must not load the registry; before first use nothing is resident
+        "models": _registry.stats() if _registry is not None else {"configured": [], "resident": {}, "loading": []},
+    }
+
+
+def check_admission(priority=DEFAULT_PRIORITY, model_name=None):
+    """Fail fast with AdmissionRejected when the priority class is saturated."""
+    get_scheduler(model_name).check_admission(priority)
+
+
+def rejection_response(error: AdmissionRejected):
+    """429/503 response with Retry-After for a request the scheduler refused."""
+    response = jsonify({
+        "error": "The assistant is busy, please retry shortly.",
+        "reason": str(error),
+        "priority": error.priority,
+        "retry_after": error.retry_after,
+    })
+    response.status_code = error.status
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def submit_request(
     messages: list,
     max_tokens=512,
     temperature=0.7,
     top_p=0.9,
     stop_tokens=None,
+    stream=False,
+    response_format=None,
+    priority=DEFAULT_PRIORITY,
+    model_name=None
 ):
-    model = get_llm()
-    stop_tokens = stop_tokens or []
+    """
+    Queues a chat completion on the scheduler and returns its InferenceRequest
+    without waiting, so callers can use it as a future or a token stream.
+    response_format={"type": "json_object", "schema": {...}} constrains
+    decoding with a grammar compiled from the JSON schema.
+    priority is "interactive" or "bulk"; raises AdmissionRejected when that
+    class is saturated. model_name picks a model from LLM_MODELS
+    (default: LLM_DEFAULT_MODEL).
+    """
+    logging.info(f"Calling LLM with messages: {messages}")
+    params = dict(
+        max_tokens=max_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stop=stop_tokens or [],
+    )
+    if response_format is not None:
+        params["response_format"] = response_format
+    return get_scheduler(model_name).submit(messages, stream=stream, priority=priority, **params)
+
 
-    response = model.create_chat_completion(
-        messages=messages,
+def generate_response(
+    messages: list,
+    max_tokens=512,
+    temperature=0.7,
+    top_p=0.9,
+    stop_tokens=None,
+    stream=False,
+    timeout=None,
+    response_format=None,
+    priority=DEFAULT_PRIORITY,
+    model_name=None
+):
+    """
+    Runs a chat completion through the scheduler.
+    With stream=True returns an iterator of content pieces, otherwise the full text;
+    raises RuntimeError when the model gives back no content.
+    """
+    request = submit_request(
+        messages,
         max_tokens=max_tokens,
         temperature=temperature,
         top_p=top_p,
-        stop=stop_tokens,
+        stop_tokens=stop_tokens,
+        stream=stream,
+        response_format=response_format,
+        priority=priority,
+        model_name=model_name,
     )
+
+    if stream:
+        return request.tokens()
+
+    response = request.result(timeout=timeout)
     choices = response.get("choices")
     if not choices or len(choices) == 0:
         raise RuntimeError("LLM returned no choices in response")
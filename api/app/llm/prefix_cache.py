@@ -0,0 +1,56 @@
+"""
+Prompt-prefix KV state cache for the Llama slots.
+
+Each slot gets a llama.cpp LlamaRAMCache: after every completion the model
+state is snapshotted under its token sequence, and before the next one the
+snapshot sharing the longest token prefix with the new prompt is restored,
+so only the tokens after that prefix are evaluated. Eviction is LRU, bounded
+by the byte capacity of the stored states.
+
+Agent system prompts are registered here at construction time and evaluated
+once when a slot loads its model, so the first user turn for every agent
+already starts from a cached prefix.
+"""
+from llama_cpp import LlamaRAMCache
+import logging
+import time
+
+_registered_prefixes = []
+
+
+def register_prefix(system_prompt: str):
+    """Register a fixed system prompt whose KV state should be kept warm."""
+    if system_prompt and system_prompt not in _registered_prefixes:
+        _registered_prefixes.append(system_prompt)
+
+
+def registered_prefixes() -> list:
+    return list(_registered_prefixes)
+
+
+def attach_prefix_cache(model, capacity_bytes: int):
+    """Attach an LRU state cache bounded by capacity_bytes to a Llama instance."""
+    cache = LlamaRAMCache(capacity_bytes=capacity_bytes)
+    model.set_cache(cache)
+    logging.info(f"Prefix KV cache attached ({capacity_bytes // (1 << 20)} MiB)")
+    return cache
+
+
+def warm_prefix_cache(model, prefixes: list = None):
+    """
+    Evaluate each registered system prompt once so its state lands in the cache.
+    The empty user turn keeps the cached token sequence a prefix of real prompts.
+    """
+    for system_prompt in prefixes if prefixes is not None else registered_prefixes():
+        start = time.perf_counter()
+        try:
+            model.create_chat_completion(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": ""},
+                ],
+                max_tokens=1,
+            )
+            logging.info(f"Warmed prefix cache for system prompt in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logging.warning(f"Failed to warm prefix cache: {e}")
@@ -0,0 +1,266 @@
+"""
+Registry of named Llama models.
+
+Models are declared in config (LLM_MODELS) by name, e.g. a large chat model,
+a small classifier/draft model and alternate quantizations of either. They
+are loaded on first use and leased to scheduler slots per request. To stay
+under the RAM budget, the least recently used models with no active lease
+are unloaded before a new one is loaded, and a janitor thread unloads
+models that have been idle longer than the idle timeout.
+
+RAM is counted in two parts. The weights are the GGUF file size plus the
+draft model's file (draft_path) when it drafts with one, or the spec's
+explicit ram_mb; they are mmapped and shared by every instance of the same
+file, so they count once per path. Each instance adds its own context_bytes
+(the KV cache and compute buffers of its llama.cpp context, times the
+worker processes of a pool). Loads in progress count against the budget,
+and models are closed outside the registry lock so other leases never wait
+on an unload.
+"""
+from collections import OrderedDict
+import gc
+import logging
+import os
+import threading
+import time
+
+
+class ModelNotFound(KeyError):
+    pass
+
+
+class _Resident:
+    """A loaded model instance and its lease bookkeeping."""
+
+    def __init__(self, model, cost: tuple):
+        self.model = model
+        self.cost = cost  # (weights key, weights bytes, context bytes)
+        self.leases = 0
+        self.loaded_at = time.monotonic()
+        self.last_used = self.loaded_at
+        self.uses = 0
+
+
+class ModelRegistry:
+    """
+    specs: {name: {"path": str, "ram_mb": int, "context_bytes": int, ...runtime overrides}}
+    loader(name, spec, instance) builds a model. Unloading calls its close()
+    (Llama) or shutdown() (LlamaWorkerPool).
+    Each (name, instance) pair is a separate resident model, so scheduler
+    slots that need their own llama.cpp context lease distinct instances.
+    """
+
+    def __init__(self, specs: dict, loader, ram_budget_bytes: int = 0, idle_timeout: float = 0.0):
+        self.specs = specs
+        self._loader = loader
+        self.ram_budget_bytes = ram_budget_bytes
+        self.idle_timeout = idle_timeout
+        self._resident = OrderedDict()  # (name, instance) -> _Resident, least recently used first
+        self._loading = {}  # (name, instance) -> Event set when the load finishes
+        self._loading_cost = {}  # (name, instance) -> RAM cost of a load in progress
+        self._lock = threading.Condition()
+        self._janitor = None
+        self._stop = threading.Event()
+        self.loads = 0
+        self.evictions = 0
+        self.idle_unloads = 0
+
+    def names(self) -> list:
+        return list(self.specs)
+
+    def spec(self, name: str) -> dict:
+        if name not in self.specs:
+            raise ModelNotFound(f"Unknown model '{name}'. Configured models: {', '.join(self.specs)}")
+        return self.specs[name]
+
+    def acquire(self, name: str, instance: int = 0):
+        """Lease a model, loading it (and evicting others) if needed."""
+        spec = self.spec(name)
+        key = (name, instance)
+        while True:
+            with self._lock:
+                resident = self._resident.get(key)
+                if resident is not None:
+                    resident.leases += 1
+                    resident.uses += 1
+                    resident.last_used = time.monotonic()
+                    self._resident.move_to_end(key)
+                    return resident.model
+                loading = self._loading.get(key)
+                if loading is None:
+                    cost = self._ram_cost(name, spec)
+                    evicted = self._make_room(cost)
+                    loading = self._loading[key] = threading.Event()
+                    self._loading_cost[key] = cost
+                    break
+            # Another thread is loading this instance; wait and retry
+            loading.wait()
+
+        for evicted_key, resident in evicted:
+            self._close(evicted_key, resident)
+        try:
+            logging.info(f"Loading model '{name}' (instance {instance}) from {spec.get('path')}")
+            model = self._loader(name, spec, instance)
+        except Exception:
+            with self._lock:
+                del self._loading[key]
+                del self._loading_cost[key]
+                self._lock.notify_all()
+            loading.set()
+            raise
+        with self._lock:
+            resident = _Resident(model, cost)
+            resident.leases = 1
+            resident.uses = 1
+            self._resident[key] = resident
+            del self._loading[key]
+            del self._loading_cost[key]
+            self.loads += 1
+            self._lock.notify_all()
+        loading.set()
+        return model
+
+    def release(self, name: str, instance: int = 0):
+        with self._lock:
+            resident = self._resident.get((name, instance))
+            if resident is not None:
+                resident.leases = max(0, resident.leases - 1)
+                resident.last_used = time.monotonic()
+                self._lock.notify_all()
+
+    def unload(self, name: str) -> int:
+        """Unload every idle instance of a model; returns how many were unloaded."""
+        with self._lock:
+            keys = [key for key, r in self._resident.items() if key[0] == name and r.leases == 0]
+            unloaded = [self._resident.pop(key) for key in keys]
+        for key, resident in zip(keys, unloaded):
+            self._close(key, resident)
+        return len(unloaded)
+
+    def unload_idle(self) -> int:
+        """Unload models with no lease that have not been used for idle_timeout seconds."""
+        if not self.idle_timeout:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            keys = [
+                key for key, r in self._resident.items()
+                if r.leases == 0 and now - r.last_used > self.idle_timeout
+            ]
+            unloaded = [self._resident.pop(key) for key in keys]
+            self.idle_unloads += len(unloaded)
+        for key, resident in zip(keys, unloaded):
+            self._close(key, resident)
+        return len(unloaded)
+
+    def start_janitor(self, interval: float = None):
+        if not self.idle_timeout or self._janitor is not None:
+            return
+        interval = interval or max(1.0, min(60.0, self.idle_timeout / 4))
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.unload_idle()
+                except Exception as e:
+                    logging.error(f"Model janitor failed: {e}")
+
+        self._janitor = threading.Thread(target=run, name="llm-model-janitor", daemon=True)
+        self._janitor.start()
+
+    def shutdown(self):
+        self._stop.set()
+        with self._lock:
+            keys = list(self._resident)
+            unloaded = [self._resident.pop(key) for key in keys]
+        for key, resident in zip(keys, unloaded):
+            self._close(key, resident)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            resident = {
+                f"{name}#{instance}": {
+                    "weights_mb": round(r.cost[1] / (1 << 20), 1),
+                    "context_mb": round(r.cost[2] / (1 << 20), 1),
+                    "leases": r.leases,
+                    "uses": r.uses,
+                    "idle_seconds": round(now - r.last_used, 1),
+                }
+                for (name, instance), r in self._resident.items()
+            }
+            return {
+                "configured": self.names(),
+                "resident": resident,
+                "loading": [f"{name}#{instance}" for name, instance in self._loading],
+                "ram_used_mb": round(self._ram_used() / (1 << 20), 1),
+                "ram_budget_mb": round(self.ram_budget_bytes / (1 << 20), 1) if self.ram_budget_bytes else None,
+                "idle_timeout_seconds": self.idle_timeout or None,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "idle_unloads": self.idle_unloads,
+            }
+
+    def _ram_cost(self, name: str, spec: dict) -> tuple:
+        """(weights key, weights bytes, context bytes) of one instance; instances of a file share its weights."""
+        paths = tuple(spec.get(path_key) for path_key in ("path", "draft_path"))
+        weights_key = paths if paths[0] else (name,)
+        if spec.get("ram_mb"):
+            weights = int(spec["ram_mb"]) << 20
+        else:
+            weights = 0
+            for path in paths:
+                try:
+                    weights += os.path.getsize(path)
+                except (TypeError, OSError):
+                    pass
+        return weights_key, weights, int(spec.get("context_bytes") or 0)
+
+    def _costs(self) -> list:
+        return [r.cost for r in self._resident.values()] + list(self._loading_cost.values())
+
+    def _ram_used(self, extra: tuple = None) -> int:
+        costs = self._costs() + ([extra] if extra else [])
+        weights = {weights_key: weights for weights_key, weights, _ in costs}
+        return sum(weights.values()) + sum(context for _, _, context in costs)
+
+    def _make_room(self, cost: tuple) -> list:
+        """
+        Called with self._lock held: evict idle models, oldest first, until the
+        new one fits. Returns the evicted (key, resident) pairs for the caller
+        to close once it has released the lock.
+        """
+        evicted = []
+        if not self.ram_budget_bytes:
+            return evicted
+        while self._ram_used(cost) > self.ram_budget_bytes:
+            idle = [key for key, r in self._resident.items() if r.leases == 0]
+            if idle:
+                key = idle[0]
+                evicted.append((key, self._resident.pop(key)))
+                self.evictions += 1
+                logging.info(f"Evicting model '{key[0]}' (instance {key[1]}) to stay under the RAM budget")
+                continue
+            if not self._resident and not self._loading_cost:
+                logging.warning(f"Model needs {(cost[1] + cost[2]) >> 20} MiB, more than the whole RAM budget; loading anyway")
+                break
+            # Everything resident is in use or still loading; wait for a release or a finished load
+            self._lock.wait(timeout=1.0)
+        return evicted
+
+    def _close(self, key, resident: _Resident):
+        # Never called with self._lock held: closing a pool or freeing weights can be slow
+        model = resident.model
+        resident.model = None
+        draft = getattr(model, "draft_model", None)
+        for closing in (model, draft):
+            try:
+                if hasattr(closing, "close"):
+                    closing.close()
+                elif hasattr(closing, "shutdown"):
+                    closing.shutdown()
+            except Exception as e:
+                logging.warning(f"Error closing model '{key[0]}': {e}")
+        del model, draft
+        gc.collect()
+        logging.info(f"Unloaded model '{key[0]}' (instance {key[1]})")
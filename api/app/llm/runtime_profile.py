@@ -0,0 +1,171 @@
+"""
+llama.cpp runtime profile: config knobs, tuned-profile file and autotuning.
+
+llama_runtime_kwargs() turns the LLAMA_* config keys into Llama() keyword
+arguments and fills the ones left unset with the tuned settings from
+LLAMA_PROFILE_PATH, when the profile was produced for the same model file
+(same name and size). autotune() benchmarks thread/batch combinations on
+the current host and picks the fastest.
+"""
+from datetime import datetime
+import json
+import logging
+import os
+import platform
+import time
+
+# Config key -> Llama() keyword argument
+RUNTIME_KEYS = {
+    "LLAMA_N_CTX": "n_ctx",
+    "LLAMA_N_GPU_LAYERS": "n_gpu_layers",
+    "LLAMA_N_THREADS": "n_threads",
+    "LLAMA_N_THREADS_BATCH": "n_threads_batch",
+    "LLAMA_N_BATCH": "n_batch",
+    "LLAMA_USE_MMAP": "use_mmap",
+    "LLAMA_USE_MLOCK": "use_mlock",
+    "LLAMA_VERBOSE": "verbose",
+}
+
+# Settings the autotuner is allowed to write into a profile
+TUNABLE_KEYS = ("n_threads", "n_threads_batch", "n_batch")
+
+
+def load_profile(path: str):
+    """Return the saved profile dict, or None if there is no readable profile."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable Llama runtime profile {path}: {e}")
+        return None
+
+
+def save_profile(path: str, profile: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def model_size(path: str):
+    """Size in bytes of the model file, or None if it cannot be read."""
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+def profile_matches(profile: dict, model_path: str) -> bool:
+    """Whether the profile was tuned for this model file (same name and size)."""
+    return (
+        os.path.basename(profile.get("model_path", "")) == os.path.basename(model_path or "")
+        and profile.get("model_size") is not None
+        and profile.get("model_size") == model_size(model_path)
+    )
+
+
+def llama_runtime_kwargs(config, model_path: str = None) -> dict:
+    """Build Llama() keyword arguments from config, with the tuned profile for unset keys."""
+    kwargs = {
+        arg: config.get(key)
+        for key, arg in RUNTIME_KEYS.items()
+        if config.get(key) is not None
+    }
+
+    model_path = model_path or config.get("LLAMA_MODEL_PATH")
+    profile = load_profile(config.get("LLAMA_PROFILE_PATH"))
+    if profile:
+        if not profile_matches(profile, model_path):
+            logging.warning("Llama runtime profile was tuned for a different model file; ignoring it. Re-run autotune_llm.py.")
+        else:
+            # Explicit LLAMA_* config always wins over the tuned values
+            settings = {
+                k: v for k, v in profile.get("settings", {}).items()
+                if k in TUNABLE_KEYS and k not in kwargs
+            }
+            kwargs.update(settings)
+            logging.info(f"Applied Llama runtime profile: {settings}")
+    return kwargs
+
+
+def benchmark(model_path: str, base_kwargs: dict, n_threads: int, n_batch: int,
+              prompt_tokens: int = 512, gen_tokens: int = 128) -> dict:
+    """Measure prompt-eval and generation tokens/sec for one setting."""
+    from app.extensions import load_llama_model
+
+    kwargs = dict(base_kwargs, n_threads=n_threads, n_threads_batch=n_threads, n_batch=n_batch)
+    model = load_llama_model(model_path, **kwargs)
+    try:
+        filler = "The quick brown fox jumps over the lazy dog. " * prompt_tokens
+        tokens = model.tokenize(filler.encode("utf-8"))[:prompt_tokens]
+
+        model.reset()
+        start = time.perf_counter()
+        model.eval(tokens)
+        prompt_seconds = time.perf_counter() - start
+
+        model.reset()
+        start = time.perf_counter()
+        result = model.create_completion("Once upon a time", max_tokens=gen_tokens, temperature=0.0)
+        gen_seconds = time.perf_counter() - start
+        generated = result.get("usage", {}).get("completion_tokens", gen_tokens) or gen_tokens
+    finally:
+        del model
+
+    prompt_tps = len(tokens) / prompt_seconds if prompt_seconds else 0.0
+    gen_tps = generated / gen_seconds if gen_seconds else 0.0
+    return {
+        "n_threads": n_threads,
+        "n_threads_batch": n_threads,
+        "n_batch": n_batch,
+        "prompt_tokens_per_second": round(prompt_tps, 2),
+        "generation_tokens_per_second": round(gen_tps, 2),
+        # Wall time for a typical request: prompt_tokens in, gen_tokens out
+        "request_seconds": round(len(tokens) / prompt_tps + gen_tokens / gen_tps, 3) if prompt_tps and gen_tps else None,
+    }
+
+
+def default_thread_options() -> list:
+    cpus = os.cpu_count() or 4
+    options = {1, 2, 4, 6, 8, 12, 16, 24, 32, cpus // 2, cpus}
+    return sorted(n for n in options if 0 < n <= cpus)
+
+
+def autotune(model_path: str, base_kwargs: dict, thread_options: list = None, batch_options: list = None,
+             prompt_tokens: int = 512, gen_tokens: int = 128, log=print) -> dict:
+    """Benchmark every thread/batch combination and return the best profile."""
+    thread_options = thread_options or default_thread_options()
+    batch_options = batch_options or [128, 256, 512]
+    base_kwargs = {k: v for k, v in base_kwargs.items() if k not in TUNABLE_KEYS}
+
+    results = []
+    for n_threads in thread_options:
+        for n_batch in batch_options:
+            try:
+                result = benchmark(model_path, base_kwargs, n_threads, n_batch, prompt_tokens, gen_tokens)
+            except Exception as e:
+                log(f"threads={n_threads} batch={n_batch}: failed ({e})")
+                continue
+            results.append(result)
+            log(
+                f"threads={n_threads} batch={n_batch}: "
+                f"prompt {result['prompt_tokens_per_second']} tok/s, "
+                f"generation {result['generation_tokens_per_second']} tok/s"
+            )
+
+    timed = [r for r in results if r["request_seconds"] is not None]
+    if not timed:
+        raise RuntimeError("Autotune produced no successful benchmark runs.")
+    best = min(timed, key=lambda r: r["request_seconds"])
+
+    return {
+        "model_path": model_path,
+        "model_size": model_size(model_path),
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "created_at": datetime.utcnow().isoformat(),
+        "settings": {key: best[key] for key in TUNABLE_KEYS},
+        "results": results,
+    }
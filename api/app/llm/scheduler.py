@@ -0,0 +1,433 @@
+"""
+Inference scheduler that sits in front of the Llama model.
+
+Every LLM call goes through the scheduler's request queues, one per priority
+class ("interactive" chat ahead of "bulk" generation). Worker slots pull the
+highest-priority request and run it on their own model instance (a llama.cpp
+context is not thread-safe, so a slot never shares its model). Callers get an
+InferenceRequest back which works both as a future for the full completion
+and as a token stream.
+
+Admission control keeps the queues short: a class whose queue is at its max
+depth rejects new requests immediately, and requests that waited past their
+class deadline are failed instead of served. Both raise AdmissionRejected with
+a Retry-After estimate so routes can answer 429/503 straight away. Slots can
+be reserved for interactive requests so a bulk job never occupies every slot.
+
+Identical requests (same normalized messages, sampling params and stream
+mode) that arrive while one is still queued or running are single-flighted:
+they get the in-flight InferenceRequest back instead of a new generation,
+and every waiter reads the same result or token stream. A caller only joins
+a request of its own or a higher priority class; an interactive duplicate of
+a bulk request gets its own generation, which later duplicates join instead.
+
+A running request that produces no token for request_timeout seconds fails
+its waiters with TimeoutError, so a hung generation never blocks a caller
+for good.
+"""
+from collections import deque
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+
+# Priority classes, highest priority first
+PRIORITY_CLASSES = ("interactive", "bulk")
+DEFAULT_PRIORITY = "interactive"
+# Queue waits kept per class for percentile metrics
+WAIT_SAMPLES = 1000
+
+
+class AdmissionRejected(RuntimeError):
+    """The scheduler refused a request; status is the HTTP code to answer with."""
+
+    def __init__(self, message: str, retry_after: int = 1, status: int = 429, priority: str = DEFAULT_PRIORITY):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+        self.priority = priority
+
+
+def _percentile(samples, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def request_key(messages: list, params: dict, stream: bool) -> str:
+    """Hash of the normalized message list and sampling params."""
+    normalized = [
+        {
+            "role": str(message.get("role", "")).strip().lower(),
+            "content": str(message.get("content") or "").replace("\r\n", "\n").strip(),
+        }
+        for message in messages
+    ]
+    payload = json.dumps([normalized, params, bool(stream)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InferenceRequest:
+    """A queued chat completion: future for the result plus a token stream."""
+
+    def __init__(self, messages: list, params: dict, stream: bool = False, priority: str = DEFAULT_PRIORITY,
+                 timeout: float = None):
+        self.messages = messages
+        self.params = params
+        self.stream = stream
+        self.priority = priority
+        self.timeout = timeout
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.pushed_at = None
+        self.finished_at = None
+        self.generated_tokens = 0
+        self.key = None
+        self.waiters = 1
+        self._chunks = []
+        self._done = False
+        self._result = None
+        self._error = None
+        self._cond = threading.Condition()
+
+    def push(self, chunk: str):
+        """Publish a streamed token to every consumer."""
+        with self._cond:
+            self._chunks.append(chunk)
+            self.pushed_at = time.monotonic()
+            self._cond.notify_all()
+
+    def finish(self, result=None, error: Exception = None):
+        with self._cond:
+            self._result = result
+            self._error = error
+            self._done = True
+            self.finished_at = time.monotonic()
+            self._cond.notify_all()
+
+    def done(self) -> bool:
+        return self._done
+
+    def result(self, timeout: float = None):
+        """Block until the request finishes and return the completion."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._done, timeout=timeout):
+                raise TimeoutError("LLM request did not finish in time")
+            if self._error is not None:
+                raise self._error
+            return self._result
+
+    def tokens(self, timeout: float = None):
+        """
+        Yield streamed tokens as they arrive; raises if generation failed, or
+        TimeoutError once the running request has produced nothing for timeout
+        seconds (default: the scheduler's request_timeout). Time spent queued
+        is bounded by the class deadline instead.
+        """
+        timeout = timeout if timeout is not None else self.timeout
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._chunks) and not self._done:
+                    remaining = None
+                    if timeout and self.started_at is not None:
+                        remaining = max(self.started_at, self.pushed_at or 0.0) + timeout - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError(f"LLM request produced no token for {timeout}s")
+                    self._cond.wait(timeout=remaining or timeout or None)
+                pending = self._chunks[index:]
+                finished = self._done
+                error = self._error
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if finished and index >= len(self._chunks):
+                if error is not None:
+                    raise error
+                return
+
+    @property
+    def queue_wait(self) -> float:
+        start = self.started_at if self.started_at is not None else time.monotonic()
+        return start - self.enqueued_at
+
+
+class InferenceScheduler:
+    """
+    Per-class request queues plus a fixed number of worker slots.
+
+    model_loader(slot_index) is called lazily on the slot's own thread the
+    first time it picks up work, so no model is loaded until it is needed.
+    When model_release(slot_index) is given the slot leases its model per
+    request instead: model_loader before and model_release after each one,
+    so an idle model can be unloaded between requests.
+
+    max_depth and deadlines map a priority class to its queue limit and
+    maximum queue wait in seconds (0 or missing = unlimited). The first
+    reserved_slots slots only serve interactive requests. request_timeout
+    is the longest a running request may go without a token before its
+    streaming waiters give up (0 = no limit).
+    """
+
+    def __init__(self, model_loader, num_slots: int = 1, single_flight: bool = True,
+                 max_depth: dict = None, deadlines: dict = None, reserved_slots: int = 0,
+                 model_release=None, request_timeout: float = 0.0):
+        self._model_loader = model_loader
+        self._model_release = model_release
+        self.num_slots = max(1, int(num_slots))
+        self.single_flight = single_flight
+        self.max_depth = max_depth or {}
+        self.deadlines = deadlines or {}
+        self.request_timeout = request_timeout
+        # Always leave at least one slot that serves every class
+        self.reserved_slots = max(0, min(int(reserved_slots), self.num_slots - 1))
+        self._pending = {priority: deque() for priority in PRIORITY_CLASSES}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._inflight = {}
+        self._deduplicated = 0
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._generated_tokens = 0
+        self._generation_time = 0.0
+        self._class_stats = {
+            priority: {"admitted": 0, "rejected": 0, "expired": 0, "waits": deque(maxlen=WAIT_SAMPLES)}
+            for priority in PRIORITY_CLASSES
+        }
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._stopping = False
+            for index in range(self.num_slots):
+                thread = threading.Thread(
+                    target=self._run_slot,
+                    args=(index,),
+                    name=f"llm-slot-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+        logging.info(f"LLM scheduler started with {self.num_slots} slot(s), {self.reserved_slots} reserved for interactive")
+
+    def check_admission(self, priority: str = DEFAULT_PRIORITY):
+        """Raise AdmissionRejected if a request of this class would be refused right now."""
+        priority = self._priority(priority)
+        with self._cond:
+            self._check_depth(priority)
+
+    def submit(self, messages: list, stream: bool = False, priority: str = DEFAULT_PRIORITY, **params) -> InferenceRequest:
+        """
+        Queue a chat completion and return its InferenceRequest, or join an
+        identical request of the same or a higher priority already in flight.
+        Raises AdmissionRejected when the class queue is full.
+        """
+        if not self._started:
+            self.start()
+        priority = self._priority(priority)
+        key = request_key(messages, params, stream) if self.single_flight else None
+
+        with self._cond:
+            if key is not None:
+                request = self._inflight.get(key)
+                if request is not None and PRIORITY_CLASSES.index(request.priority) <= PRIORITY_CLASSES.index(priority):
+                    request.waiters += 1
+                    self._deduplicated += 1
+                    return request
+            self._check_depth(priority)
+            request = InferenceRequest(messages, params, stream=stream, priority=priority,
+                                       timeout=self.request_timeout or None)
+            if key is not None:
+                # Replaces a lower-priority duplicate as the request later callers join
+                request.key = key
+                self._inflight[key] = request
+            self._pending[priority].append(request)
+            self._class_stats[priority]["admitted"] += 1
+            self._cond.notify()
+        return request
+
+    def shutdown(self, wait: bool = True, timeout: float = 5.0):
+        """Stop the slots once the requests already queued have been served."""
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            threads, self._threads = self._threads, []
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if wait:
+            for thread in threads:
+                thread.join(timeout=timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            classes = {}
+            for priority in PRIORITY_CLASSES:
+                counters = self._class_stats[priority]
+                waits = list(counters["waits"])
+                classes[priority] = {
+                    "queued": len(self._pending[priority]),
+                    "max_depth": self.max_depth.get(priority) or None,
+                    "deadline_seconds": self.deadlines.get(priority) or None,
+                    "admitted": counters["admitted"],
+                    "rejected": counters["rejected"],
+                    "expired": counters["expired"],
+                    "avg_wait_ms": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+                    "p50_wait_ms": round(1000 * _percentile(waits, 0.5), 2),
+                    "p99_wait_ms": round(1000 * _percentile(waits, 0.99), 2),
+                }
+            queued = sum(len(pending) for pending in self._pending.values())
+            in_flight_keys = len(self._inflight)
+            deduplicated = self._deduplicated
+        with self._lock:
+            served = self._completed + self._failed
+            return {
+                "slots": self.num_slots,
+                "reserved_interactive_slots": self.reserved_slots,
+                "queued": queued,
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_queue_wait_ms": round(1000 * self._total_wait / served, 2) if served else 0.0,
+                "generated_tokens": self._generated_tokens,
+                "tokens_per_second": round(self._generated_tokens / self._generation_time, 2) if self._generation_time else 0.0,
+                "in_flight_keys": in_flight_keys,
+                "deduplicated": deduplicated,
+                "classes": classes,
+            }
+
+    def _priority(self, priority: str) -> str:
+        if priority not in self._pending:
+            raise ValueError(f"Unknown priority class '{priority}'. Use one of {PRIORITY_CLASSES}.")
+        return priority
+
+    def _retry_after(self, priority: str) -> int:
+        """Seconds until the requests ahead of a new one should have drained."""
+        with self._lock:
+            served = self._completed + self._failed
+            per_request = self._generation_time / served if served else 1.0
+            active = self._active
+        ahead = sum(
+            len(self._pending[p])
+            for p in PRIORITY_CLASSES[: PRIORITY_CLASSES.index(priority) + 1]
+        )
+        return max(1, math.ceil(per_request * (ahead + active) / self.num_slots))
+
+    def _check_depth(self, priority: str):
+        # Called with self._cond held
+        limit = self.max_depth.get(priority)
+        if limit and len(self._pending[priority]) >= limit:
+            self._class_stats[priority]["rejected"] += 1
+            raise AdmissionRejected(
+                f"LLM {priority} queue is full ({limit} waiting)",
+                retry_after=self._retry_after(priority),
+                status=429,
+                priority=priority,
+            )
+
+    def _expire_overdue(self, now: float):
+        # Called with self._cond held; queues are FIFO so overdue requests sit at the front
+        for priority, pending in self._pending.items():
+            deadline = self.deadlines.get(priority)
+            if not deadline:
+                continue
+            while pending and now - pending[0].enqueued_at > deadline:
+                request = pending.popleft()
+                self._class_stats[priority]["expired"] += 1
+                if request.key is not None and self._inflight.get(request.key) is request:
+                    del self._inflight[request.key]
+                request.finish(error=AdmissionRejected(
+                    f"LLM {priority} request waited more than {deadline}s in the queue",
+                    retry_after=self._retry_after(priority),
+                    status=503,
+                    priority=priority,
+                ))
+
+    def _next_request(self, index: int):
+        """Block until there is a request this slot may serve; None on shutdown."""
+        classes = PRIORITY_CLASSES[:1] if index < self.reserved_slots else PRIORITY_CLASSES
+        with self._cond:
+            while True:
+                self._expire_overdue(time.monotonic())
+                for priority in classes:
+                    if self._pending[priority]:
+                        request = self._pending[priority].popleft()
+                        request.started_at = time.monotonic()
+                        self._class_stats[priority]["waits"].append(request.queue_wait)
+                        return request
+                if self._stopping and not any(self._pending.values()):
+                    return None
+                if self._stopping and index < self.reserved_slots:
+                    return None
+                self._cond.wait(timeout=0.5)
+
+    def _run_slot(self, index: int):
+        model = None
+        while True:
+            request = self._next_request(index)
+            if request is None:
+                break
+            try:
+                if model is None:
+                    model = self._model_loader(index)
+                self._serve(model, request)
+            except Exception as e:
+                logging.error(f"LLM slot {index} failed to serve request: {e}")
+                request.finish(error=e)
+            finally:
+                if self._model_release is not None and model is not None:
+                    model = None
+                    self._model_release(index)
+                self._record(request)
+
+    def _serve(self, model, request: InferenceRequest):
+        with self._lock:
+            self._active += 1
+        try:
+            response = model.create_chat_completion(
+                messages=request.messages,
+                stream=request.stream,
+                **request.params,
+            )
+            if not request.stream:
+                usage = response.get("usage") or {}
+                request.generated_tokens = usage.get("completion_tokens", 0)
+                request.finish(result=response)
+                return
+
+            pieces = []
+            for chunk in response:
+                piece = chunk.get('choices', [{}])[0].get('delta', {}).get('content', '')
+                if piece:
+                    pieces.append(piece)
+                    request.push(piece)
+            request.generated_tokens = len(pieces)
+            request.finish(result="".join(pieces))
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _record(self, request: InferenceRequest):
+        with self._cond:
+            if request.key is not None and self._inflight.get(request.key) is request:
+                del self._inflight[request.key]
+        with self._lock:
+            if request._error is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+            self._total_wait += request.queue_wait
+            self._generated_tokens += request.generated_tokens
+            if request.finished_at is not None:
+                self._generation_time += request.finished_at - request.started_at
@@ -1,13 +1,27 @@
 from app.llm.clients import generate_response
-from app.llm.models import LLMQueryLog
-from app.extensions import db
+from app.llm.log_writer import get_log_writer
+from flask import current_app
 from datetime import datetime
+import os
+
+def _log_record(messages, response_text, user_id, model_name):
+    return {
+        "user_id": user_id,
+        "prompt": str(messages),
+        "response": response_text,
+        "model_name": model_name,
+        "created_at": datetime.utcnow(),
+    }
 
 def process_llm_query(messages, user_id=None, max_tokens=512, temperature=0.7, top_p=0.9, stop_tokens=None, stream=False):
     """
     Handles the LLM inference call, logs the request, and returns or streams response.
     If stream=True, yields chunks; else returns full response.
+    Log rows are handed to the background writer, so logging adds no DB round-trip.
     """
+    log_writer = get_log_writer()
+    model_name = os.path.basename(current_app.config.get("LLAMA_MODEL_PATH") or "")
+
     if stream:
         # Stream generator wrapper that logs after streaming finished
         full_response = []
@@ -25,20 +39,12 @@ def process_llm_query(messages, user_id=None, max_tokens=512, temperature=0.7, t
                 yield chunk
 
             # After streaming is done, log full response
-            log = LLMQueryLog(
-                user_id=user_id,
-                prompt=str(messages),
-                response="".join(full_response),
-                model_name="Meta-Llama-3-8B-Instruct.Q4_K_M.gguf",
-                created_at=datetime.utcnow(),
-            )
-            db.session.add(log)
-            db.session.commit()
+            log_writer.submit(_log_record(messages, "".join(full_response), user_id, model_name))
 
         return generator()
 
     else:
-        # Non-streaming: call generate_response and log immediately
+        # Non-streaming: call generate_response and log in the background
         response_text = generate_response(
             messages,
             max_tokens=max_tokens,
@@ -48,14 +54,6 @@ def process_llm_query(messages, user_id=None, max_tokens=512, temperature=0.7, t
             stream=False,
         )
 
-        log = LLMQueryLog(
-            user_id=user_id,
-            prompt=str(messages),
-            response=response_text,
-            model_name="Meta-Llama-3-8B-Instruct.Q4_K_M.gguf",
-            created_at=datetime.utcnow(),
-        )
-        db.session.add(log)
-        db.session.commit()
+        log_writer.submit(_log_record(messages, response_text, user_id, model_name))
 
         return response_text
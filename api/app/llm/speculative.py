@@ -0,0 +1,161 @@
+"""
+Speculative decoding support for the Llama slots.
+
+llama-cpp-python verifies drafted tokens itself when a Llama is created with
+draft_model=...: drafted tokens are evaluated in one batch and kept for as
+long as they match what the main model samples. This module provides the
+drafters and measures how many drafted tokens were accepted:
+
+    prompt_lookup  copies continuations of n-grams already in the prompt,
+                   which suits RAG answers quoting their context
+    model          drafts greedily with a small GGUF model that shares the
+                   main model's vocabulary
+"""
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+import logging
+import threading
+import numpy as np
+
+DRAFT_MODES = ("none", "prompt_lookup", "model")
+
+
+class SpeculativeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.draft_calls = 0
+        self.proposed = 0
+        self.accepted = 0
+
+    def record(self, proposed: int = 0, accepted: int = 0):
+        with self._lock:
+            if proposed:
+                self.draft_calls += 1
+                self.proposed += proposed
+            self.accepted += accepted
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "draft_calls": self.draft_calls,
+                "proposed_tokens": self.proposed,
+                "accepted_tokens": self.accepted,
+                "acceptance_rate": round(self.accepted / self.proposed, 4) if self.proposed else 0.0,
+            }
+
+
+_stats = SpeculativeStats()
+
+
+def speculative_stats() -> dict:
+    """Acceptance metrics for every draft model in this process."""
+    return _stats.as_dict()
+
+
+class SmallModelDraft(LlamaDraftModel):
+    """Greedy drafter backed by a small GGUF model with the same vocabulary."""
+
+    def __init__(self, model_path: str, num_pred_tokens: int = 8, n_ctx: int = 4096, n_threads: int = None):
+        self.num_pred_tokens = num_pred_tokens
+        self.model = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        logging.info(f"Draft model loaded from {model_path}")
+
+    def __call__(self, input_ids, /, **kwargs):
+        model = self.model
+        input_ids = np.asarray(input_ids, dtype=np.intc)
+
+        # Keep the KV cache for the prefix the draft model has already seen
+        seen = model.input_ids[: model.n_tokens]
+        limit = min(len(seen), len(input_ids))
+        mismatch = np.nonzero(seen[:limit] != input_ids[:limit])[0]
+        prefix = int(mismatch[0]) if len(mismatch) else limit
+        prefix = min(prefix, len(input_ids) - 1)  # always re-evaluate at least the last token
+        model.n_tokens = prefix  # eval() drops the KV cells past n_tokens
+        model.eval(input_ids[prefix:].tolist())
+
+        draft = []
+        while len(draft) < self.num_pred_tokens and model.n_tokens < model.n_ctx() - 1:
+            token = int(np.argmax(model.scores[model.n_tokens - 1]))
+            if token == model.token_eos():
+                break
+            draft.append(token)
+            model.eval([token])
+        return np.array(draft, dtype=np.intc)
+
+    def close(self):
+        self.model.close()
+
+
+class TrackingDraftModel(LlamaDraftModel):
+    """
+    Wraps a drafter and counts accepted tokens: on each call, the tokens that
+    follow the previous input are compared with what was drafted for them.
+    """
+
+    def __init__(self, inner: LlamaDraftModel):
+        self.inner = inner
+        self._last_len = 0
+        self._last_tail = None
+        self._last_draft = None
+
+    def __call__(self, input_ids, /, **kwargs):
+        input_ids = np.asarray(input_ids, dtype=np.intc)
+        accepted = 0
+        if (
+            self._last_draft is not None
+            and len(input_ids) > self._last_len
+            and np.array_equal(input_ids[self._last_len - len(self._last_tail): self._last_len], self._last_tail)
+        ):
+            actual = input_ids[self._last_len: self._last_len + len(self._last_draft)]
+            matches = actual == self._last_draft[: len(actual)]
+            accepted = len(matches) if matches.all() else int(np.argmin(matches))
+
+        draft = self.inner(input_ids, **kwargs)
+        _stats.record(proposed=len(draft), accepted=accepted)
+        self._last_len = len(input_ids)
+        self._last_tail = input_ids[-8:].copy()
+        self._last_draft = np.asarray(draft, dtype=np.intc)
+        return draft
+
+    def close(self):
+        """Free the wrapped drafter's model, if it owns one."""
+        if hasattr(self.inner, "close"):
+            self.inner.close()
+
+
+def build_draft_model(spec: dict = None):
+    """
+    Build a draft model from a plain (picklable) spec:
+    {'mode': 'prompt_lookup'|'model', 'num_pred_tokens': int,
+     'ngram_size': int, 'model_path': str, 'n_ctx': int}
+    Returns None when speculative decoding is off.
+    """
+    if not spec or spec.get("mode", "none") == "none":
+        return None
+    mode = spec["mode"]
+    if mode == "prompt_lookup":
+        inner = LlamaPromptLookupDecoding(
+            max_ngram_size=spec.get("ngram_size", 2),
+            num_pred_tokens=spec.get("num_pred_tokens", 10),
+        )
+    elif mode == "model":
+        if not spec.get("model_path"):
+            raise RuntimeError("LLAMA_DRAFT_MODEL_PATH is required for draft mode 'model'.")
+        inner = SmallModelDraft(
+            spec["model_path"],
+            num_pred_tokens=spec.get("num_pred_tokens", 8),
+            n_ctx=spec.get("n_ctx", 4096),
+        )
+    else:
+        raise RuntimeError(f"Unknown speculative draft mode '{mode}'. Use one of {DRAFT_MODES}.")
+    return TrackingDraftModel(inner)
+
+
+def draft_spec_from_config(config) -> dict:
+    return {
+        "mode": config.get("LLAMA_DRAFT_MODE", "none"),
+        "model_path": config.get("LLAMA_DRAFT_MODEL_PATH"),
+        "num_pred_tokens": config.get("LLAMA_DRAFT_NUM_TOKENS", 8),
+        "ngram_size": config.get("LLAMA_PROMPT_LOOKUP_NGRAM", 2),
+        "n_ctx": config.get("LLAMA_N_CTX", 4096),
+    }
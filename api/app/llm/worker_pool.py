@@ -0,0 +1,313 @@
+"""
+Optional multi-process pool of Llama model servers.
+
+Each worker is a separate process that loads the GGUF with mmap, so the
+weights live once in the OS page cache and are shared by every worker. The
+Flask process talks to each worker over a duplex multiprocessing Pipe.
+The pool exposes create_chat_completion() like a Llama instance, so the
+inference scheduler can use it as the model behind each of its slots.
+
+A worker that sends nothing back for request_timeout seconds (the whole
+reply, or the next chunk when streaming) is treated as stuck: it is
+killed and respawned, and the request fails with WorkerTimeoutError. The
+health loop cannot ping a busy worker, so this deadline is what catches a
+hung generation.
+
+Wire protocol (tuples over the pipe):
+    parent -> worker: ("ping",) | ("chat", kwargs) | ("stop",)
+    worker -> parent: ("pong", report) | ("result", response) | ("chunk", chunk)
+                      | ("done", None) | ("error", message)
+"""
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+
+
+def _worker_main(conn, model_kwargs: dict, cache_bytes: int, prefixes: list):
+    """Entry point of a model-server process."""
+    from app.extensions import load_llama_model
+    from app.llm.prefix_cache import attach_prefix_cache, warm_prefix_cache
+    from app.llm.speculative import speculative_stats
+
+    model = load_llama_model(**model_kwargs)
+    if cache_bytes:
+        attach_prefix_cache(model, cache_bytes)
+        warm_prefix_cache(model, prefixes)
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        command = message[0]
+        if command == "stop":
+            break
+        if command == "ping":
+            conn.send(("pong", {
+                "pid": multiprocessing.current_process().pid,
+                "speculative": speculative_stats(),
+            }))
+            continue
+        if command != "chat":
+            conn.send(("error", f"Unknown command: {command}"))
+            continue
+
+        kwargs = message[1]
+        try:
+            if kwargs.get("stream"):
+                for chunk in model.create_chat_completion(**kwargs):
+                    conn.send(("chunk", chunk))
+                conn.send(("done", None))
+            else:
+                conn.send(("result", model.create_chat_completion(**kwargs)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class _Worker:
+    """Parent-side handle for one model-server process."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.restarts = 0
+        self.served = 0
+        self.timeouts = 0
+        self.busy_since = None
+        self.report = {}
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class WorkerDiedError(RuntimeError):
+    pass
+
+
+class WorkerTimeoutError(WorkerDiedError):
+    pass
+
+
+class LlamaWorkerPool:
+    def __init__(
+        self,
+        model_kwargs: dict,
+        size: int = 2,
+        cache_bytes: int = 0,
+        prefixes: list = None,
+        health_interval: float = 10.0,
+        start_timeout: float = 600.0,
+        request_timeout: float = 0.0,
+    ):
+        self.model_kwargs = dict(model_kwargs, use_mmap=True)
+        self.size = max(1, int(size))
+        self.cache_bytes = cache_bytes
+        self.prefixes = list(prefixes or [])
+        self.health_interval = health_interval
+        self.start_timeout = start_timeout
+        self.request_timeout = request_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers = [_Worker(i) for i in range(self.size)]
+        self._round_robin = itertools.count()
+        self._dispatch_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    def start(self):
+        for worker in self._workers:
+            self._spawn(worker)
+        self._health_thread = threading.Thread(target=self._health_loop, name="llm-pool-health", daemon=True)
+        self._health_thread.start()
+        logging.info(f"LLM worker pool started with {self.size} process(es)")
+
+    def shutdown(self, timeout: float = 5.0):
+        self._stop.set()
+        for worker in self._workers:
+            self._terminate(worker, timeout)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "workers": [
+                {
+                    "index": w.index,
+                    "pid": w.process.pid if w.process else None,
+                    "alive": w.alive,
+                    "in_flight": w.in_flight,
+                    "served": w.served,
+                    "restarts": w.restarts,
+                    "timeouts": w.timeouts,
+                    "busy_seconds": round(time.monotonic() - w.busy_since, 1) if w.busy_since else None,
+                    "speculative": w.report.get("speculative"),
+                }
+                for w in self._workers
+            ],
+        }
+
+    def create_chat_completion(self, **kwargs):
+        """Run a chat completion on the least-loaded worker (round-robin on ties)."""
+        if kwargs.get("stream"):
+            return self._stream(kwargs)
+        worker = self._pick_worker()
+        try:
+            return self._call(worker, kwargs)
+        except WorkerTimeoutError:
+            # A request that hung one worker would likely hang the next; don't retry it
+            raise
+        except WorkerDiedError:
+            # The worker has been respawned; retry once on whichever is least loaded
+            return self._call(self._pick_worker(), kwargs)
+
+    def _pick_worker(self) -> _Worker:
+        with self._dispatch_lock:
+            offset = next(self._round_robin)
+            ordered = self._workers[offset % self.size:] + self._workers[:offset % self.size]
+            worker = min(ordered, key=lambda w: (not w.alive, w.in_flight))
+            worker.in_flight += 1
+            return worker
+
+    def _release(self, worker: _Worker):
+        with self._dispatch_lock:
+            worker.in_flight -= 1
+            worker.served += 1
+
+    def _receive(self, worker: _Worker):
+        """Next reply from a busy worker; restarts it if none comes within request_timeout."""
+        if self.request_timeout and not worker.conn.poll(self.request_timeout):
+            worker.timeouts += 1
+            self._restart(worker, f"no reply within {self.request_timeout}s")
+            raise WorkerTimeoutError(f"LLM worker {worker.index} exceeded the request deadline")
+        return worker.conn.recv()
+
+    def _call(self, worker: _Worker, kwargs: dict):
+        try:
+            with worker.lock:
+                worker.busy_since = time.monotonic()
+                try:
+                    worker.conn.send(("chat", kwargs))
+                    kind, payload = self._receive(worker)
+                except (EOFError, OSError, BrokenPipeError) as e:
+                    self._restart(worker, f"connection lost: {e}")
+                    raise WorkerDiedError(f"LLM worker {worker.index} died during request")
+                finally:
+                    worker.busy_since = None
+            if kind == "error":
+                raise RuntimeError(payload)
+            return payload
+        finally:
+            self._release(worker)
+
+    def _stream(self, kwargs: dict):
+        worker = self._pick_worker()
+        worker.lock.acquire()
+        worker.busy_since = time.monotonic()
+        finished = False
+        try:
+            worker.conn.send(("chat", kwargs))
+            while True:
+                kind, payload = self._receive(worker)
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    finished = True
+                    return
+                else:
+                    finished = True
+                    raise RuntimeError(payload)
+        except (EOFError, OSError, BrokenPipeError) as e:
+            finished = True
+            self._restart(worker, f"connection lost: {e}")
+            raise WorkerDiedError(f"LLM worker {worker.index} died during streaming")
+        except WorkerTimeoutError:
+            finished = True
+            raise
+        finally:
+            if not finished:
+                # Consumer stopped early: drain the rest so the pipe stays in sync
+                try:
+                    while self._receive(worker)[0] == "chunk":
+                        pass
+                except WorkerTimeoutError:
+                    pass
+                except (EOFError, OSError):
+                    self._restart(worker, "connection lost while draining")
+            worker.busy_since = None
+            worker.lock.release()
+            self._release(worker)
+
+    def _spawn(self, worker: _Worker):
+        parent_conn, child_conn = self._ctx.Pipe(duplex=True)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.model_kwargs, self.cache_bytes, self.prefixes),
+            name=f"llm-worker-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        if not parent_conn.poll(self.start_timeout):
+            process.terminate()
+            raise RuntimeError(f"LLM worker {worker.index} did not become ready")
+        kind, _ = parent_conn.recv()
+        if kind != "ready":
+            raise RuntimeError(f"LLM worker {worker.index} failed to start")
+        worker.process, worker.conn = process, parent_conn
+        logging.info(f"LLM worker {worker.index} ready (pid {process.pid})")
+
+    def _terminate(self, worker: _Worker, timeout: float = 5.0):
+        if worker.process is None:
+            return
+        try:
+            worker.conn.send(("stop",))
+        except (OSError, BrokenPipeError):
+            pass
+        worker.process.join(timeout)
+        if worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join(timeout)
+        worker.conn.close()
+
+    def _restart(self, worker: _Worker, reason: str):
+        if self._stop.is_set():
+            return
+        logging.warning(f"Restarting LLM worker {worker.index}: {reason}")
+        self._terminate(worker, timeout=1.0)
+        worker.restarts += 1
+        try:
+            self._spawn(worker)
+        except Exception as e:
+            logging.error(f"Failed to restart LLM worker {worker.index}: {e}")
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for worker in self._workers:
+                if not worker.lock.acquire(blocking=False):
+                    # Busy serving; the request's own deadline restarts it if it hangs
+                    if not worker.alive:
+                        logging.warning(f"LLM worker {worker.index} is not alive while busy")
+                    continue
+                try:
+                    if not worker.alive:
+                        self._restart(worker, "process exited")
+                        continue
+                    try:
+                        worker.conn.send(("ping",))
+                        if not worker.conn.poll(self.health_interval):
+                            self._restart(worker, "health check timed out")
+                            continue
+                        kind, report = worker.conn.recv()
+                        if kind != "pong":
+                            self._restart(worker, f"unexpected health reply '{kind}'")
+                            continue
+                        worker.report = report
+                    except (EOFError, OSError, BrokenPipeError) as e:
+                        self._restart(worker, f"health check failed: {e}")
+                finally:
+                    worker.lock.release()
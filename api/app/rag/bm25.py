@@ -0,0 +1,212 @@
+"""
+Local BM25 inverted index kept alongside the Milvus collection.
+
+Dense search misses exact-term matches (formula names, code identifiers,
+course codes), so every chunk inserted into Milvus is also indexed here,
+in a SQLite file next to the Milvus database:
+
+    docs(id, subject, text, length, owner_id)  one row per Milvus id
+    postings(term, doc_id, tf)                 the inverted index
+    meta(key, value)                           document count and total length
+
+Terms keep identifier punctuation ("numpy.argpartition", "cs-101",
+"snake_case") so such tokens match as typed. Scores are Okapi BM25, computed
+in SQL over the query terms' posting lists. reciprocal_rank_fusion() merges
+these results with the vector search. Private chunks carry their owner_id
+and only match that owner's searches, like their Milvus partitions.
+"""
+from collections import Counter
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+
+K1 = 1.2
+B = 0.75
+RRF_K = 60  # rank constant from the original RRF paper
+HYBRID_CANDIDATES = 20  # hits fetched from each retriever before fusion
+
+_TERM = re.compile(r"[a-z0-9_]+(?:[.\-+#][a-z0-9_]+)*[+#]*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how in is it its of on or "
+    "that the this to was were what when where which who why will with".split()
+)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def tokenize(text: str) -> list:
+    return [term for term in _TERM.findall(text.lower()) if term not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY, subject TEXT, text TEXT NOT NULL, length INTEGER NOT NULL,
+                owner_id TEXT
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, doc_id INTEGER NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta VALUES ('doc_count', 0), ('total_length', 0);
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(docs)")]
+        if "owner_id" not in columns:
+            # Index files created before per-owner documents
+            self._conn.execute("ALTER TABLE docs ADD COLUMN owner_id TEXT")
+        self._conn.commit()
+
+    def _meta(self) -> tuple:
+        rows = dict(self._conn.execute("SELECT key, value FROM meta"))
+        return rows["doc_count"], rows["total_length"]
+
+    def _remove(self, ids: list):
+        # Called with self._lock held, inside a transaction
+        placeholders = ",".join("?" * len(ids))
+        count, length = self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs WHERE id IN ({placeholders})", ids
+        ).fetchone()
+        if not count:
+            return
+        self._conn.execute(f"DELETE FROM postings WHERE doc_id IN ({placeholders})", ids)
+        self._conn.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", ids)
+        self._conn.execute("UPDATE meta SET value = value - ? WHERE key = 'doc_count'", (count,))
+        self._conn.execute("UPDATE meta SET value = value - ? WHERE key = 'total_length'", (length,))
+
+    def add(self, docs):
+        """Index (id, text, subject[, owner_id]) tuples; re-adding an id replaces it."""
+        docs = [
+            (int(doc[0]), doc[1], doc[2], str(doc[3]) if len(doc) > 3 and doc[3] is not None else None)
+            for doc in docs
+        ]
+        if not docs:
+            return
+        with self._lock, self._conn:
+            self._remove([doc[0] for doc in docs])
+            total_length = 0
+            for doc_id, text, subject, owner_id in docs:
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                total_length += length
+                self._conn.execute(
+                    "INSERT INTO docs (id, subject, text, length, owner_id) VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, subject, text, length, owner_id),
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in terms.items()],
+                )
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'doc_count'", (len(docs),))
+            self._conn.execute("UPDATE meta SET value = value + ? WHERE key = 'total_length'", (total_length,))
+
+    def remove(self, ids):
+        ids = [int(doc_id) for doc_id in ids]
+        if not ids:
+            return
+        with self._lock, self._conn:
+            for start in range(0, len(ids), 500):
+                self._remove(ids[start:start + 500])
+
+    def search(self, query: str, top_k: int = HYBRID_CANDIDATES, subject: str = None, owner_id=None) -> list:
+        """Best-first hits as dicts: {'id', 'score', 'text', 'subject'}; private chunks only for owner_id."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            doc_count, total_length = self._meta()
+            if not doc_count:
+                return []
+            placeholders = ",".join("?" * len(terms))
+            df = dict(self._conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ))
+            weights = [
+                (term, math.log(1 + (doc_count - n + 0.5) / (n + 0.5)))
+                for term, n in df.items()
+            ]
+            if not weights:
+                return []
+            avg_length = total_length / doc_count
+            values = ",".join("(?, ?)" for _ in weights)
+            params = [value for weight in weights for value in weight]
+            params += [K1 + 1, K1, B, B, avg_length]
+            if owner_id is None:
+                where = "WHERE d.owner_id IS NULL"
+            else:
+                where = "WHERE (d.owner_id IS NULL OR d.owner_id = ?)"
+                params.append(str(owner_id))
+            if subject is not None:
+                where += " AND d.subject = ?"
+                params.append(subject)
+            params.append(top_k)
+            rows = self._conn.execute(f"""
+                WITH q(term, idf) AS (VALUES {values})
+                SELECT d.id, SUM(q.idf * p.tf * ? / (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score,
+                       d.text, d.subject
+                FROM q
+                JOIN postings p ON p.term = q.term
+                JOIN docs d ON d.id = p.doc_id
+                {where}
+                GROUP BY d.id
+                ORDER BY score DESC
+                LIMIT ?
+            """, params).fetchall()
+        return [{"id": row[0], "score": row[1], "text": row[2], "subject": row[3]} for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            doc_count, total_length = self._meta()
+            terms = self._conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        return {
+            "documents": doc_count,
+            "terms": terms,
+            "avg_length": round(total_length / doc_count, 2) if doc_count else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def reciprocal_rank_fusion(result_lists, top_k: int, k: int = RRF_K) -> list:
+    """
+    Merge best-first hit lists by summing 1 / (k + rank) per id. The first
+    list's copy of a hit is kept, with 'score' replaced by the fused score.
+    """
+    fused, hits = {}, {}
+    for results in result_lists:
+        for rank, hit in enumerate(results, start=1):
+            fused[hit["id"]] = fused.get(hit["id"], 0.0) + 1.0 / (k + rank)
+            hits.setdefault(hit["id"], hit)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [{**hits[doc_id], "score": round(fused[doc_id], 6)} for doc_id in ranked]
+
+
+def index_path(db_path: str, collection: str) -> str:
+    """BM25 database path next to the Milvus database."""
+    return f"{os.path.splitext(db_path)[0]}.{collection}.bm25.sqlite"
+
+
+def init_bm25_index(db_path: str, collection: str) -> BM25Index:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = BM25Index(index_path(db_path, collection))
+            logging.info(f"BM25 index opened at {_index.path} ({_index.stats()['documents']} documents)")
+    return _index
+
+
+def get_bm25_index():
+    """Return the BM25 index, or None if hybrid retrieval is disabled."""
+    return _index
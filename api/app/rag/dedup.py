@@ -0,0 +1,250 @@
+"""
+Near-duplicate suppression for ingested chunks with MinHash + LSH.
+
+Each chunk is reduced to a set of word 3-gram shingles and a num_perm
+MinHash signature (the fraction of equal signature slots estimates the
+Jaccard similarity of two shingle sets). Signatures are split into bands;
+chunks sharing any band bucket are candidates, and a candidate is a
+duplicate when its estimated similarity is at least the threshold.
+
+Chunks are only compared within their namespace (the subject and owner
+they are stored under), since a subject-scoped search could never find a
+chunk skipped as a duplicate of one in another subject. Band keys are
+prefixed with a hash of the namespace, so namespaces share no buckets.
+
+The index is persisted next to the Milvus database, append-only like the
+embedding disk cache:
+
+    <db>.<collection>.minhash<num_perm>.sig   uint32 signature rows
+    <db>.<collection>.minhash<num_perm>.ids   one "<id>\t<namespace hash>" line
+                                              per row, plus "-<id>" lines for
+                                              deletions and "~<row>" lines for
+                                              rows whose insert failed
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import numpy as np
+
+SHINGLE_SIZE = 3
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_SEED = 1  # fixed, so signatures stay comparable across restarts
+_WORD = re.compile(r"\w+")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def namespace_key(namespace) -> str:
+    """Short stable hash of a dedup namespace."""
+    return hashlib.blake2b(str(namespace or "").encode("utf-8"), digest_size=8).hexdigest()
+
+
+def lsh_params(threshold: float, num_perm: int) -> tuple:
+    """
+    (bands, rows) whose S-curve midpoint (1/b)^(1/r) is closest to, but not
+    above, threshold - 0.1: erring towards more candidates keeps pairs just
+    over the threshold from being missed, and candidates are verified anyway.
+    """
+    target = threshold - 0.1
+    best = (num_perm, 1)
+    best_point = 0.0
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        point = (1.0 / bands) ** (1.0 / rows)
+        if best_point < point <= target:
+            best, best_point = (bands, rows), point
+    return best
+
+
+class MinHashLSH:
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, path: str = None):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        generator = np.random.RandomState(_SEED)
+        self._a = generator.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._signatures = []  # row -> signature
+        self._ids = []  # row -> Milvus id (None when unknown)
+        self._namespaces = []  # row -> namespace_key()
+        self._removed = set()  # rows whose documents were deleted
+        self._rows_by_id = {}
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._unsaved = 0  # rows added since the last save()
+        self._removals = []  # ids deleted since the last save()
+        self._discarded = []  # rows rolled back since the last save()
+        self.skipped = 0
+        self.checked = 0
+        self.path = path
+        if path:
+            self._load()
+
+    def signature(self, text: str) -> np.ndarray:
+        grams = shingles(text)
+        if not grams:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") for g in grams],
+            dtype=np.uint64,
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray, namespace: str):
+        prefix = bytes.fromhex(namespace)
+        for band in range(self.bands):
+            yield band, prefix + signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def find_duplicate(self, signature: np.ndarray, namespace: str = None):
+        """Row index of a near-duplicate in the namespace (a namespace_key()), or None. Call with self._lock held."""
+        candidates = set()
+        for band, key in self._band_keys(signature, namespace or namespace_key(None)):
+            candidates.update(self._buckets[band].get(key, ()))
+        best, best_similarity = None, self.threshold
+        for row in candidates - self._removed:
+            similarity = float(np.mean(self._signatures[row] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = row, similarity
+        return best
+
+    def _add(self, signature: np.ndarray, doc_id=None, namespace: str = None):
+        row = len(self._signatures)
+        namespace = namespace or namespace_key(None)
+        self._signatures.append(signature)
+        self._ids.append(doc_id)
+        self._namespaces.append(namespace)
+        if doc_id is not None:
+            self._rows_by_id.setdefault(doc_id, []).append(row)
+        for band, key in self._band_keys(signature, namespace):
+            self._buckets[band].setdefault(key, []).append(row)
+        return row
+
+    def add_if_new(self, text: str, doc_id=None, namespace=None):
+        """
+        Index text and return its row, or None if it near-duplicates a chunk
+        already indexed in the same namespace (e.g. subject).
+        """
+        signature = self.signature(text)
+        namespace = namespace_key(namespace)
+        with self._lock:
+            self.checked += 1
+            if self.find_duplicate(signature, namespace) is not None:
+                self.skipped += 1
+                return None
+            row = self._add(signature, doc_id, namespace)
+            self._unsaved += 1
+            return row
+
+    def check_and_add(self, text: str, doc_id=None, namespace=None) -> bool:
+        """True if text is new (and is now indexed), False if it near-duplicates an indexed chunk."""
+        return self.add_if_new(text, doc_id, namespace) is not None
+
+    def remove_ids(self, ids):
+        """Forget the signatures of deleted documents."""
+        ids = set(ids)
+        with self._lock:
+            for doc_id in ids:
+                self._removed.update(self._rows_by_id.get(doc_id, ()))
+            self._removals.extend(ids)
+
+    def rollback(self, rows):
+        """Forget the given rows from add_if_new() (their insert failed); other ingests' rows are kept."""
+        rows = [row for row in rows if row is not None]
+        with self._lock:
+            self._removed.update(rows)
+            self._discarded.extend(rows)
+
+    def save(self):
+        """Append new rows and deletions to the index files."""
+        with self._lock:
+            if not self.path or (not self._unsaved and not self._removals and not self._discarded):
+                self._unsaved = 0
+                self._discarded = []
+                return
+            start = len(self._signatures) - self._unsaved
+            with open(f"{self.path}.sig", "ab") as f:
+                for signature in self._signatures[start:]:
+                    f.write(signature.tobytes())
+            with open(f"{self.path}.ids", "a") as f:
+                for doc_id, namespace in zip(self._ids[start:], self._namespaces[start:]):
+                    f.write(f"{'' if doc_id is None else doc_id}\t{namespace}\n")
+                for doc_id in self._removals:
+                    f.write(f"-{doc_id}\n")
+                for row in self._discarded:
+                    f.write(f"~{row}\n")
+            self._unsaved = 0
+            self._removals = []
+            self._discarded = []
+
+    def _load(self):
+        sig_path, ids_path = f"{self.path}.sig", f"{self.path}.ids"
+        if not (os.path.exists(sig_path) and os.path.exists(ids_path)):
+            return
+        signatures = np.fromfile(sig_path, dtype=np.uint32)
+        signatures = signatures[:len(signatures) // self.num_perm * self.num_perm].reshape(-1, self.num_perm)
+        rows = iter(signatures)
+        with open(ids_path) as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith("-"):
+                    # Deletion: applies to the rows indexed before it
+                    self._removed.update(self._rows_by_id.get(int(line[1:]), ()))
+                    continue
+                if line.startswith("~"):
+                    self._removed.add(int(line[1:]))
+                    continue
+                signature = next(rows, None)
+                if signature is None:
+                    break
+                doc_id, _, namespace = line.partition("\t")
+                if len(namespace) != 16:
+                    namespace = namespace_key(namespace or None)  # rows saved before namespaces
+                self._add(signature, int(doc_id) if doc_id else None, namespace)
+        if len(signatures) > len(self._signatures):
+            # A crash between the two appends left signature rows without ids
+            os.truncate(sig_path, len(self._signatures) * self.num_perm * 4)
+        logging.info(f"MinHash dedup index loaded from {self.path} ({len(self._signatures)} chunks)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "num_perm": self.num_perm,
+                "bands": self.bands,
+                "rows": self.rows,
+                "indexed": len(self._signatures) - len(self._removed),
+                "checked": self.checked,
+                "skipped": self.skipped,
+            }
+
+
+def index_path(db_path: str, collection: str, num_perm: int) -> str:
+    """Index file prefix next to the Milvus database."""
+    base = os.path.splitext(db_path)[0]
+    return f"{base}.{collection}.minhash{num_perm}"
+
+
+def init_dedup_index(db_path: str, collection: str, threshold: float = 0.85, num_perm: int = 128) -> MinHashLSH:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = MinHashLSH(threshold=threshold, num_perm=num_perm, path=index_path(db_path, collection, num_perm))
+            logging.info(f"MinHash dedup enabled (threshold={threshold}, bands={_index.bands}x{_index.rows})")
+    return _index
+
+
+def get_dedup_index():
+    """Return the dedup index, or None if it was not initialized."""
+    return _index
@@ -0,0 +1,140 @@
+"""
+Embedding backends.
+
+    torch  SentenceTransformer (PyTorch), the reference implementation
+    onnx   ONNX Runtime on an exported copy of the same transformer, with
+           the same tokenizer, mean pooling and normalization, so it
+           produces the same 384-dim vectors; optionally int8-quantized
+
+Both expose the subset of SentenceTransformer.encode() the app uses, so
+the cache, batcher and ingestion code do not care which one is loaded.
+Export, verify and benchmark the ONNX model with `python embed_onnx.py`.
+"""
+import json
+import logging
+import os
+import numpy as np
+
+BACKENDS = ("torch", "onnx")
+ONNX_CONFIG_FILE = "embed_config.json"
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+
+
+class TorchEmbeddingBackend:
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.name = model_name
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def count_tokens(self, texts: list) -> list:
+        """Word-piece counts without special tokens (not truncated)."""
+        return [len(ids) for ids in self.model.tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False, **kwargs):
+        return self.model.encode(
+            sentences,
+            batch_size=batch_size,
+            normalize_embeddings=normalize_embeddings,
+            convert_to_numpy=convert_to_numpy,
+            show_progress_bar=show_progress_bar,
+            **kwargs,
+        )
+
+
+class OnnxEmbeddingBackend:
+    """
+    Runs an exported sentence-transformer with ONNX Runtime on CPU.
+    onnx_dir holds model.onnx / model_int8.onnx, tokenizer.json and
+    embed_config.json (written by embed_onnx.py export).
+    """
+
+    def __init__(self, onnx_dir: str, quantized: bool = False, num_threads: int = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(onnx_dir, ONNX_CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        model_file = ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE
+        model_path = os.path.join(onnx_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found; run `python embed_onnx.py export` first.")
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+        tokenizer_path = os.path.join(onnx_dir, "tokenizer.json")
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config.get("pad_token_id", 0))
+        # Separate copy without truncation or padding, so counts match the torch backend
+        self._counting_tokenizer = Tokenizer.from_file(tokenizer_path)
+        self._counting_tokenizer.no_truncation()
+        self._counting_tokenizer.no_padding()
+        self.normalize = self.config.get("normalize", False)
+        self.dim = self.config["dimension"]
+        self.name = f"{self.config['model_name']}:onnx{'-int8' if quantized else ''}"
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def count_tokens(self, texts: list) -> list:
+        """Word-piece counts without special tokens (not truncated)."""
+        return [len(e.ids) for e in self._counting_tokenizer.encode_batch(list(texts), add_special_tokens=False)]
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+
+        # Sort by length so each batch pads as little as possible, then restore order
+        order = np.argsort([-len(text) for text in texts])
+        output = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            indices = order[start:start + batch_size]
+            output[indices] = self._encode_batch([texts[i] for i in indices])
+
+        if self.normalize or normalize_embeddings:
+            output /= np.maximum(np.linalg.norm(output, axis=1, keepdims=True), 1e-12)
+        return output[0] if single else output
+
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real (non-padding) tokens, as sentence-transformers does
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        return summed / np.maximum(mask.sum(axis=1), 1e-9)
+
+
+def load_embed_backend(model_name: str, backend: str = "torch", onnx_dir: str = None,
+                       quantized: bool = False, num_threads: int = None):
+    if backend == "torch":
+        return TorchEmbeddingBackend(model_name)
+    if backend == "onnx":
+        if not onnx_dir:
+            raise RuntimeError("EMBED_ONNX_DIR is required for the onnx embedding backend.")
+        model = OnnxEmbeddingBackend(onnx_dir, quantized=quantized, num_threads=num_threads)
+        if model.config.get("model_name") != model_name:
+            logging.warning(
+                f"ONNX embedding model in {onnx_dir} was exported from "
+                f"'{model.config.get('model_name')}', not '{model_name}'"
+            )
+        return model
+    raise RuntimeError(f"Unknown embedding backend '{backend}'. Use one of {BACKENDS}.")
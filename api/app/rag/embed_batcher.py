@@ -0,0 +1,115 @@
+"""
+Micro-batching for single-text embedding requests.
+
+Concurrent chat requests each need one query embedding. Instead of one
+forward pass per request, callers submit their text and get a Future; a
+background thread takes the first waiting text, keeps collecting for up to
+max_wait_ms or until max_batch texts are waiting, encodes them in one call
+and resolves every Future. A lone request pays at most max_wait_ms extra.
+"""
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+import time
+import numpy as np
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode_fn, max_batch: int = 32, max_wait_ms: float = 5.0):
+        """encode_fn(list_of_texts) -> array with one row per text."""
+        self._encode = encode_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.total_wait = 0.0
+        self.largest_batch = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def encode(self, text: str, timeout: float = None) -> np.ndarray:
+        return self.submit(text).result(timeout=timeout)
+
+    def shutdown(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "avg_wait_ms": round(1000 * self.total_wait / self.items, 2) if self.items else 0.0,
+                "queued": self._queue.qsize(),
+            }
+
+    def _collect(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # Take whatever is already queued even when the wait is over
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            started = time.monotonic()
+            try:
+                vectors = self._encode([text for text, _, _ in batch])
+                for (_, future, _), vector in zip(batch, vectors):
+                    future.set_result(np.asarray(vector, dtype=np.float32))
+            except Exception as e:
+                logging.error(f"Embedding batch of {len(batch)} failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self.total_wait += sum(started - enqueued for _, _, enqueued in batch)
+
+
+def init_embed_batcher(encode_fn, max_batch: int = 32, max_wait_ms: float = 5.0) -> EmbeddingBatcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = EmbeddingBatcher(encode_fn, max_batch=max_batch, max_wait_ms=max_wait_ms)
+            _batcher.start()
+            logging.info(f"Embedding batcher started (max_batch={max_batch}, max_wait_ms={max_wait_ms})")
+    return _batcher
+
+
+def get_embed_batcher():
+    """Return the embedding batcher, or None if it was not started."""
+    return _batcher
@@ -0,0 +1,242 @@
+"""
+Two-tier cache for sentence embeddings.
+
+Entries are keyed by (embedding model name, SHA-256 of the text) and hold
+the raw float32 vector; normalization is applied on the way out, so one
+entry serves both normalized and raw callers.
+
+    memory  LRU of the most recently used vectors
+    disk    optional append-only store that survives restarts: a
+            memory-mapped float32 matrix (<name>.f32) plus a key index
+            (<name>.keys, one hex key per line, line n = matrix row n)
+
+Several worker processes can share one disk tier: appends take an
+exclusive flock on <name>.lock, pick up the keys other processes appended,
+write the row, then append and flush its key, so every row number is
+assigned exactly once. A row is written to the matrix before its key is
+appended to the index, so a crash can at worst lose the last entry, never
+map a key to a wrong row. Lookups that miss re-read keys appended since.
+The disk tier stops accepting new entries once it reaches its capacity; an
+existing matrix smaller than a raised capacity is grown on open.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import threading
+import numpy as np
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row (or a single vector)."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class DiskEmbeddingStore:
+    """Append-only memmapped float32 matrix plus a key -> row index."""
+
+    def __init__(self, directory: str, model_name: str, dim: int, capacity: int = 100000):
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        base = os.path.join(directory, f"{slug}-{dim}")
+        self.dim = dim
+        self.capacity = capacity
+        self.vectors_path = f"{base}.f32"
+        self.keys_path = f"{base}.keys"
+        self.lock_path = f"{base}.lock"
+        self._index = {}
+        self._rows = 0  # key lines read so far; line n is matrix row n
+        self._offset = 0  # bytes of the keys file read so far
+        self._full_logged = False
+        with self._file_lock():
+            # Under the lock, so two workers starting together never both create the matrix
+            if os.path.exists(self.vectors_path):
+                size = capacity * dim * 4
+                if os.path.getsize(self.vectors_path) < size:
+                    # Capacity was raised since the matrix was created; existing rows keep their place
+                    logging.info(f"Growing embedding disk cache {self.vectors_path} to {capacity} rows")
+                    os.truncate(self.vectors_path, size)
+                mode = "r+"
+            else:
+                mode = "w+"
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(capacity, dim))
+            open(self.keys_path, "a").close()
+            self._refresh()
+
+    def __len__(self):
+        return len(self._index)
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Index keys other processes appended since the last read."""
+        if os.path.getsize(self.keys_path) == self._offset:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # being written, or cut short by a crash
+                self._offset += len(line)
+                key = line.decode("ascii").strip()
+                if key and self._rows < self.capacity:
+                    self._index.setdefault(key, self._rows)
+                self._rows += 1
+
+    def get(self, key: str):
+        row = self._index.get(key)
+        if row is None:
+            self._refresh()
+            row = self._index.get(key)
+            if row is None:
+                return None
+        return np.array(self._vectors[row])
+
+    def put(self, key: str, vector: np.ndarray) -> bool:
+        if key in self._index:
+            return True
+        with self._file_lock():
+            self._refresh()
+            if key in self._index:
+                return True
+            row = self._rows
+            if row >= self.capacity:
+                if not self._full_logged:
+                    logging.warning(f"Embedding disk cache {self.vectors_path} is full ({self.capacity} rows)")
+                    self._full_logged = True
+                return False
+            if os.path.getsize(self.keys_path) != self._offset:
+                # A partial key line left by a crashed writer; nobody else writes while we hold the lock
+                os.truncate(self.keys_path, self._offset)
+            self._vectors[row] = vector
+            line = f"{key}\n".encode("ascii")
+            with open(self.keys_path, "ab") as f:
+                f.write(line)
+            self._index[key] = row
+            self._rows += 1
+            self._offset += len(line)
+        return True
+
+    def flush(self):
+        self._vectors.flush()
+
+    def close(self):
+        self.flush()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, max_memory_entries: int = 10000, disk_store: DiskEmbeddingStore = None):
+        self.model_name = model_name
+        self.max_memory_entries = max_memory_entries
+        self.disk = disk_store
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+            if self.disk is not None:
+                vector = self.disk.get(key)
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector: np.ndarray):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            if self.disk is not None:
+                self.disk.put(key, vector)
+
+    def encode(self, model, texts: list, normalize: bool = False, batch_size: int = 64) -> np.ndarray:
+        """Embed texts with model, encoding only the ones not already cached."""
+        keys = [self.key(text) for text in texts]
+        vectors = [self.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Encode each distinct missing text once
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = model.encode(unique, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
+            by_text = {}
+            for text, vector in zip(unique, encoded):
+                self.put(self.key(text), vector)
+                by_text[text] = np.asarray(vector, dtype=np.float32)
+            for i in missing:
+                vectors[i] = by_text[texts[i]]
+            if self.disk is not None:
+                with self._lock:
+                    self.disk.flush()
+
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        if normalize and len(matrix):
+            matrix = normalize_rows(matrix)
+        return matrix
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "model": self.model_name,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self.disk) if self.disk is not None else None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, vector: np.ndarray):
+        # Called with self._lock held
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+
+def init_embedding_cache(model_name: str, dim: int, max_memory_entries: int = 10000,
+                         disk_dir: str = None, disk_capacity: int = 100000) -> EmbeddingCache:
+    """Create the process-wide embedding cache; disk_dir=None keeps it memory-only."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            disk_store = None
+            if disk_dir:
+                try:
+                    disk_store = DiskEmbeddingStore(disk_dir, model_name, dim, capacity=disk_capacity)
+                    logging.info(f"Embedding disk cache opened at {disk_store.vectors_path} ({len(disk_store)} entries)")
+                except Exception as e:
+                    logging.warning(f"Embedding disk cache in {disk_dir} unavailable, falling back to memory only: {e}")
+            _cache = EmbeddingCache(model_name, max_memory_entries=max_memory_entries, disk_store=disk_store)
+    return _cache
+
+
+def get_embedding_cache():
+    """Return the embedding cache, or None if it was not initialized."""
+    return _cache
@@ -0,0 +1,259 @@
+"""
+Streaming document ingestion.
+
+Every stage is a generator, so a whole textbook flows through in bounded
+memory (one read block, one chunk window and one embed/insert batch):
+
+    read_file / read_stream   text in fixed-size blocks, decoded incrementally
+    split_units               paragraphs split into sentences, carried across blocks
+    chunk_units               chunks of at most chunk_tokens embedding-model
+                              tokens, each repeating ~overlap_tokens of the last
+    to_documents              Milvus rows with subject / source / chunk metadata
+                              (and owner_id for private uploads)
+
+Chunk ids derive from the source key (uploader and source name) and the
+chunk index, so re-ingesting a source replaces its earlier chunks, which
+are deleted first, and two users' files of the same name never collide.
+
+ingest_stream() feeds the rows to extensions.ingest_documents(), which
+batch-embeds and bulk-inserts them. Use it via POST /api/learning/documents/ingest
+or `python ingest_docs.py`.
+"""
+from collections import deque
+import codecs
+import hashlib
+import logging
+import re
+import time
+from app import extensions
+
+READ_BLOCK_SIZE = 64 * 1024
+# A paragraph with no blank line for this long is split at its last sentence
+MAX_BUFFERED_CHARS = 256 * 1024
+COUNT_BATCH_SIZE = 64
+DEFAULT_CHUNK_TOKENS = 200
+DEFAULT_OVERLAP_TOKENS = 40
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[A-Z0-9#*-])")
+
+
+def read_file(path: str, block_size: int = READ_BLOCK_SIZE):
+    """Yield a text/markdown file block by block."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            yield block
+
+
+def read_stream(stream, block_size: int = READ_BLOCK_SIZE):
+    """Yield text blocks from a binary stream (e.g. an uploaded file), decoding UTF-8 across block boundaries."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        data = stream.read(block_size)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def read_text(text: str, block_size: int = READ_BLOCK_SIZE):
+    """Yield an in-memory string in blocks, so request bodies go through the same stages."""
+    for start in range(0, len(text), block_size):
+        yield text[start:start + block_size]
+
+
+def _sentences(paragraph: str) -> list:
+    paragraph = " ".join(paragraph.split())
+    if not paragraph:
+        return []
+    return [s for s in _SENTENCE_END.split(paragraph) if s]
+
+
+def split_units(blocks):
+    """Yield sentence-sized units; a paragraph split across blocks is carried over to the next one."""
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        paragraphs = _PARAGRAPH_BREAK.split(buffer)
+        buffer = paragraphs.pop()  # may be incomplete
+        for paragraph in paragraphs:
+            yield from _sentences(paragraph)
+        if len(buffer) > MAX_BUFFERED_CHARS:
+            sentences = _sentences(buffer)
+            buffer = sentences.pop() if sentences else ""
+            yield from sentences
+    yield from _sentences(buffer)
+
+
+def token_counter():
+    """count_tokens(texts) -> token counts, using the embedding model's tokenizer when loaded."""
+    model = extensions.embed_model
+    if model is not None and hasattr(model, "count_tokens"):
+        return model.count_tokens
+    # Rough word-piece estimate when no tokenizer is available
+    return lambda texts: [int(len(text.split()) * 4 / 3) + 1 for text in texts]
+
+
+def _split_long(text: str, tokens: int, max_tokens: int) -> list:
+    """Split a unit longer than max_tokens into word windows of about max_tokens each."""
+    words = text.split()
+    per_piece = max(1, int(len(words) * max_tokens / tokens))
+    pieces = []
+    for start in range(0, len(words), per_piece):
+        piece = words[start:start + per_piece]
+        pieces.append((" ".join(piece), max(1, int(tokens * len(piece) / len(words)))))
+    return pieces
+
+
+def chunk_units(units, count_tokens=None, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                overlap_tokens: int = DEFAULT_OVERLAP_TOKENS):
+    """
+    Greedily pack units into chunks of at most chunk_tokens tokens. Each new
+    chunk starts with the trailing units of the previous one, up to
+    overlap_tokens, so a fact on a chunk boundary is retrievable from both.
+    """
+    count_tokens = count_tokens or token_counter()
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+    window = deque()  # (text, tokens)
+    size = 0
+    fresh = False  # window holds units not yet emitted
+
+    for group in extensions._batched(units, COUNT_BATCH_SIZE):
+        for unit, tokens in zip(group, count_tokens(group)):
+            pieces = [(unit, tokens)] if tokens <= chunk_tokens else _split_long(unit, tokens, chunk_tokens)
+            for text, n in pieces:
+                if window and size + n > chunk_tokens:
+                    if fresh:
+                        yield " ".join(t for t, _ in window)
+                        fresh = False
+                    kept, kept_size = deque(), 0
+                    for t, k in reversed(window):
+                        if kept_size + k > overlap_tokens:
+                            break
+                        kept.appendleft((t, k))
+                        kept_size += k
+                    window, size = kept, kept_size
+                    while window and size + n > chunk_tokens:
+                        size -= window.popleft()[1]
+                window.append((text, n))
+                size += n
+                fresh = True
+
+    if fresh:
+        yield " ".join(t for t, _ in window)
+
+
+def source_key(source: str, uploader_id=None) -> str:
+    """Identity of an ingested source; the same file name from two uploaders is two sources."""
+    return source if uploader_id is None else f"{uploader_id}:{source}"
+
+
+def chunk_id(source: str, index: int) -> int:
+    """Deterministic positive int64 id for chunk index of source."""
+    digest = hashlib.sha1(f"{source}#{index}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def to_documents(chunks, subject: str = "general", source: str = None, owner_id=None, uploader_id=None):
+    """Turn chunks into documents for ingest_documents(); owner_id makes them private."""
+    key = source_key(source, uploader_id) if source else None
+    for index, text in enumerate(chunks):
+        doc = {"text": text, "subject": subject, "chunk": index}
+        if source:
+            doc["id"] = chunk_id(key, index)
+            doc["source"] = source
+            doc["source_key"] = key
+        if owner_id is not None:
+            doc["owner_id"] = str(owner_id)
+        yield doc
+
+
+def chunk_text(text: str, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+               overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> list:
+    """Chunk an in-memory string (no indexing)."""
+    return list(chunk_units(split_units(read_text(text)), chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens))
+
+
+def spread_sections(chunks: list, sections: int, chunks_per_section: int = 2) -> list:
+    """Pick up to `sections` runs of consecutive chunks spread evenly over the document."""
+    if not chunks or sections <= 0:
+        return []
+    sections = min(sections, len(chunks))
+    step = len(chunks) / sections
+    return [
+        " ".join(chunks[int(i * step):int(i * step) + chunks_per_section])
+        for i in range(sections)
+    ]
+
+
+def ingest_options(config) -> dict:
+    """Ingestion keyword arguments from the app config."""
+    return {
+        "chunk_tokens": config.get("INGEST_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS),
+        "overlap_tokens": config.get("INGEST_CHUNK_OVERLAP", DEFAULT_OVERLAP_TOKENS),
+        "batch_size": config.get("INGEST_EMBED_BATCH_SIZE", extensions.EMBED_BATCH_SIZE),
+        "insert_batch_size": config.get("INGEST_INSERT_BATCH_SIZE", extensions.INSERT_BATCH_SIZE),
+        "normalize": config.get("INGEST_NORMALIZE", False),
+    }
+
+
+def ingest_stream(blocks, subject: str = "general", source: str = None, collection_name: str = None,
+                  chunk_tokens: int = DEFAULT_CHUNK_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                  batch_size: int = None, insert_batch_size: int = None, normalize: bool = False,
+                  progress_callback=None, owner_id=None, uploader_id=None) -> dict:
+    """
+    Chunk, embed and insert a stream of text blocks end to end.
+    Chunks from an earlier ingest of the same source (by the same uploader,
+    which defaults to owner_id) are deleted first. Near-duplicate chunks are
+    skipped when the dedup index is enabled. With owner_id the chunks are
+    private to that user.
+    Returns {'source', 'subject', 'chunks', 'skipped', 'batches', 'seconds'}.
+    """
+    started = time.monotonic()
+    uploader_id = uploader_id if uploader_id is not None else owner_id
+    if source:
+        extensions.delete_documents(
+            f"source_key == {extensions.filter_string(source_key(source, uploader_id))}",
+            collection_name=collection_name,
+        )
+    docs = to_documents(
+        chunk_units(split_units(blocks), chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens),
+        subject=subject,
+        source=source,
+        owner_id=owner_id,
+        uploader_id=uploader_id,
+    )
+    result = extensions.ingest_documents(
+        docs,
+        collection_name=collection_name,
+        batch_size=batch_size or extensions.EMBED_BATCH_SIZE,
+        insert_batch_size=insert_batch_size or extensions.INSERT_BATCH_SIZE,
+        normalize=normalize,
+        progress_callback=progress_callback,
+    )
+    seconds = time.monotonic() - started
+    logging.info(
+        f"Ingested '{source}' ({subject}): {result['insert_count']} chunks, "
+        f"{result['skipped']} near-duplicates skipped, in {seconds:.2f}s"
+    )
+    return {
+        "source": source,
+        "subject": subject,
+        "chunks": result["insert_count"],
+        "skipped": result["skipped"],
+        "batches": result["batches"],
+        "seconds": round(seconds, 3),
+    }
+
+
+def ingest_file(path: str, subject: str = "general", source: str = None, **kwargs) -> dict:
+    """Ingest a text/markdown file; source defaults to the path."""
+    return ingest_stream(read_file(path), subject=subject, source=source or path, **kwargs)
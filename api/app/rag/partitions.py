@@ -0,0 +1,113 @@
+"""
+Subject / owner partitions for the vector collection.
+
+Documents are inserted into a partition per subject, created on first use:
+
+    s_<subject slug>_<hash>           shared material for the subject
+    s_<subject slug>_<hash>__u<owner> one user's private material for it
+
+A search scoped to a subject only touches that subject's shared partition,
+the caller's private one and _default (documents inserted before
+partitioning, or after the partition limit was reached); the subject filter
+still applies, so _default stays correct. An unscoped search scans the
+whole collection. Either way the owner filter (app.extensions.owner_filter)
+keeps other users' private rows out, and it does the same job alone when
+the collection is not partitioned.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+
+DEFAULT_PARTITION = "_default"
+MAX_PARTITIONS = 1000  # Milvus allows 1024 per collection by default
+REFRESH_SECONDS = 30  # re-list partitions other processes may have created
+
+_manager = None
+
+
+def _slug(value) -> str:
+    return re.sub(r"[^0-9a-z]+", "_", str(value).lower()).strip("_")
+
+
+def partition_name(subject: str = None, owner_id=None) -> str:
+    subject = subject or "general"
+    digest = hashlib.sha1(subject.encode("utf-8")).hexdigest()[:8]
+    name = f"s_{_slug(subject)[:64]}_{digest}"
+    if owner_id is not None:
+        name += f"__u{_slug(owner_id)[:64]}"
+    return name
+
+
+class PartitionManager:
+    def __init__(self, client, collection: str, max_partitions: int = MAX_PARTITIONS):
+        self.client = client
+        self.collection = collection
+        self.max_partitions = max_partitions
+        self._lock = threading.Lock()
+        self._known = None
+        self._listed_at = 0.0
+        self.overflow = 0
+
+    def _partitions(self) -> set:
+        # Called with self._lock held
+        if self._known is None or time.monotonic() - self._listed_at > REFRESH_SECONDS:
+            self._known = set(self.client.list_partitions(collection_name=self.collection))
+            self._listed_at = time.monotonic()
+        return self._known
+
+    def ensure(self, subject: str = None, owner_id=None) -> str:
+        """Partition for (subject, owner), created if needed; _default for shared rows once the limit is hit."""
+        name = partition_name(subject, owner_id)
+        with self._lock:
+            known = self._partitions()
+            if name in known:
+                return name
+            if len(known) >= self.max_partitions:
+                if owner_id is not None:
+                    # _default is searched by everyone, so private rows must not land there
+                    raise ValueError(f"Partition limit ({self.max_partitions}) reached; cannot store private documents")
+                self.overflow += 1
+                if self.overflow == 1:
+                    logging.warning(f"Partition limit ({self.max_partitions}) reached; new subjects go to {DEFAULT_PARTITION}")
+                return DEFAULT_PARTITION
+            try:
+                self.client.create_partition(collection_name=self.collection, partition_name=name)
+                logging.info(f"Created partition '{name}' for subject '{subject}'")
+            except Exception as e:
+                # Another process may have created it first
+                if "exist" not in str(e).lower():
+                    raise
+            known.add(name)
+            return name
+
+    def for_search(self, subject: str, owner_id=None) -> list:
+        """Partitions a search scoped to subject, for owner, has to look at."""
+        shared = partition_name(subject)
+        with self._lock:
+            known = self._partitions()
+            names = [name for name in (shared, partition_name(subject, owner_id)) if name in known]
+        return sorted(set(names)) + [DEFAULT_PARTITION]
+
+    def stats(self) -> dict:
+        with self._lock:
+            known = self._partitions()
+            return {
+                "partitions": len(known),
+                "private": sum(1 for name in known if "__u" in name),
+                "max_partitions": self.max_partitions,
+                "overflow_inserts": self.overflow,
+            }
+
+
+def init_partitions(client, collection: str, max_partitions: int = MAX_PARTITIONS) -> PartitionManager:
+    global _manager
+    if _manager is None:
+        _manager = PartitionManager(client, collection, max_partitions=max_partitions)
+    return _manager
+
+
+def get_partitions():
+    """Return the partition manager, or None if the collection is not partitioned."""
+    return _manager
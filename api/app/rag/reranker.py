@@ -0,0 +1,109 @@
+"""
+Cross-encoder reranking for retrieved chunks.
+
+A cross-encoder reads the query and a chunk together, so it ranks far more
+precisely than the bi-encoder used for search, at the cost of one forward
+pass per candidate. Candidates are scored in batches on CPU under a
+latency budget: before each batch the expected batch time (a running
+average) is checked against what is left of the budget, and once it would
+overrun, the remaining candidates keep their retrieval order behind the
+reranked ones.
+"""
+import logging
+import threading
+import time
+
+DEFAULT_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = DEFAULT_MODEL, batch_size: int = 16, max_length: int = 256):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._batch_seconds = None  # running average of one batch
+        self.calls = 0
+        self.skipped = 0
+        self.truncated = 0
+        self.scored = 0
+        self.total_seconds = 0.0
+
+    def rerank(self, query: str, hits: list, top_k: int, deadline: float = None) -> tuple:
+        """
+        Return (best top_k hits, info). deadline is a time.monotonic() value;
+        None means no budget. Reranked hits carry 'rerank_score'.
+        """
+        started = time.monotonic()
+        if deadline is not None and started >= deadline:
+            with self._lock:
+                self.calls += 1
+                self.skipped += 1
+            return hits[:top_k], {"reranked": 0, "skipped": True, "truncated": False, "ms": 0.0}
+
+        scores = []
+        for start in range(0, len(hits), self.batch_size):
+            with self._lock:
+                expected = self._batch_seconds or 0.0
+            if deadline is not None and time.monotonic() + expected > deadline:
+                break
+            batch_started = time.monotonic()
+            batch = hits[start:start + self.batch_size]
+            scores.extend(self.model.predict(
+                [(query, hit["text"]) for hit in batch],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            ))
+            batch_seconds = time.monotonic() - batch_started
+            with self._lock:
+                self._batch_seconds = batch_seconds if self._batch_seconds is None else (
+                    0.8 * self._batch_seconds + 0.2 * batch_seconds
+                )
+
+        reranked = sorted(
+            ({**hit, "rerank_score": float(score)} for hit, score in zip(hits, scores)),
+            key=lambda hit: hit["rerank_score"],
+            reverse=True,
+        )
+        seconds = time.monotonic() - started
+        truncated = len(scores) < len(hits)
+        with self._lock:
+            self.calls += 1
+            self.scored += len(scores)
+            self.total_seconds += seconds
+            if truncated:
+                self.truncated += 1
+        if truncated:
+            logging.info(f"Reranking truncated by latency budget: {len(scores)}/{len(hits)} candidates scored")
+        info = {"reranked": len(scores), "skipped": False, "truncated": truncated, "ms": round(1000 * seconds, 2)}
+        return (reranked + hits[len(scores):])[:top_k], info
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model_name,
+                "calls": self.calls,
+                "skipped": self.skipped,
+                "truncated": self.truncated,
+                "candidates_scored": self.scored,
+                "avg_ms": round(1000 * self.total_seconds / (self.calls - self.skipped), 2) if self.calls > self.skipped else 0.0,
+                "avg_batch_ms": round(1000 * self._batch_seconds, 2) if self._batch_seconds else None,
+            }
+
+
+def init_reranker(model_name: str = DEFAULT_MODEL, batch_size: int = 16, max_length: int = 256) -> CrossEncoderReranker:
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker(model_name, batch_size=batch_size, max_length=max_length)
+            logging.info(f"Cross-encoder reranker '{model_name}' loaded (batch_size={batch_size})")
+    return _reranker
+
+
+def get_reranker():
+    """Return the reranker, or None if reranking is disabled."""
+    return _reranker
@@ -1,21 +1,119 @@
-from app.extensions import init_embed_model, search_vectors  # Your embedding model init
-from typing import Optional
+"""
+Two-stage retrieval: over-fetch candidates, then rerank down to top_k.
 
-def fetch_context(query: str, patient_id: Optional[int] = None, top_k: int = 3) -> str:
+Stage one is hybrid_search() (vector + BM25) asking for `candidates` hits;
+stage two is the cross-encoder reranker, bounded by a per-request latency
+budget that counts from the start of retrieval. Without a reranker the
+first stage's top_k is returned as-is. retrieve_many() runs the first stage
+for many queries in one batch and reranks each query's candidates the same
+way; the whole batch shares one latency budget.
+"""
+from flask import current_app, has_app_context
+from app.extensions import hybrid_search, hybrid_search_many
+from app.rag.bm25 import HYBRID_CANDIDATES, RRF_K
+from app.rag.reranker import get_reranker
+import logging
+import time
+
+RERANK_CANDIDATES = 20
+RERANK_BUDGET_MS = 150
+
+
+def _setting(key: str, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def retrieve(query: str, top_k: int = 5, subject: str = None, candidates: int = None,
+             budget_ms: float = None, owner_id=None) -> list:
+    """
+    Best top_k hits ({'id', 'score', 'text', 'subject'[, 'rerank_score']}) for
+    query among the shared documents and owner_id's private ones.
     """
-    Retrieve relevant EHR documents as LLM context using vector-based similarity search.
-    If patient_id is provided, restrict search to that patient's docs.
+    started = time.monotonic()
+    reranker = get_reranker()
+    if reranker is None:
+        return hybrid_search(
+            query,
+            top_k=top_k,
+            subject=subject,
+            candidates=_setting("RAG_HYBRID_CANDIDATES", HYBRID_CANDIDATES),
+            rrf_k=_setting("RAG_RRF_K", RRF_K),
+            owner_id=owner_id,
+        )
+
+    candidates = max(top_k, candidates or _setting("RAG_RERANK_CANDIDATES", RERANK_CANDIDATES))
+    budget_ms = budget_ms if budget_ms is not None else _setting("RAG_RERANK_BUDGET_MS", RERANK_BUDGET_MS)
+    hits = hybrid_search(
+        query,
+        top_k=candidates,
+        subject=subject,
+        candidates=max(candidates, _setting("RAG_HYBRID_CANDIDATES", HYBRID_CANDIDATES)),
+        rrf_k=_setting("RAG_RRF_K", RRF_K),
+        owner_id=owner_id,
+    )
+    return _rerank(reranker, query, hits, top_k, candidates, started, budget_ms)
+
+
+def retrieve_many(queries: list, top_k: int = 5, subject: str = None, candidates: int = None,
+                  budget_ms: float = None, owner_id=None) -> list:
     """
-    embed_model = init_embed_model()
-    embedding = embed_model.encode(query).tolist()
+    retrieve() for many queries: one batched first stage (see
+    hybrid_search_many()), then each query's candidates are reranked. The
+    latency budget covers the whole batch; once it is spent, the remaining
+    queries keep their fused first-stage order.
+    Returns one hit list per query, in query order.
+    """
+    started = time.monotonic()
+    reranker = get_reranker()
+    if reranker is None:
+        return hybrid_search_many(
+            queries,
+            top_k=top_k,
+            subject=subject,
+            candidates=_setting("RAG_HYBRID_CANDIDATES", HYBRID_CANDIDATES),
+            rrf_k=_setting("RAG_RRF_K", RRF_K),
+            owner_id=owner_id,
+        )
+
+    candidates = max(top_k, candidates or _setting("RAG_RERANK_CANDIDATES", RERANK_CANDIDATES))
+    budget_ms = budget_ms if budget_ms is not None else _setting("RAG_RERANK_BUDGET_MS", RERANK_BUDGET_MS)
+    hit_lists = hybrid_search_many(
+        queries,
+        top_k=candidates,
+        subject=subject,
+        candidates=max(candidates, _setting("RAG_HYBRID_CANDIDATES", HYBRID_CANDIDATES)),
+        rrf_k=_setting("RAG_RRF_K", RRF_K),
+        owner_id=owner_id,
+    )
+    deadline = started + budget_ms / 1000.0 if budget_ms and budget_ms > 0 else None
+    results = []
+    for query, hits in zip(queries, hit_lists):
+        if deadline is not None and time.monotonic() >= deadline:
+            results.append(hits[:top_k])
+        else:
+            results.append(_rerank(reranker, query, hits, top_k, candidates, started, budget_ms))
+    return results
+
 
-    # Vector search returns list of documents or textual chunks
-    results = search_vectors(embedding, top_k=top_k, patient_id=patient_id)  # Implement patient filtering in your search_vectors
+def _rerank(reranker, query: str, hits: list, top_k: int, candidates: int, started: float, budget_ms: float) -> list:
+    if len(hits) <= 1:
+        return hits[:top_k]
 
-    if not results or not results[0]:
-        return ""
+    deadline = started + budget_ms / 1000.0 if budget_ms and budget_ms > 0 else None
+    try:
+        hits, info = reranker.rerank(query, hits, top_k, deadline=deadline)
+    except Exception as e:
+        logging.error(f"Reranking failed, using retrieval order: {e}")
+        return hits[:top_k]
+    logging.info(
+        f"Retrieved {len(hits)} of {candidates} candidates in {1000 * (time.monotonic() - started):.1f}ms "
+        f"(reranked={info['reranked']}, skipped={info['skipped']}, truncated={info['truncated']})"
+    )
+    return hits
 
-    # Concatenate textual content from results into single context string
-    context = "\n---\n".join(doc['text'] for doc in results[0])
-    return context
 
+def fetch_context(query: str, top_k: int = 3, subject: str = None, owner_id=None) -> str:
+    """Retrieved chunks for query joined into one LLM context string."""
+    return "\n---\n".join(
+        hit["text"] for hit in retrieve(query, top_k=top_k, subject=subject, owner_id=owner_id)
+    )
@@ -0,0 +1,599 @@
+"""
+Vector store backends behind init_milvus_client().
+
+    milvus  MilvusClient (Milvus Lite file or a server URI)
+    numpy   NumpyVectorStore: an in-process exact index over a memory-mapped
+            float32 matrix, with an optional IVF coarse quantizer
+
+NumpyVectorStore implements the subset of the MilvusClient API the app
+uses (create_collection, create_partition, list_partitions, insert, search,
+query, query_iterator, delete) with the same call signatures, filter syntax
+subset and result shapes, so app.extensions works unchanged on either
+backend. A partition is an integer code on each row; searching a list of
+partitions masks every other row out before scoring. Filtered fields are
+kept as columns (numeric arrays, or integer codes into a table of distinct
+values) that grow with the rows instead of being rebuilt per search.
+
+On-disk layout, one directory per collection:
+
+    vectors.f32   float32 rows, grown by doubling; row n = line n of rows.jsonl
+    rows.jsonl    append-only: one {"id", "text", "subject", ...} per row,
+                  plus {"$deleted": id} and {"$partition_created": name} lines
+    .lock         flock()ed while appending
+
+A vector is written before its row line, so a crash never leaves a row
+without its vector. Any number of processes can open the store read-only:
+the matrix is mapped read-only (the page cache is shared between them) and
+each search first picks up rows other processes appended.
+"""
+from contextlib import contextmanager
+import fcntl
+import json
+import logging
+import operator
+import os
+import re
+import threading
+import numpy as np
+
+BACKENDS = ("milvus", "numpy")
+DEFAULT_PARTITION = "_default"
+SEARCH_BLOCK_ROWS = 16384  # rows scored per matrix product
+IVF_TRAIN_SAMPLE = 20000
+IVF_TRAIN_ITERATIONS = 10
+
+
+class FilterError(ValueError):
+    pass
+
+
+_FILTER_TOKEN = re.compile(r"""\s*(?:
+    (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<op>==|!=|>=|<=|>|<|&&|\|\|)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<punct>[\[\](),])
+)""", re.VERBOSE)
+_ESCAPE = re.compile(r"\\(.)")
+_COMPARE = {
+    "==": np.equal, "!=": np.not_equal, ">": np.greater,
+    ">=": np.greater_equal, "<": np.less, "<=": np.less_equal,
+}
+_VALUE_COMPARE = {
+    "==": operator.eq, "!=": operator.ne, ">": operator.gt,
+    ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+}
+
+
+def _key(value):
+    """Dictionary key for a field value; unhashable values (lists, dicts) by their JSON."""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ("$json", json.dumps(value, sort_keys=True, default=str))
+
+
+class _CodedColumn:
+    """A non-numeric field as int32 codes into a table of its distinct values."""
+
+    def __init__(self, values=()):
+        self.codes = np.zeros(0, dtype=np.int32)
+        self.values = []
+        self._codes = {}
+        self.extend(values)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def extend(self, values):
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            key = _key(value)
+            code = self._codes.get(key)
+            if code is None:
+                code = self._codes[key] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        self.codes = np.concatenate([self.codes, codes])
+
+    def isin(self, options) -> np.ndarray:
+        wanted = [self._codes[key] for key in map(_key, options) if key in self._codes]
+        return np.isin(self.codes, wanted)
+
+    def where(self, predicate) -> np.ndarray:
+        """Rows whose value satisfies predicate, evaluated once per distinct value."""
+        table = np.array([bool(predicate(value)) for value in self.values], dtype=bool)
+        return table[self.codes] if len(table) else np.zeros(len(self.codes), dtype=bool)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _FilterParser:
+    """
+    Milvus boolean expressions over scalar fields: comparisons, `in [...]`,
+    and / or / not (also && / ||) and parentheses. Evaluates to a row mask.
+    """
+
+    def __init__(self, expression: str, column):
+        self.tokens = []
+        position = 0
+        expression = expression.strip()
+        while position < len(expression):
+            match = _FILTER_TOKEN.match(expression, position)
+            if not match or match.end() == position:
+                raise FilterError(f"Unsupported filter expression: {expression!r}")
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == "word" and text.lower() in ("and", "or", "not", "in", "true", "false"):
+                kind, text = "keyword", text.lower()
+            self.tokens.append((kind, text))
+            position = match.end()
+        self.position = 0
+        self.column = column
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take(self, text=None):
+        kind, value = self._peek()
+        if kind is None or (text is not None and value != text):
+            raise FilterError(f"Expected {text or 'a token'} in filter, got {value!r}")
+        self.position += 1
+        return kind, value
+
+    def parse(self):
+        mask = self._or()
+        if self.position != len(self.tokens):
+            raise FilterError(f"Unexpected {self._peek()[1]!r} in filter")
+        return mask
+
+    def _or(self):
+        mask = self._and()
+        while self._peek()[1] in ("or", "||"):
+            self._take()
+            mask = mask | self._and()
+        return mask
+
+    def _and(self):
+        mask = self._not()
+        while self._peek()[1] in ("and", "&&"):
+            self._take()
+            mask = mask & self._not()
+        return mask
+
+    def _not(self):
+        if self._peek()[1] == "not":
+            self._take()
+            return ~self._not()
+        if self._peek()[1] == "(":
+            self._take("(")
+            mask = self._or()
+            self._take(")")
+            return mask
+        return self._comparison()
+
+    def _literal(self):
+        kind, value = self._take()
+        if kind == "number":
+            return float(value) if "." in value else int(value)
+        if kind == "string":
+            return _ESCAPE.sub(r"\1", value[1:-1])
+        if kind == "keyword" and value in ("true", "false"):
+            return value == "true"
+        raise FilterError(f"Expected a literal in filter, got {value!r}")
+
+    def _comparison(self):
+        kind, field = self._take()
+        if kind != "word":
+            raise FilterError(f"Expected a field name in filter, got {field!r}")
+        values = self.column(field)
+        kind, op = self._take()
+        if op == "in":
+            self._take("[")
+            options = []
+            while self._peek()[1] != "]":
+                options.append(self._literal())
+                if self._peek()[1] == ",":
+                    self._take(",")
+            self._take("]")
+            if isinstance(values, _CodedColumn):
+                return values.isin(options)
+            return np.isin(values, options)
+        if op not in _COMPARE:
+            raise FilterError(f"Unsupported operator {op!r} in filter")
+        literal = self._literal()
+        if isinstance(values, _CodedColumn):
+            if op in ("==", "!="):
+                result = values.isin([literal])
+                return result if op == "==" else ~result
+            compare = _VALUE_COMPARE[op]
+            return values.where(lambda value: value is not None and compare(value, literal))
+        return _COMPARE[op](values, literal)
+
+
+class _QueryIterator:
+    def __init__(self, rows: list, batch_size: int):
+        self._rows = rows
+        self._batch_size = batch_size
+        self._position = 0
+
+    def next(self) -> list:
+        batch = self._rows[self._position:self._position + self._batch_size]
+        self._position += len(batch)
+        return batch
+
+    def close(self):
+        self._rows = []
+
+
+class NumpyVectorStore:
+    """Exact (or IVF-probed) cosine search over memmapped float32 rows."""
+
+    def __init__(self, directory: str, read_only: bool = False, ivf_nlist: int = 0,
+                 ivf_nprobe: int = 8, ivf_min_rows: int = 50000):
+        self.directory = directory
+        self.read_only = read_only
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self._lock = threading.RLock()
+        self._collections = {}
+        os.makedirs(directory, exist_ok=True)
+
+    # MilvusClient-compatible API
+
+    def create_collection(self, collection_name: str, dimension: int, **kwargs):
+        with self._lock:
+            path = os.path.join(self.directory, collection_name)
+            if collection_name in self._collections or os.path.exists(os.path.join(path, "rows.jsonl")):
+                raise ValueError(f"collection {collection_name} already exists")
+            if self.read_only:
+                raise PermissionError("Vector store is read-only")
+            self._collections[collection_name] = _Collection(path, dimension, False, self)
+
+    def has_collection(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self.directory, collection_name, "rows.jsonl"))
+
+    def create_partition(self, collection_name: str, partition_name: str, **kwargs):
+        self._get(collection_name).create_partition(partition_name)
+
+    def has_partition(self, collection_name: str, partition_name: str, **kwargs) -> bool:
+        return partition_name in self.list_partitions(collection_name)
+
+    def list_partitions(self, collection_name: str, **kwargs) -> list:
+        return self._get(collection_name).list_partitions()
+
+    def insert(self, collection_name: str, data: list, partition_name: str = None, **kwargs) -> dict:
+        return self._get(collection_name).insert(data, partition_name)
+
+    def search(self, collection_name: str, data: list, filter: str = None, limit: int = 10,
+               output_fields: list = None, partition_names: list = None, **kwargs) -> list:
+        return self._get(collection_name).search(data, filter or None, limit, output_fields, partition_names)
+
+    def query(self, collection_name: str, filter: str = None, output_fields: list = None,
+              limit: int = None, offset: int = 0, partition_names: list = None, **kwargs) -> list:
+        return self._get(collection_name).query(filter or None, output_fields, limit, offset, partition_names)
+
+    def query_iterator(self, collection_name: str, batch_size: int = 1000, filter: str = None,
+                       output_fields: list = None, partition_names: list = None, **kwargs) -> _QueryIterator:
+        return _QueryIterator(
+            self.query(collection_name, filter, output_fields, partition_names=partition_names),
+            batch_size,
+        )
+
+    def delete(self, collection_name: str, filter: str = None, ids: list = None, **kwargs) -> dict:
+        return self._get(collection_name).delete(filter, ids)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: collection.stats() for name, collection in self._collections.items()}
+
+    def _get(self, collection_name: str):
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                path = os.path.join(self.directory, collection_name)
+                config_path = os.path.join(path, "collection.json")
+                if not os.path.exists(config_path):
+                    raise ValueError(f"collection {collection_name} does not exist")
+                with open(config_path) as f:
+                    dimension = json.load(f)["dimension"]
+                collection = _Collection(path, dimension, self.read_only, self)
+                self._collections[collection_name] = collection
+            return collection
+
+
+class _Collection:
+    def __init__(self, path: str, dim: int, read_only: bool, store: NumpyVectorStore):
+        self.path = path
+        self.dim = dim
+        self.read_only = read_only
+        self.store = store
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.rows_path = os.path.join(path, "rows.jsonl")
+        self._lock = threading.RLock()
+        self._rows = []  # row -> metadata dict (with "id")
+        self._row_by_id = {}
+        self._max_id = 0
+        self._live = np.zeros(0, dtype=bool)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._columns = {}  # field -> np.ndarray or _CodedColumn over rows, built on first filter use
+        self._partition_codes = _CodedColumn()  # row -> partition name
+        self._partitions = {DEFAULT_PARTITION}
+        self._offset = 0  # bytes of rows.jsonl consumed
+        self._matrix = None
+        self._ivf = None  # (centroids, assignments, trained_rows)
+
+        if not read_only:
+            os.makedirs(path, exist_ok=True)
+            config_path = os.path.join(path, "collection.json")
+            if not os.path.exists(config_path):
+                with open(config_path, "w") as f:
+                    json.dump({"dimension": dim, "metric": "COSINE"}, f)
+            for file_path in (self.vectors_path, self.rows_path):
+                open(file_path, "ab").close()
+        self._refresh()
+
+    @contextmanager
+    def _write_lock(self):
+        if self.read_only:
+            raise PermissionError("Vector store is read-only")
+        with self._lock, open(os.path.join(self.path, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()  # rows other processes appended
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _map(self):
+        capacity = os.path.getsize(self.vectors_path) // (4 * self.dim)
+        if self._matrix is None or len(self._matrix) < capacity:
+            self._matrix = np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r" if self.read_only else "r+",
+                shape=(capacity, self.dim),
+            ) if capacity else np.zeros((0, self.dim), dtype=np.float32)
+
+    def _refresh(self):
+        """Pick up rows and deletions appended since the last read."""
+        with self._lock:
+            if not os.path.exists(self.rows_path) or os.path.getsize(self.rows_path) == self._offset:
+                return
+            records = []
+            with open(self.rows_path, "rb") as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # being written by another process
+                    self._offset += len(line)
+                    records.append(json.loads(line))
+            new_rows = [record for record in records if "$deleted" not in record and "$partition_created" not in record]
+            self._map()
+            start = len(self._rows)
+            self._live = np.concatenate([self._live, np.ones(len(new_rows), dtype=bool)])
+            vectors = np.asarray(self._matrix[start:start + len(new_rows)])
+            self._norms = np.concatenate([self._norms, np.linalg.norm(vectors, axis=1).astype(np.float32)])
+            # Replay strictly in log order: a deletion only hits the row live at that point
+            for record in records:
+                if "$deleted" in record:
+                    row = self._row_by_id.pop(record["$deleted"], None)
+                    if row is not None:
+                        self._live[row] = False
+                elif "$partition_created" in record:
+                    self._partitions.add(record["$partition_created"])
+                else:
+                    row = len(self._rows)
+                    self._rows.append(record)
+                    previous = self._row_by_id.get(record["id"])
+                    if previous is not None:
+                        self._live[previous] = False  # re-inserted id replaces the old row
+                    self._row_by_id[record["id"]] = row
+                    if isinstance(record["id"], int):
+                        self._max_id = max(self._max_id, record["id"])
+            if new_rows:
+                self._partition_codes.extend([row.get("$partition") or DEFAULT_PARTITION for row in new_rows])
+                self._extend_columns(new_rows)
+            if self._ivf is not None and new_rows:
+                centroids, assignments, trained_rows = self._ivf
+                self._ivf = (centroids, np.concatenate([assignments, self._assign(centroids, vectors)]), trained_rows)
+
+    def create_partition(self, name: str):
+        with self._write_lock():
+            if name in self._partitions:
+                raise ValueError(f"partition {name} already exists")
+            with open(self.rows_path, "a") as f:
+                f.write(json.dumps({"$partition_created": name}) + "\n")
+            self._refresh()
+
+    def list_partitions(self) -> list:
+        self._refresh()
+        with self._lock:
+            return sorted(self._partitions)
+
+    def insert(self, data: list, partition_name: str = None) -> dict:
+        if not data:
+            return {"insert_count": 0, "ids": []}
+        partition_name = partition_name or DEFAULT_PARTITION
+        vectors = np.asarray([row["vector"] for row in data], dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape}")
+        with self._write_lock():
+            if partition_name not in self._partitions:
+                raise ValueError(f"partition {partition_name} does not exist")
+            start = len(self._rows)
+            needed = (start + len(data)) * 4 * self.dim
+            size = os.path.getsize(self.vectors_path)
+            if size < needed:
+                with open(self.vectors_path, "r+b") as f:
+                    f.truncate(max(needed, 2 * size))
+                self._matrix = None
+                self._map()
+            self._matrix[start:start + len(data)] = vectors
+            self._matrix.flush()
+
+            next_id = self._max_id + 1
+            ids, lines = [], []
+            for row in data:
+                record = {key: value for key, value in row.items() if key != "vector"}
+                if partition_name != DEFAULT_PARTITION:
+                    record["$partition"] = partition_name
+                if record.get("id") is None:
+                    record["id"] = next_id
+                    next_id += 1
+                ids.append(record["id"])
+                lines.append(json.dumps(record) + "\n")
+            with open(self.rows_path, "a") as f:
+                f.write("".join(lines))
+            self._refresh()
+        return {"insert_count": len(data), "ids": ids}
+
+    def delete(self, filter_expr: str = None, ids: list = None) -> dict:
+        with self._write_lock():
+            if ids is None:
+                if not filter_expr:
+                    raise ValueError("A filter expression or ids are required to delete")
+                rows = np.flatnonzero(self._mask(filter_expr))
+                ids = [self._rows[row]["id"] for row in rows]
+            ids = [doc_id for doc_id in ids if doc_id in self._row_by_id]
+            if ids:
+                with open(self.rows_path, "a") as f:
+                    f.write("".join(json.dumps({"$deleted": doc_id}) + "\n" for doc_id in ids))
+                self._refresh()
+        return {"delete_count": len(ids)}
+
+    def _column(self, field: str):
+        column = self._columns.get(field)
+        if column is None:
+            values = [row.get(field) for row in self._rows]
+            column = np.array(values) if values and all(map(_is_number, values)) else _CodedColumn(values)
+            self._columns[field] = column
+        return column
+
+    def _extend_columns(self, rows: list):
+        """Append new rows to the cached columns (called with self._lock held)."""
+        for field, column in list(self._columns.items()):
+            values = [row.get(field) for row in rows]
+            if isinstance(column, _CodedColumn):
+                column.extend(values)
+            elif all(map(_is_number, values)):
+                self._columns[field] = np.concatenate([column, np.array(values)])
+            else:
+                del self._columns[field]  # no longer numeric; rebuilt as codes on next use
+
+    def _mask(self, filter_expr: str = None, partition_names: list = None) -> np.ndarray:
+        mask = self._live.copy()
+        if partition_names:
+            mask &= self._partition_codes.isin(partition_names)
+        if filter_expr:
+            mask &= _FilterParser(filter_expr, self._column).parse()
+        return mask
+
+    def _entity(self, row: int, output_fields: list = None) -> dict:
+        record = self._rows[row]
+        if output_fields is None or "*" in output_fields:
+            return {key: value for key, value in record.items() if not key.startswith("$")}
+        return {field: record.get(field) for field in output_fields if field in record}
+
+    def query(self, filter_expr: str = None, output_fields: list = None, limit: int = None, offset: int = 0,
+              partition_names: list = None) -> list:
+        self._refresh()
+        with self._lock:
+            rows = np.flatnonzero(self._mask(filter_expr, partition_names))
+            rows = rows[offset:offset + limit] if limit else rows[offset:]
+            fields = output_fields and list(dict.fromkeys(["id", *output_fields]))
+            return [self._entity(row, fields) for row in rows]
+
+    def search(self, data: list, filter_expr: str, limit: int, output_fields: list = None,
+               partition_names: list = None) -> list:
+        self._refresh()
+        queries = np.asarray(data, dtype=np.float32).reshape(len(data), self.dim)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            mask = self._mask(filter_expr, partition_names)
+            candidate_sets = self._ivf_candidates(queries, mask)
+            results = []
+            for query, candidates in zip(queries, candidate_sets):
+                rows, scores = self._top_k(query, candidates, limit)
+                results.append([
+                    {"id": self._rows[row]["id"], "distance": float(score), "entity": self._entity(row, output_fields)}
+                    for row, score in zip(rows, scores)
+                ])
+            return results
+
+    def _top_k(self, query: np.ndarray, candidates: np.ndarray, limit: int) -> tuple:
+        """Best `limit` rows among candidates (row indices) by cosine similarity."""
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+        for start in range(0, len(candidates), SEARCH_BLOCK_ROWS):
+            block = candidates[start:start + SEARCH_BLOCK_ROWS]
+            scores = (self._matrix[block] @ query) / np.maximum(self._norms[block], 1e-12)
+            rows = np.concatenate([best_rows, block])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > limit:
+                keep = np.argpartition(-scores, limit - 1)[:limit]
+                rows, scores = rows[keep], scores[keep]
+            best_rows, best_scores = rows, scores
+        order = np.argsort(-best_scores)
+        return best_rows[order], best_scores[order]
+
+    # IVF coarse quantizer
+
+    def _assign(self, centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        norms = np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return np.argmax((vectors / norms) @ centroids.T, axis=1).astype(np.int32) if len(vectors) else np.zeros(0, np.int32)
+
+    def _train_ivf(self):
+        count = len(self._rows)
+        nlist = self.store.ivf_nlist
+        generator = np.random.RandomState(0)
+        sample_rows = np.sort(generator.choice(count, size=min(count, IVF_TRAIN_SAMPLE), replace=False))
+        sample = np.asarray(self._matrix[sample_rows])
+        sample /= np.maximum(np.linalg.norm(sample, axis=1, keepdims=True), 1e-12)
+        centroids = sample[generator.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(IVF_TRAIN_ITERATIONS):  # spherical k-means
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = sample[labels == cluster]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[cluster] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        assignments = np.concatenate([
+            self._assign(centroids, np.asarray(self._matrix[start:min(start + SEARCH_BLOCK_ROWS, count)]))
+            for start in range(0, count, SEARCH_BLOCK_ROWS)
+        ])
+        self._ivf = (centroids, assignments, count)
+        logging.info(f"Trained IVF quantizer for {self.path}: {nlist} lists over {count} rows")
+
+    def _ivf_candidates(self, queries: np.ndarray, mask: np.ndarray) -> list:
+        store = self.store
+        live_rows = np.flatnonzero(mask)
+        if not store.ivf_nlist or len(self._rows) < max(store.ivf_min_rows, store.ivf_nlist):
+            return [live_rows] * len(queries)
+        # Retrain once the collection has doubled since the last training
+        if self._ivf is None or len(self._rows) >= 2 * self._ivf[2]:
+            self._train_ivf()
+        centroids, assignments, _ = self._ivf
+        nprobe = min(store.ivf_nprobe, len(centroids))
+        probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        return [live_rows[np.isin(assignments[live_rows], probe)] for probe in probes]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rows": int(self._live.sum()),
+                "deleted": int(len(self._live) - self._live.sum()),
+                "dimension": self.dim,
+                "partitions": len(self._partitions),
+                "ivf_lists": len(self._ivf[0]) if self._ivf is not None else 0,
+                "read_only": self.read_only,
+            }
+
+
+def store_directory(db_path: str) -> str:
+    """Default NumPy store directory next to the Milvus database path."""
+    return f"{os.path.splitext(db_path)[0]}.npvec"
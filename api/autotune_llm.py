@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark llama.cpp thread/batch settings on this host and save the best profile
+Usage:
+    python autotune_llm.py                          # Tune with default options
+    python autotune_llm.py --threads 4,8 --batch 256,512
+    python autotune_llm.py --output ./llama_profile.json
+The app picks up the profile from LLAMA_PROFILE_PATH on startup.
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from app.llm.runtime_profile import RUNTIME_KEYS, autotune, save_profile
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Autotune llama.cpp runtime settings")
+    parser.add_argument("--model", default=Config.LLAMA_MODEL_PATH, help="GGUF model path")
+    parser.add_argument("--threads", type=parse_int_list, help="Comma-separated thread counts to try")
+    parser.add_argument("--batch", type=parse_int_list, help="Comma-separated n_batch values to try")
+    parser.add_argument("--prompt-tokens", type=int, default=512)
+    parser.add_argument("--gen-tokens", type=int, default=128)
+    parser.add_argument("--output", default=Config.LLAMA_PROFILE_PATH, help="Where to write the profile")
+    args = parser.parse_args()
+
+    if not args.model or not os.path.exists(args.model):
+        print(f"❌ Model not found: {args.model}")
+        sys.exit(1)
+
+    base_kwargs = {
+        arg: getattr(Config, key)
+        for key, arg in RUNTIME_KEYS.items()
+        if getattr(Config, key, None) is not None
+    }
+
+    print(f"⏱️ Autotuning {os.path.basename(args.model)} on {os.cpu_count()} CPUs")
+    profile = autotune(
+        args.model,
+        base_kwargs,
+        thread_options=args.threads,
+        batch_options=args.batch,
+        prompt_tokens=args.prompt_tokens,
+        gen_tokens=args.gen_tokens,
+    )
+    save_profile(args.output, profile)
+    print(f"✅ Best settings: {profile['settings']}")
+    print(f"📄 Profile written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import json
 import os
 from datetime import timedelta
 
@@ -14,10 +15,138 @@ class Config:
     MILVUS_DB_PATH = os.environ.get("MILVUS_DB_PATH", "./milvus_rag.db")
     MILVUS_COLLECTION = os.environ.get("MILVUS_COLLECTION", "ultra_learning_collection")
     MILVUS_DIMENSION = int(os.environ.get("MILVUS_DIMENSION", "384"))
+    # "milvus" (MilvusClient on MILVUS_DB_PATH) or "numpy" (in-process memmapped exact index in
+    # VECTOR_STORE_DIR, default next to MILVUS_DB_PATH; read-only workers share it through the page cache)
+    VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "milvus")
+    VECTOR_STORE_DIR = os.environ.get("VECTOR_STORE_DIR", "")
+    VECTOR_STORE_READ_ONLY = os.environ.get("VECTOR_STORE_READ_ONLY", "false").lower() == "true"
+    # IVF coarse quantizer for the numpy backend: 0 lists = always exact search
+    VECTOR_STORE_IVF_NLIST = int(os.environ.get("VECTOR_STORE_IVF_NLIST", "0"))
+    VECTOR_STORE_IVF_NPROBE = int(os.environ.get("VECTOR_STORE_IVF_NPROBE", "8"))
+    VECTOR_STORE_IVF_MIN_ROWS = int(os.environ.get("VECTOR_STORE_IVF_MIN_ROWS", "50000"))
+    # One partition per subject (and per owner for private uploads), created on insert;
+    # subject-scoped searches only scan the matching partitions. Rows already in the
+    # collection stay in _default, which every search still scans.
+    VECTOR_STORE_PARTITIONED = os.environ.get("VECTOR_STORE_PARTITIONED", "false").lower() == "true"
+    VECTOR_STORE_MAX_PARTITIONS = int(os.environ.get("VECTOR_STORE_MAX_PARTITIONS", "1000"))
     EMBED_MODEL_NAME = os.environ.get("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+    # "torch" (SentenceTransformer) or "onnx" (ONNX Runtime export from `python embed_onnx.py export`)
+    EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch")
+    EMBED_ONNX_DIR = os.environ.get("EMBED_ONNX_DIR", "./onnx/all-MiniLM-L6-v2")
+    EMBED_ONNX_QUANTIZED = os.environ.get("EMBED_ONNX_QUANTIZED", "true").lower() == "true"
+    EMBED_NUM_THREADS = int(os.environ["EMBED_NUM_THREADS"]) if os.environ.get("EMBED_NUM_THREADS") else None
+    # Embedding cache keyed by (model, text hash): in-memory LRU plus an optional
+    # memmapped on-disk tier in EMBED_CACHE_DIR (off when empty) that survives restarts
+    # and is shared by worker processes
+    EMBED_CACHE_ENABLED = os.environ.get("EMBED_CACHE_ENABLED", "true").lower() == "true"
+    EMBED_CACHE_MAX_ENTRIES = int(os.environ.get("EMBED_CACHE_MAX_ENTRIES", "10000"))
+    EMBED_CACHE_DIR = os.environ.get("EMBED_CACHE_DIR", "")
+    EMBED_CACHE_DISK_CAPACITY = int(os.environ.get("EMBED_CACHE_DISK_CAPACITY", "100000"))
+    # Micro-batch concurrent query encodes into one forward pass
+    EMBED_BATCHER_ENABLED = os.environ.get("EMBED_BATCHER_ENABLED", "true").lower() == "true"
+    EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", "32"))
+    EMBED_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", "5"))
+    # Document ingestion: chunk size/overlap in embedding-model tokens, embed and insert batch sizes
+    INGEST_CHUNK_TOKENS = int(os.environ.get("INGEST_CHUNK_TOKENS", "200"))
+    INGEST_CHUNK_OVERLAP = int(os.environ.get("INGEST_CHUNK_OVERLAP", "40"))
+    INGEST_EMBED_BATCH_SIZE = int(os.environ.get("INGEST_EMBED_BATCH_SIZE", "64"))
+    INGEST_INSERT_BATCH_SIZE = int(os.environ.get("INGEST_INSERT_BATCH_SIZE", "512"))
+    INGEST_NORMALIZE = os.environ.get("INGEST_NORMALIZE", "false").lower() == "true"
+    # Skip chunks whose estimated Jaccard similarity (MinHash/LSH) to an indexed chunk is at least the threshold
+    INGEST_DEDUP_ENABLED = os.environ.get("INGEST_DEDUP_ENABLED", "true").lower() == "true"
+    INGEST_DEDUP_THRESHOLD = float(os.environ.get("INGEST_DEDUP_THRESHOLD", "0.85"))
+    INGEST_DEDUP_NUM_PERM = int(os.environ.get("INGEST_DEDUP_NUM_PERM", "128"))
+    # Hybrid retrieval: a BM25 index kept next to the Milvus DB, fused with vector hits by reciprocal rank
+    RAG_HYBRID_ENABLED = os.environ.get("RAG_HYBRID_ENABLED", "true").lower() == "true"
+    RAG_HYBRID_CANDIDATES = int(os.environ.get("RAG_HYBRID_CANDIDATES", "20"))
+    RAG_RRF_K = int(os.environ.get("RAG_RRF_K", "60"))
+    RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "5"))  # chunks passed to the chat prompt
+    # Cross-encoder reranking of RAG_RERANK_CANDIDATES retrieved hits, within a per-request latency budget
+    RAG_RERANK_ENABLED = os.environ.get("RAG_RERANK_ENABLED", "false").lower() == "true"
+    RAG_RERANK_MODEL = os.environ.get("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RAG_RERANK_CANDIDATES = int(os.environ.get("RAG_RERANK_CANDIDATES", "20"))
+    RAG_RERANK_BATCH_SIZE = int(os.environ.get("RAG_RERANK_BATCH_SIZE", "16"))
+    RAG_RERANK_MAX_LENGTH = int(os.environ.get("RAG_RERANK_MAX_LENGTH", "256"))
+    RAG_RERANK_BUDGET_MS = float(os.environ.get("RAG_RERANK_BUDGET_MS", "150"))
+    # Ground textarea flashcard lines (those without "Question | Answer") in retrieved chunks
+    FLASHCARD_TEXTAREA_RAG = os.environ.get("FLASHCARD_TEXTAREA_RAG", "false").lower() == "true"
     TRANSFORMERS_NO_ADVISORY_WARNINGS = True
     
     LLAMA_MODEL_PATH = os.environ.get("LLAMA_MODEL_PATH", "/Users/johnmoses/.cache/lm-studio/models/MaziyarPanahi/Meta-Llama-3-8B-Instruct-GGUF/Meta-Llama-3-8B-Instruct.Q4_K_M.gguf")
-    # LLAMA_N_CTX = 2048  # Smaller context window for safety
-    # LLAMA_N_GPU_LAYERS = 0  # CPU only by default
-    # LLAMA_VERBOSE = True  # For debugging
+    # llama.cpp runtime knobs (unset threads/batch take the tuned profile, else llama.cpp's default)
+    LLAMA_N_CTX = int(os.environ.get("LLAMA_N_CTX", "4096"))
+    LLAMA_N_GPU_LAYERS = int(os.environ.get("LLAMA_N_GPU_LAYERS", "0"))  # CPU only by default
+    LLAMA_N_THREADS = int(os.environ["LLAMA_N_THREADS"]) if os.environ.get("LLAMA_N_THREADS") else None
+    LLAMA_N_THREADS_BATCH = int(os.environ["LLAMA_N_THREADS_BATCH"]) if os.environ.get("LLAMA_N_THREADS_BATCH") else None
+    LLAMA_N_BATCH = int(os.environ["LLAMA_N_BATCH"]) if os.environ.get("LLAMA_N_BATCH") else None
+    LLAMA_USE_MMAP = os.environ.get("LLAMA_USE_MMAP", "true").lower() == "true"
+    LLAMA_USE_MLOCK = os.environ.get("LLAMA_USE_MLOCK", "false").lower() == "true"
+    LLAMA_VERBOSE = os.environ.get("LLAMA_VERBOSE", "false").lower() == "true"  # For debugging
+    # Speculative decoding: "none", "prompt_lookup" or "model" (small draft GGUF).
+    # Verification keeps logits for every position (n_ctx x n_vocab floats per slot).
+    LLAMA_DRAFT_MODE = os.environ.get("LLAMA_DRAFT_MODE", "none")
+    LLAMA_DRAFT_MODEL_PATH = os.environ.get("LLAMA_DRAFT_MODEL_PATH")
+    LLAMA_DRAFT_NUM_TOKENS = int(os.environ.get("LLAMA_DRAFT_NUM_TOKENS", "8"))
+    LLAMA_PROMPT_LOOKUP_NGRAM = int(os.environ.get("LLAMA_PROMPT_LOOKUP_NGRAM", "2"))
+    # Tuned thread/batch settings written by `python autotune_llm.py`; explicit LLAMA_* values win
+    LLAMA_PROFILE_PATH = os.environ.get("LLAMA_PROFILE_PATH", "./llama_profile.json")
+
+    # Named models, e.g. {"small": {"path": "/models/llama-3.2-1b.Q4_K_M.gguf", "n_ctx": 2048}}.
+    # Specs may set ram_mb (weights), context_mb, slots, worker_pool_size, speculative and llama runtime
+    # kwargs; the default model falls back to LLAMA_MODEL_PATH.
+    LLM_MODELS = json.loads(os.environ.get("LLM_MODELS") or "{}")
+    LLM_DEFAULT_MODEL = os.environ.get("LLM_DEFAULT_MODEL", "chat")
+    # Unload least recently used models to stay under this (0 = no limit)
+    LLM_RAM_BUDGET_MB = int(os.environ.get("LLM_RAM_BUDGET_MB", "0"))
+    # Budgeted per llama.cpp context on top of the shared weights: KV cache and compute
+    # buffers (about 512 MB for an 8B model at n_ctx 4096 with an f16 KV cache)
+    LLM_CONTEXT_MB = int(os.environ.get("LLM_CONTEXT_MB", "512"))
+    # Unload models unused for this many seconds (0 = keep loaded)
+    LLM_MODEL_IDLE_TIMEOUT = float(os.environ.get("LLM_MODEL_IDLE_TIMEOUT", "0"))
+
+    # Cascade routing: simple chat queries try LLM_CASCADE_SMALL_MODEL (a name in
+    # LLM_MODELS) first and escalate to the agent's model on low confidence
+    LLM_CASCADE_ENABLED = os.environ.get("LLM_CASCADE_ENABLED", "false").lower() == "true"
+    LLM_CASCADE_SMALL_MODEL = os.environ.get("LLM_CASCADE_SMALL_MODEL", "small")
+    LLM_CASCADE_SMALL_MAX_TOKENS = int(os.environ.get("LLM_CASCADE_SMALL_MAX_TOKENS", "256"))
+    LLM_CASCADE_MAX_QUERY_WORDS = int(os.environ.get("LLM_CASCADE_MAX_QUERY_WORDS", "30"))
+    LLM_CASCADE_MIN_CONFIDENCE = float(os.environ.get("LLM_CASCADE_MIN_CONFIDENCE", "0.6"))
+
+    # Inference scheduler: each slot owns its own model instance
+    LLM_SCHEDULER_SLOTS = int(os.environ.get("LLM_SCHEDULER_SLOTS", "1"))
+    # Identical concurrent requests share one generation
+    LLM_SINGLE_FLIGHT = os.environ.get("LLM_SINGLE_FLIGHT", "true").lower() == "true"
+    # Admission control per priority class (interactive chat vs bulk generation);
+    # a full queue answers 429, a request waiting past its deadline answers 503
+    LLM_QUEUE_MAX_DEPTH_INTERACTIVE = int(os.environ.get("LLM_QUEUE_MAX_DEPTH_INTERACTIVE", "32"))
+    LLM_QUEUE_MAX_DEPTH_BULK = int(os.environ.get("LLM_QUEUE_MAX_DEPTH_BULK", "8"))
+    LLM_QUEUE_DEADLINE_INTERACTIVE = float(os.environ.get("LLM_QUEUE_DEADLINE_INTERACTIVE", "30"))
+    LLM_QUEUE_DEADLINE_BULK = float(os.environ.get("LLM_QUEUE_DEADLINE_BULK", "300"))
+    # A running request with no new token for this many seconds fails its streaming callers (0 = no limit)
+    LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", "300"))
+    # Slots that only serve interactive requests (always leaves one shared slot)
+    LLM_RESERVED_INTERACTIVE_SLOTS = int(os.environ.get("LLM_RESERVED_INTERACTIVE_SLOTS", "0"))
+    # Run models in N separate worker processes sharing the mmapped GGUF (0 = in-process)
+    LLM_WORKER_POOL_SIZE = int(os.environ.get("LLM_WORKER_POOL_SIZE", "0"))
+    LLM_WORKER_HEALTH_INTERVAL = float(os.environ.get("LLM_WORKER_HEALTH_INTERVAL", "10"))
+    # A worker with no reply for this many seconds is killed and respawned (0 = no deadline)
+    LLM_WORKER_REQUEST_TIMEOUT = float(os.environ.get("LLM_WORKER_REQUEST_TIMEOUT", "300"))
+    # Per-slot KV state cache for shared prompt prefixes (0 disables); budgeted in
+    # LLM_RAM_BUDGET_MB for every llama.cpp context, e.g. 536870912 for 512 MB each
+    LLAMA_PREFIX_CACHE_BYTES = int(os.environ.get("LLAMA_PREFIX_CACHE_BYTES", "0"))
+    LLAMA_PREFIX_CACHE_WARM = os.environ.get("LLAMA_PREFIX_CACHE_WARM", "true").lower() == "true"
+
+    # Background writer for LLMQueryLog rows
+    LLM_LOG_QUEUE_SIZE = int(os.environ.get("LLM_LOG_QUEUE_SIZE", "1000"))
+    LLM_LOG_BATCH_SIZE = int(os.environ.get("LLM_LOG_BATCH_SIZE", "50"))
+    LLM_LOG_FLUSH_INTERVAL = float(os.environ.get("LLM_LOG_FLUSH_INTERVAL", "2.0"))
+    LLM_LOG_SAMPLE_RATE = float(os.environ.get("LLM_LOG_SAMPLE_RATE", "0.1"))  # kept when the queue is >80% full
+
+    # Share of the prompt token budget reserved for retrieved documents
+    CONTEXT_DOCUMENT_SHARE = float(os.environ.get("CONTEXT_DOCUMENT_SHARE", "0.6"))
+
+    # Semantic response cache for supervisor_agent
+    SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+    SEMANTIC_CACHE_TTL = int(os.environ.get("SEMANTIC_CACHE_TTL", "3600"))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
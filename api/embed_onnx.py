@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Export, verify and benchmark the ONNX embedding backend
+Usage:
+    python embed_onnx.py export      # Export EMBED_MODEL_NAME to EMBED_ONNX_DIR (+ int8 copy)
+    python embed_onnx.py verify      # Cosine agreement of ONNX fp32/int8 vs PyTorch
+    python embed_onnx.py benchmark   # Encode throughput of each backend
+Then set EMBED_BACKEND=onnx (and EMBED_ONNX_QUANTIZED=true for int8).
+"""
+
+import argparse
+import json
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from config import Config
+from app.rag.embed_backends import (
+    ONNX_CONFIG_FILE,
+    ONNX_INT8_MODEL_FILE,
+    ONNX_MODEL_FILE,
+    OnnxEmbeddingBackend,
+    TorchEmbeddingBackend,
+)
+
+SAMPLE_TEXTS = [
+    "What is spaced repetition?",
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "The French Revolution began in 1789 and reshaped European politics.",
+    "Explain the difference between mitosis and meiosis.",
+    "A derivative measures how a function changes as its input changes.",
+    "Newton's second law states that force equals mass times acceleration.",
+    "Active recall is more effective than rereading notes.",
+    "The mitochondria is the powerhouse of the cell.",
+]
+
+def export(args):
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    reference = TorchEmbeddingBackend(args.model).model
+    transformer = reference[0]
+    pooling = reference[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        print("❌ Only mean-pooling sentence-transformers can be exported")
+        sys.exit(1)
+
+    os.makedirs(args.output, exist_ok=True)
+    model_path = os.path.join(args.output, ONNX_MODEL_FILE)
+    auto_model = transformer.auto_model.eval()
+    sample = transformer.tokenizer(SAMPLE_TEXTS[:2], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    print(f"📦 Exporting {args.model} to {model_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                **{name: {0: "batch", 1: "sequence"} for name in input_names},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+        )
+
+    transformer.tokenizer.save_pretrained(args.output)  # writes tokenizer.json for the fast tokenizer
+    with open(os.path.join(args.output, ONNX_CONFIG_FILE), "w") as f:
+        json.dump({
+            "model_name": args.model,
+            "dimension": reference.get_sentence_embedding_dimension(),
+            "max_seq_length": reference.max_seq_length,
+            "pad_token_id": transformer.tokenizer.pad_token_id or 0,
+            "pooling": "mean",
+            "normalize": any(type(module).__name__ == "Normalize" for module in reference),
+        }, f, indent=2)
+
+    int8_path = os.path.join(args.output, ONNX_INT8_MODEL_FILE)
+    print(f"🗜️ Quantizing to int8: {int8_path}")
+    quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+    print("✅ Export complete")
+
+def cosine_agreement(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+def verify(args):
+    reference = TorchEmbeddingBackend(args.model).encode(SAMPLE_TEXTS, convert_to_numpy=True)
+    failed = False
+    for quantized in (False, True):
+        label = "int8" if quantized else "fp32"
+        candidate = OnnxEmbeddingBackend(args.output, quantized=quantized).encode(SAMPLE_TEXTS)
+        if candidate.shape != reference.shape:
+            print(f"❌ {label}: shape {candidate.shape} != {reference.shape}")
+            failed = True
+            continue
+        cosines = cosine_agreement(reference, candidate)
+        ok = cosines.min() >= args.min_cosine
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {label}: cosine min={cosines.min():.5f} mean={cosines.mean():.5f} (threshold {args.min_cosine})")
+    if failed:
+        sys.exit(1)
+
+def benchmark(args):
+    texts = (SAMPLE_TEXTS * (args.texts // len(SAMPLE_TEXTS) + 1))[:args.texts]
+    backends = [
+        ("torch", lambda: TorchEmbeddingBackend(args.model)),
+        ("onnx-fp32", lambda: OnnxEmbeddingBackend(args.output, quantized=False)),
+        ("onnx-int8", lambda: OnnxEmbeddingBackend(args.output, quantized=True)),
+    ]
+    for label, load in backends:
+        started = time.perf_counter()
+        model = load()
+        load_seconds = time.perf_counter() - started
+        model.encode(texts[:args.batch_size], batch_size=args.batch_size)  # warm-up
+        started = time.perf_counter()
+        model.encode(texts, batch_size=args.batch_size)
+        seconds = time.perf_counter() - started
+        print(f"⏱️ {label:10s} load={load_seconds:.2f}s  {len(texts) / seconds:8.1f} texts/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX embedding backend tools")
+    parser.add_argument("command", choices=["export", "verify", "benchmark"])
+    parser.add_argument("--model", default=Config.EMBED_MODEL_NAME, help="SentenceTransformer model name")
+    parser.add_argument("--output", default=Config.EMBED_ONNX_DIR, help="ONNX model directory")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="verify: minimum cosine agreement")
+    parser.add_argument("--texts", type=int, default=512, help="benchmark: number of texts to encode")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    {"export": export, "verify": verify, "benchmark": benchmark}[args.command](args)
+
+if __name__ == "__main__":
+    main()
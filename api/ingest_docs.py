@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Chunk, embed and index text/markdown documents into Milvus for RAG
+Usage:
+    python ingest_docs.py textbook.md --subject biology
+    python ingest_docs.py notes/ --subject history      # every .txt/.md under notes/
+    python ingest_docs.py book.txt --dry-run            # chunk only, print counts
+    python ingest_docs.py --rebuild-bm25                # re-index the collection for keyword search
+Files are streamed block by block, so large textbooks index in bounded memory.
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.extensions import rebuild_bm25_index
+from app.rag.ingest import (
+    TEXT_EXTENSIONS,
+    chunk_units,
+    ingest_file,
+    ingest_options,
+    read_file,
+    split_units,
+)
+
+def find_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.lower().endswith(TEXT_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif os.path.isfile(path):
+            yield path
+        else:
+            print(f"⚠️ Skipping {path}: not found")
+
+def main():
+    parser = argparse.ArgumentParser(description="Index documents for RAG")
+    parser.add_argument("paths", nargs="*", help="Files or directories (.txt, .md)")
+    parser.add_argument("--subject", default="general", help="Subject stored with every chunk")
+    parser.add_argument("--collection", default=None, help="Milvus collection (default: MILVUS_COLLECTION)")
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="Max tokens per chunk (default: INGEST_CHUNK_TOKENS)")
+    parser.add_argument("--overlap", type=int, default=None, help="Overlap tokens between chunks (default: INGEST_CHUNK_OVERLAP)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Texts per embedding call")
+    parser.add_argument("--dry-run", action="store_true", help="Chunk only; do not embed or insert")
+    parser.add_argument("--rebuild-bm25", action="store_true", help="Re-index the whole collection into the BM25 keyword index")
+    args = parser.parse_args()
+    if not args.paths and not args.rebuild_bm25:
+        parser.error("give at least one path, or --rebuild-bm25")
+
+    app = create_app()
+    with app.app_context():
+        if args.rebuild_bm25:
+            count = rebuild_bm25_index(collection_name=args.collection)
+            print(f"🔎 BM25 index rebuilt from {count} documents")
+
+        options = ingest_options(app.config)
+        if args.chunk_tokens:
+            options["chunk_tokens"] = args.chunk_tokens
+        if args.overlap is not None:
+            options["overlap_tokens"] = args.overlap
+        if args.batch_size:
+            options["batch_size"] = args.batch_size
+
+        total_chunks = total_skipped = 0
+        for path in find_files(args.paths):
+            if args.dry_run:
+                count = sum(1 for _ in chunk_units(
+                    split_units(read_file(path)),
+                    chunk_tokens=options["chunk_tokens"],
+                    overlap_tokens=options["overlap_tokens"],
+                ))
+                print(f"✂️ {path}: {count} chunks")
+                total_chunks += count
+                continue
+            try:
+                result = ingest_file(
+                    path,
+                    subject=args.subject,
+                    collection_name=args.collection,
+                    progress_callback=lambda inserted, encoded: print(f"   … {inserted} chunks inserted", end="\r"),
+                    **options,
+                )
+            except Exception as e:
+                print(f"❌ {path}: {e}")
+                sys.exit(1)
+            print(f"✅ {path}: {result['chunks']} chunks, {result['skipped']} near-duplicates skipped, in {result['seconds']}s")
+            total_chunks += result["chunks"]
+            total_skipped += result["skipped"]
+
+        print(f"📊 Total: {total_chunks} chunks, {total_skipped} near-duplicates skipped")
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,14 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-app = create_app()
-app.logger.setLevel(logging.INFO)
-logging.getLogger('werkzeug').setLevel(logging.INFO)  # HTTP request logs at INFO level
 
-if __name__ == '__main__':
+def main():
+    # Created here rather than at import: LLM pool workers are spawned processes
+    # that re-run this script as __mp_main__, and each would build its own app
+    app = create_app()
+    app.logger.setLevel(logging.INFO)
+    logging.getLogger('werkzeug').setLevel(logging.INFO)  # HTTP request logs at INFO level
+
     with app.app_context():
         try:
             db.create_all()  # Create database tables if they don't exist
@@ -29,3 +32,7 @@ if __name__ == '__main__':
     
     app.logger.info(f"Starting UltraLearning API on port {port}")
     socketio.run(app, host='0.0.0.0', port=port, use_reloader=False, debug=debug_mode)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Run from the repository root or from api/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,63 @@
+import pytest
+
+from app.extensions import filter_string
+from app.rag.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from app.rag.vector_store import NumpyVectorStore
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = BM25Index(str(tmp_path / "index.bm25.sqlite"))
+    yield index
+    index.close()
+
+
+def test_tokenize_keeps_identifiers_and_drops_stopwords():
+    assert tokenize("What is numpy.argpartition in CS-101?") == ["numpy.argpartition", "cs-101"]
+    assert tokenize("snake_case and C++") == ["snake_case", "c++"]
+
+
+def test_search_ranks_exact_terms(index):
+    index.add([
+        (1, "numpy.argpartition selects the k smallest values", "cs"),
+        (2, "sorting values with numpy.sort", "cs"),
+        (3, "the French revolution began in 1789", "history"),
+    ])
+    assert [hit["id"] for hit in index.search("numpy.argpartition")] == [1]
+    assert [hit["id"] for hit in index.search("values")] in ([1, 2], [2, 1])
+    assert [hit["id"] for hit in index.search("values", subject="history")] == []
+
+
+def test_readd_replaces_and_remove_updates_stats(index):
+    index.add([(1, "alpha beta", "s"), (2, "beta gamma", "s")])
+    index.add([(1, "delta", "s")])
+    assert [hit["id"] for hit in index.search("alpha")] == []
+    assert index.stats()["documents"] == 2
+    index.remove([1, 2])
+    assert index.stats() == {"documents": 0, "terms": 0, "avg_length": 0.0}
+    assert index.search("delta") == []
+
+
+def test_subject_is_a_bound_parameter(index):
+    index.add([(1, "quoted subject", "it's"), (2, "quoted subject", "other")])
+    assert [hit["id"] for hit in index.search("quoted", subject="it's")] == [1]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    vector = [{"id": 1, "score": 0.9}, {"id": 2, "score": 0.8}, {"id": 3, "score": 0.7}]
+    keyword = [{"id": 3, "score": 5.0}, {"id": 1, "score": 4.0}]
+    fused = reciprocal_rank_fusion([vector, keyword], top_k=2, k=60)
+    assert [hit["id"] for hit in fused] == [1, 3]
+    assert fused[0]["score"] == round(1 / 61 + 1 / 62, 6)
+
+
+@pytest.mark.parametrize("subject", ["it's", 'say "hi"', "back\\slash", "x' or subject != '"])
+def test_filter_string_matches_only_the_literal_subject(tmp_path, subject):
+    store = NumpyVectorStore(str(tmp_path / "store.npvec"))
+    store.create_collection("c", dimension=2)
+    store.insert("c", [
+        {"id": 1, "vector": [1, 0], "text": "a", "subject": subject},
+        {"id": 2, "vector": [0, 1], "text": "b", "subject": "other"},
+    ])
+    rows = store.query("c", filter=f"subject == {filter_string(subject)}")
+    assert [row["id"] for row in rows] == [1]
@@ -0,0 +1,39 @@
+import pytest
+from flask import Flask
+
+from app.chat.agents.cascade import answer_confidence, fits_small_model, route_to_small
+from app.llm.context_packer import TEMPLATE_OVERHEAD_TOKENS, TokenCounter
+
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    app.config["LLM_CASCADE_MAX_QUERY_WORDS"] = 10
+    with app.app_context():
+        yield
+
+
+def test_route_to_small(app_context):
+    assert route_to_small("what is osmosis?", "learning") == (True, "simple")
+    assert route_to_small("make flashcards", "flashcard") == (False, "intent:flashcard")
+    assert route_to_small("explain osmosis step by step", "learning") == (False, "keyword:step by step")
+    assert route_to_small("what? and why?", "learning") == (False, "multi_part")
+    assert route_to_small(" ".join(["word"] * 11), "study") == (False, "long_query")
+
+
+def test_answer_confidence():
+    assert answer_confidence("")[0] == 0.0
+    good = "Osmosis is the movement of water across a semipermeable membrane."
+    assert answer_confidence(good) == (1.0, [])
+    assert answer_confidence(good, finish_reason="length") == (0.5, ["truncated"])
+    assert "hedging" in answer_confidence("I'm not sure, but it may involve water moving around.")[1]
+
+
+def test_fits_small_model_counts_prompt_and_reply():
+    counter = TokenCounter()  # chars / 4 estimate
+    messages = [{"role": "system", "content": "s" * 400}, {"role": "user", "content": "u" * 4000}]
+    prompt_tokens = counter.count("s" * 400) + counter.count("u" * 4000)
+    needed = prompt_tokens + TEMPLATE_OVERHEAD_TOKENS + 256
+    assert fits_small_model(messages, 256, n_ctx=needed, counter=counter)
+    assert not fits_small_model(messages, 256, n_ctx=needed - 1, counter=counter)
+    assert not fits_small_model(messages, 256, n_ctx=1024, counter=counter)
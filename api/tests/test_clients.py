@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.llm import clients
+from app.llm import model as llm_model
+
+
+def fake_submit(response):
+    return lambda *args, **kwargs: SimpleNamespace(result=lambda timeout=None: response, tokens=lambda: iter(["a", "b"]))
+
+
+@pytest.mark.parametrize("response, error", [
+    ({"choices": []}, "no choices"),
+    ({"choices": [{"message": {}}]}, "missing 'content'"),
+])
+def test_model_generate_response_raises_on_empty_reply(monkeypatch, response, error):
+    monkeypatch.setattr(llm_model, "submit_request", fake_submit(response))
+    with pytest.raises(RuntimeError, match=error):
+        llm_model.generate_response([])
+
+
+@pytest.mark.parametrize("response", [{"choices": []}, {"choices": [{"message": {"content": "  "}}]}])
+def test_client_generate_response_apologizes_on_empty_reply(monkeypatch, response):
+    monkeypatch.setattr(clients, "submit_request", fake_submit(response))
+    assert clients.generate_response([]) == clients.EMPTY_RESPONSE_TEXT
+
+
+def test_both_return_stripped_content_and_stream_tokens(monkeypatch):
+    response = {"choices": [{"message": {"content": " hi \n"}}]}
+    for module in (llm_model, clients):
+        monkeypatch.setattr(module, "submit_request", fake_submit(response))
+        assert module.generate_response([]) == "hi"
+        assert list(module.generate_response([], stream=True)) == ["a", "b"]
@@ -0,0 +1,24 @@
+import logging
+
+from flask import Flask
+
+from app.llm import context_packer
+
+
+def test_tokenizer_failure_is_cached_and_logged_once(monkeypatch, caplog):
+    attempts = []
+
+    def broken(model_path):
+        attempts.append(model_path)
+        raise FileNotFoundError(model_path)
+
+    monkeypatch.setattr(context_packer, "init_llama_tokenizer", broken)
+    monkeypatch.setattr(context_packer, "_fallback_counters", {})
+    app = Flask(__name__)
+    app.config["LLAMA_MODEL_PATH"] = "/missing.gguf"
+    with app.app_context(), caplog.at_level(logging.WARNING):
+        counters = [context_packer.get_token_counter() for _ in range(3)]
+    assert attempts == ["/missing.gguf"]
+    assert counters[0] is counters[2] and counters[0].tokenizer is None
+    assert counters[0].count("abcdefgh") == 3
+    assert len([r for r in caplog.records if "estimated token counts" in r.message]) == 1
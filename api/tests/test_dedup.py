@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from app import extensions
+from app.rag.dedup import MinHashLSH, lsh_params
+from app.rag.vector_store import NumpyVectorStore
+
+TEXT = "the mitochondria is the powerhouse of the cell and produces most of its energy as ATP"
+NEAR = TEXT + " molecules"
+OTHER = "photosynthesis converts light energy into chemical energy stored in glucose inside chloroplasts"
+
+
+def test_lsh_params_err_towards_more_candidates():
+    bands, rows = lsh_params(0.85, 128)
+    assert bands * rows <= 128
+    assert (1.0 / bands) ** (1.0 / rows) <= 0.75
+
+
+def test_near_duplicates_are_skipped_within_a_namespace():
+    index = MinHashLSH(threshold=0.8)
+    assert index.check_and_add(TEXT, 1, "biology")
+    assert not index.check_and_add(NEAR, 2, "biology")
+    assert index.check_and_add(OTHER, 3, "biology")
+    assert index.stats()["skipped"] == 1
+
+
+def test_namespaces_do_not_suppress_each_other():
+    index = MinHashLSH(threshold=0.8)
+    assert index.check_and_add(TEXT, 1, "biology")
+    assert index.check_and_add(TEXT, 2, "chemistry")
+    assert not index.check_and_add(TEXT, 3, "chemistry")
+
+
+def test_rollback_forgets_only_the_given_rows(tmp_path):
+    index = MinHashLSH(threshold=0.8, path=str(tmp_path / "idx"))
+    kept = index.add_if_new(TEXT, 1, "s")
+    failed = index.add_if_new(OTHER, 2, "s")
+    index.rollback([failed])
+    index.save()
+    for current in (index, MinHashLSH(threshold=0.8, path=str(tmp_path / "idx"))):
+        assert not current.check_and_add(TEXT, 3, "s")
+        assert current.check_and_add(OTHER, 4, "s")
+    assert kept == 0
+
+
+def test_deleted_ids_stop_suppressing_after_reload(tmp_path):
+    index = MinHashLSH(threshold=0.8, path=str(tmp_path / "idx"))
+    index.check_and_add(TEXT, 7, "s")
+    index.save()
+    index.remove_ids([7])
+    index.save()
+    assert MinHashLSH(threshold=0.8, path=str(tmp_path / "idx")).check_and_add(TEXT, 8, "s")
+
+
+class LengthVectors:
+    name = "test-length"
+
+    def encode(self, texts, **kwargs):
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_failed_insert_keeps_earlier_batches_indexed(tmp_path, monkeypatch):
+    store = NumpyVectorStore(str(tmp_path / "store.npvec"))
+    store.create_collection("c", dimension=2)
+    index = MinHashLSH(threshold=0.8)
+    monkeypatch.setattr(extensions, "_milvus_client", store)
+    monkeypatch.setattr(extensions, "collection_name", "c")
+    monkeypatch.setattr(extensions, "embed_model", LengthVectors())
+    monkeypatch.setattr(extensions, "get_dedup_index", lambda: index)
+
+    calls = {"insert": 0}
+    insert = store.insert
+
+    def failing_second_insert(*args, **kwargs):
+        calls["insert"] += 1
+        if calls["insert"] == 2:
+            raise RuntimeError("store unavailable")
+        return insert(*args, **kwargs)
+
+    monkeypatch.setattr(store, "insert", failing_second_insert)
+    docs = [{"id": 1, "text": TEXT, "subject": "s"}, {"id": 2, "text": OTHER, "subject": "s"}]
+    with pytest.raises(RuntimeError):
+        extensions.ingest_documents(docs, batch_size=1, insert_batch_size=1)
+
+    assert [row["id"] for row in store.query("c", filter="id >= 0")] == [1]
+    assert not index.check_and_add(TEXT, 3, extensions._dedup_namespace(docs[0]))
+    assert index.check_and_add(OTHER, 4, extensions._dedup_namespace(docs[1]))
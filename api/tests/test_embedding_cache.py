@@ -0,0 +1,87 @@
+import multiprocessing
+
+import numpy as np
+
+from app.rag.embedding_cache import DiskEmbeddingStore, EmbeddingCache
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def vector(i):
+    return np.array([i, i + 0.5, -i], dtype=np.float32)
+
+
+def test_encode_only_encodes_missing_texts_once():
+    model = CountingModel()
+    cache = EmbeddingCache("m", max_memory_entries=10)
+    cache.encode(model, ["a", "bb", "a"])
+    matrix = cache.encode(model, ["bb", "ccc"], normalize=True)
+    assert model.encoded == ["a", "bb", "ccc"]
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0)
+
+
+def test_disk_store_round_trips_after_close(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=4)
+    assert store.put("a", vector(1))
+    store.close()
+    reopened = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=4)
+    assert np.array_equal(reopened.get("a"), vector(1))
+    assert reopened.get("b") is None
+
+
+def test_stores_sharing_a_directory_never_reuse_rows(tmp_path):
+    # Two instances stand in for two worker processes: neither sees the other's in-memory index
+    first = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=10)
+    second = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=10)
+    first.put("k1", vector(1))
+    second.put("k2", vector(2))
+    first.put("k3", vector(3))
+    second.put("k1", vector(99))  # already stored by the other process
+
+    for store in (first, second, DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=10)):
+        for i in (1, 2, 3):
+            assert np.array_equal(store.get(f"k{i}"), vector(i))
+
+
+def _put_range(directory, start):
+    store = DiskEmbeddingStore(directory, "m", dim=3, capacity=200)
+    for i in range(start, start + 50):
+        store.put(f"k{i}", vector(i))
+
+
+def test_concurrent_processes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_put_range, args=(str(tmp_path), start)) for start in (0, 50, 100)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    store = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=200)
+    assert len(store) == 150
+    assert all(np.array_equal(store.get(f"k{i}"), vector(i)) for i in range(150))
+
+
+def test_keys_survive_without_close_and_capacity_is_enforced(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=2)
+    assert store.put("a", vector(1)) and store.put("b", vector(2))
+    assert not store.put("c", vector(3))
+    reopened = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=2)
+    assert len(reopened) == 2 and reopened.get("c") is None
+
+
+def test_raised_capacity_grows_the_matrix(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=2)
+    assert store.put("a", vector(1)) and store.put("b", vector(2))
+    store.close()
+    grown = DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=4)
+    assert np.array_equal(grown.get("a"), vector(1))
+    assert grown.put("c", vector(3))
+    # A worker still on the old capacity opens the bigger file as before
+    assert DiskEmbeddingStore(str(tmp_path), "m", dim=3, capacity=2).get("b") is not None
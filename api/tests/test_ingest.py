@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from app import extensions
+from app.rag import ingest
+from app.rag.vector_store import NumpyVectorStore
+
+
+def word_count(texts):
+    return [len(text.split()) for text in texts]
+
+
+class WordVectors:
+    """Tiny deterministic embedder for exercising the ingest path."""
+    name = "test-words"
+
+    def encode(self, texts, **kwargs):
+        return np.array([[len(text), text.count("a") + 1, text.count("e") + 1] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = NumpyVectorStore(str(tmp_path / "store.npvec"))
+    store.create_collection("c", dimension=3)
+    monkeypatch.setattr(extensions, "_milvus_client", store)
+    monkeypatch.setattr(extensions, "collection_name", "c")
+    monkeypatch.setattr(extensions, "embed_model", WordVectors())
+    return store
+
+
+def test_split_units_carries_paragraphs_across_blocks():
+    blocks = ["First sentence. Second", " sentence.\n\nNext para", "graph here."]
+    assert list(ingest.split_units(blocks)) == ["First sentence.", "Second sentence.", "Next paragraph here."]
+
+
+def test_read_stream_decodes_multibyte_characters_split_across_blocks():
+    import io
+    data = "café über".encode("utf-8")
+    assert "".join(ingest.read_stream(io.BytesIO(data), block_size=4)) == "café über"
+
+
+def test_chunks_respect_budget_and_overlap():
+    units = [f"w{i} x y z" for i in range(10)]  # 4 tokens each
+    chunks = list(ingest.chunk_units(units, count_tokens=word_count, chunk_tokens=12, overlap_tokens=4))
+    assert all(len(chunk.split()) <= 12 for chunk in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.split()[:4] == previous.split()[-4:]
+    assert chunks[-1].endswith("w9 x y z")
+
+
+def test_chunk_ids_are_stable_per_source():
+    docs = list(ingest.to_documents(["a", "b"], subject="bio", source="notes.txt"))
+    assert [doc["id"] for doc in docs] == [ingest.chunk_id("notes.txt", 0), ingest.chunk_id("notes.txt", 1)]
+    assert docs[0]["subject"] == "bio" and docs[0]["source"] == "notes.txt"
+
+
+def test_chunk_ids_differ_per_uploader():
+    mine = list(ingest.to_documents(["a", "b"], source="notes.txt", uploader_id=1))
+    theirs = list(ingest.to_documents(["a", "b"], source="notes.txt", uploader_id=2))
+    assert [doc["id"] for doc in mine] == [ingest.chunk_id("1:notes.txt", 0), ingest.chunk_id("1:notes.txt", 1)]
+    assert not {doc["id"] for doc in mine} & {doc["id"] for doc in theirs}
+    assert mine[0]["source"] == "notes.txt" and mine[0]["source_key"] == "1:notes.txt"
+
+
+def test_reingest_replaces_previous_chunks(store):
+    long_text = "\n\n".join(f"Paragraph {i} about apples and pears." for i in range(6))
+    ingest.ingest_stream(ingest.read_text(long_text), source="notes.txt", uploader_id=1, chunk_tokens=12, overlap_tokens=0)
+    ingest.ingest_stream(ingest.read_text("Other user's notes."), source="notes.txt", uploader_id=2)
+    result = ingest.ingest_stream(ingest.read_text("Short replacement."), source="notes.txt", uploader_id=1)
+
+    rows = store.query("c", filter="id >= 0", output_fields=["text", "source_key"])
+    assert result["chunks"] == 1
+    assert sorted((row["source_key"], row["text"]) for row in rows) == [
+        ("1:notes.txt", "Short replacement."),
+        ("2:notes.txt", "Other user's notes."),
+    ]
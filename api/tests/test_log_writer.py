@@ -0,0 +1,43 @@
+import threading
+
+from app.llm import log_writer
+from app.llm.log_writer import QueryLogWriter
+
+
+def test_submit_samples_above_high_water_and_drops_when_full():
+    writer = QueryLogWriter(app=None, max_queue=4, high_water=0.5, sample_rate=1.0)
+    assert all(writer.submit({"i": i}) for i in range(4))
+    assert not writer.submit({"i": 4})
+    assert writer.stats()["dropped"] == 1
+
+    writer = QueryLogWriter(app=None, max_queue=4, high_water=0.5, sample_rate=0.0)
+    assert [writer.submit({"i": i}) for i in range(4)] == [True, True, False, False]
+    stats = writer.stats()
+    assert (stats["queued"], stats["sampled_out"], stats["dropped"]) == (2, 2, 0)
+
+
+def test_counters_are_consistent_across_threads():
+    writer = QueryLogWriter(app=None, max_queue=100, high_water=0.5, sample_rate=0.5)
+    per_thread = 500
+
+    def submit_many():
+        for i in range(per_thread):
+            writer.submit({"i": i})
+
+    threads = [threading.Thread(target=submit_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = writer.stats()
+    assert stats["queued"] == 100
+    assert stats["queued"] + stats["dropped"] + stats["sampled_out"] == 8 * per_thread
+
+
+def test_stats_without_writer(monkeypatch):
+    monkeypatch.setattr(log_writer, "_writer", None)
+    assert log_writer.log_writer_stats() is None
+    writer = QueryLogWriter(app=None)
+    monkeypatch.setattr(log_writer, "_writer", writer)
+    assert log_writer.log_writer_stats()["written"] == 0
@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from app import extensions
+from app.rag import partitions
+from app.rag.dedup import MinHashLSH
+from app.rag.partitions import DEFAULT_PARTITION, PartitionManager, partition_name
+from app.rag.vector_store import NumpyVectorStore
+
+
+def test_partition_names_are_valid_and_distinct():
+    names = {partition_name(s) for s in ("Math", "math!", "C++", "C#", "", None)}
+    assert len(names) == 5  # "" and None are both "general"
+    for name in names:
+        assert name.startswith("s_") and "__" not in name
+        assert all(c.isalnum() or c == "_" for c in name)
+    assert partition_name("math", 7) == partition_name("math") + "__u7"
+    assert partition_name("x" * 500).startswith("s_" + "x" * 64 + "_")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "store.npvec"))
+    store.create_collection("c", dimension=2)
+    return store
+
+
+def test_ensure_creates_partitions_once_and_overflows_shared_only(store):
+    manager = PartitionManager(store, "c", max_partitions=3)
+    math = manager.ensure("math")
+    assert manager.ensure("math") == math
+    assert manager.ensure("math", owner_id=1) == partition_name("math", 1)
+    assert manager.ensure("history") == DEFAULT_PARTITION
+    with pytest.raises(ValueError):
+        manager.ensure("history", owner_id=1)
+    assert sorted(store.list_partitions("c")) == sorted([DEFAULT_PARTITION, math, partition_name("math", 1)])
+
+
+def test_for_search_never_includes_other_owners(store):
+    manager = PartitionManager(store, "c")
+    for subject, owner in (("math", None), ("math", 1), ("math", 2), ("history", None), ("history", 11)):
+        manager.ensure(subject, owner)
+    assert manager.for_search("math") == [partition_name("math"), DEFAULT_PARTITION]
+    assert manager.for_search("math", 1) == sorted([partition_name("math"), partition_name("math", 1)]) + [DEFAULT_PARTITION]
+    assert manager.for_search("history", 1) == [partition_name("history"), DEFAULT_PARTITION]
+
+
+class LengthVectors:
+    name = "test-length"
+
+    def encode(self, texts, **kwargs):
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def partitioned(store, monkeypatch):
+    monkeypatch.setattr(extensions, "_milvus_client", store)
+    monkeypatch.setattr(extensions, "collection_name", "c")
+    monkeypatch.setattr(extensions, "embed_model", LengthVectors())
+    monkeypatch.setattr(partitions, "_manager", PartitionManager(store, "c"))
+    return store
+
+
+def test_private_documents_are_only_searched_for_their_owner(partitioned):
+    extensions.insert_documents([
+        {"id": 1, "text": "shared derivative notes", "subject": "math"},
+        {"id": 2, "text": "private derivative notes", "subject": "math", "owner_id": "1"},
+    ])
+    search = lambda **kwargs: sorted(hit["id"] for hit in extensions.hybrid_search("derivative", top_k=10, **kwargs))
+    assert search() == [1]
+    assert search(owner_id="2") == [1]
+    assert search(owner_id="1") == [1, 2]
+    assert search(subject="math", owner_id="1") == [1, 2]
+    assert search(subject="history", owner_id="1") == []
+
+
+def test_unscoped_search_scans_the_whole_collection(partitioned, monkeypatch):
+    searched = []
+    search = partitioned.search
+    monkeypatch.setattr(partitioned, "search", lambda *args, **kwargs: searched.append(kwargs) or search(*args, **kwargs))
+    extensions.insert_documents([{"id": 1, "text": "notes", "subject": "math"}])
+    extensions.hybrid_search("notes", owner_id="1")
+    extensions.hybrid_search("notes", subject="math", owner_id="1")
+    assert searched[0]["partition_names"] is None
+    assert searched[1]["partition_names"] == [partition_name("math"), DEFAULT_PARTITION]
+
+
+def test_private_documents_without_partitions(store, monkeypatch):
+    monkeypatch.setattr(extensions, "_milvus_client", store)
+    monkeypatch.setattr(extensions, "collection_name", "c")
+    monkeypatch.setattr(extensions, "embed_model", LengthVectors())
+    monkeypatch.setattr(partitions, "_manager", None)
+    extensions.insert_documents([
+        {"id": 1, "text": "shared derivative notes", "subject": "math"},
+        {"id": 2, "text": "private derivative notes", "subject": "math", "owner_id": "1"},
+        {"id": 3, "text": "other derivative notes", "subject": "math", "owner_id": "2"},
+    ])
+    assert store.list_partitions("c") == [DEFAULT_PARTITION]
+    search = lambda **kwargs: sorted(hit["id"] for hit in extensions.hybrid_search("derivative", top_k=10, **kwargs))
+    assert search() == [1]
+    assert search(owner_id="1") == [1, 2]
+    assert search(subject="math", owner_id="2") == [1, 3]
+
+
+def test_dedup_is_keyed_on_the_partition(partitioned, monkeypatch):
+    index = MinHashLSH(threshold=0.8)
+    monkeypatch.setattr(extensions, "get_dedup_index", lambda: index)
+    text = "the derivative of a function measures how its output changes as its input changes"
+    result = extensions.insert_documents([
+        {"id": 1, "text": text, "subject": "math"},
+        {"id": 2, "text": text, "subject": "physics"},
+        {"id": 3, "text": text, "subject": "math", "owner_id": "1"},
+        {"id": 4, "text": text, "subject": "math"},
+    ])
+    assert result["skipped"] == 1
+    assert sorted(row["id"] for row in partitioned.query("c", filter="id >= 0")) == [1, 2, 3]
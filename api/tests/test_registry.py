@@ -0,0 +1,208 @@
+import threading
+import time
+
+from flask import Flask
+
+from app.llm import model as llm_model
+from app.llm import registry as registry_module
+from app.llm.registry import ModelRegistry
+
+
+class FakeDraft:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeModel:
+    def __init__(self, name, on_close=None):
+        self.name = name
+        self.closed = False
+        self.draft_model = FakeDraft()
+        self._on_close = on_close
+
+    def close(self):
+        if self._on_close:
+            self._on_close()
+        self.closed = True
+
+
+def make_registry(budget_mb=100, gate=None, on_close=None, idle_timeout=0.0):
+    loaded = []
+
+    def loader(name, spec, instance):
+        loaded.append(name)
+        if gate is not None and name in gate:
+            gate[name].wait(timeout=5)
+        return FakeModel(name, on_close)
+
+    specs = {"a": {"ram_mb": 60}, "b": {"ram_mb": 60}}
+    return ModelRegistry(specs, loader, ram_budget_bytes=budget_mb << 20, idle_timeout=idle_timeout), loaded
+
+
+def test_evicts_lru_and_closes_draft():
+    registry, loaded = make_registry()
+    a = registry.acquire("a")
+    registry.release("a")
+    b = registry.acquire("b")
+    registry.release("b")
+    assert loaded == ["a", "b"]
+    assert a.closed and a.draft_model.closed
+    assert not b.closed
+    assert registry.stats()["evictions"] == 1
+
+
+def test_leased_model_is_not_evicted():
+    registry, loaded = make_registry()
+    registry.acquire("a")
+    waiting = threading.Thread(target=registry.acquire, args=("b",))
+    waiting.start()
+    time.sleep(0.2)
+    assert loaded == ["a"]
+    registry.release("a")
+    waiting.join(timeout=3)
+    assert loaded == ["a", "b"]
+    assert list(registry.stats()["resident"]) == ["b#0"]
+
+
+def test_idle_models_are_unloaded(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(registry_module.time, "monotonic", lambda: now[0])
+    registry, _ = make_registry(idle_timeout=30)
+    a = registry.acquire("a")
+    registry.release("a")
+    now[0] += 10
+    assert registry.unload_idle() == 0
+    now[0] += 30
+    assert registry.unload_idle() == 1
+    assert a.closed
+    assert registry.stats()["idle_unloads"] == 1
+
+
+def test_close_runs_outside_the_lock():
+    registry = None
+    stats_done = []
+
+    def on_close():
+        # Another thread must be able to use the registry while a model shuts down
+        reader = threading.Thread(target=registry.stats)
+        reader.start()
+        reader.join(timeout=2)
+        stats_done.append(not reader.is_alive())
+
+    registry, _ = make_registry(on_close=on_close)
+    registry.acquire("a")
+    registry.release("a")
+    registry.acquire("b")
+    assert stats_done == [True]
+
+
+def test_loads_in_progress_count_against_budget():
+    gate = {"a": threading.Event()}
+    registry, loaded = make_registry(gate=gate)
+
+    first = threading.Thread(target=registry.acquire, args=("a",))
+    first.start()
+    while "a" not in loaded:
+        time.sleep(0.01)
+    assert registry.stats()["ram_used_mb"] == 60.0
+
+    second = threading.Thread(target=registry.acquire, args=("b",))
+    second.start()
+    time.sleep(0.2)
+    # "b" would overflow the budget next to the half-loaded "a"
+    assert loaded == ["a"]
+
+    gate["a"].set()
+    first.join(timeout=2)
+    time.sleep(0.1)
+    assert loaded == ["a"]  # "a" is still leased
+    registry.release("a")
+    second.join(timeout=3)
+    assert loaded == ["a", "b"]
+    assert list(registry.stats()["resident"]) == ["b#0"]
+
+
+def test_failed_load_frees_its_reservation():
+    def loader(name, spec, instance):
+        raise RuntimeError("bad gguf")
+
+    registry = ModelRegistry({"a": {"ram_mb": 60}}, loader, ram_budget_bytes=100 << 20)
+    try:
+        registry.acquire("a")
+    except RuntimeError:
+        pass
+    assert registry.stats()["ram_used_mb"] == 0.0
+    assert registry.stats()["loading"] == []
+
+
+def test_ram_cost_includes_draft(tmp_path):
+    main = tmp_path / "main.gguf"
+    draft = tmp_path / "draft.gguf"
+    main.write_bytes(b"x" * 3000)
+    draft.write_bytes(b"x" * 1000)
+    registry = ModelRegistry({}, loader=None)
+    assert registry._ram_cost("m", {"path": str(main)})[1] == 3000
+    assert registry._ram_cost("m", {"path": str(main), "draft_path": str(draft)})[1] == 4000
+    assert registry._ram_cost("m", {"path": str(main), "draft_path": str(draft), "ram_mb": 1})[1] == 1 << 20
+
+
+def test_instances_share_weights_and_pay_for_their_context(tmp_path):
+    path = tmp_path / "chat.gguf"
+    path.write_bytes(b"x" * (40 << 20))
+    specs = {
+        "chat": {"path": str(path), "context_bytes": 10 << 20},
+        "alias": {"path": str(path), "context_bytes": 10 << 20},
+    }
+    registry = ModelRegistry(specs, lambda name, spec, instance: FakeModel(name), ram_budget_bytes=75 << 20)
+    for instance in range(3):
+        registry.acquire("chat", instance)
+    # One copy of the weights plus three contexts
+    assert registry.stats()["ram_used_mb"] == 70.0
+    registry.release("chat", 0)
+    registry.acquire("alias")
+    # Evicting one instance only freed its context; the weights are still mapped
+    assert sorted(registry.stats()["resident"]) == ["alias#0", "chat#1", "chat#2"]
+    assert registry.stats()["ram_used_mb"] == 70.0
+    assert registry.evictions == 1
+
+
+def test_model_specs_add_draft_path():
+    config = {
+        "LLAMA_MODEL_PATH": "/models/chat.gguf",
+        "LLM_MODELS": {"small": {"path": "/models/small.gguf"}},
+        "LLAMA_DRAFT_MODE": "model",
+        "LLAMA_DRAFT_MODEL_PATH": "/models/draft.gguf",
+    }
+    specs = llm_model.model_specs(config)
+    assert specs["chat"]["draft_path"] == "/models/draft.gguf"
+    assert "draft_path" not in specs["small"]
+
+
+def test_model_specs_add_context_cost_per_process():
+    config = {
+        "LLAMA_MODEL_PATH": "/models/chat.gguf",
+        "LLM_MODELS": {"small": {"path": "/models/small.gguf", "context_mb": 64}},
+        "LLM_WORKER_POOL_SIZE": 2,
+        "LLM_CONTEXT_MB": 256,
+    }
+    specs = llm_model.model_specs(config)
+    assert specs["chat"]["context_bytes"] == 2 * (256 << 20)
+    assert specs["small"]["context_bytes"] == 2 * (64 << 20)
+
+
+def test_model_specs_budget_the_prefix_cache():
+    config = {"LLAMA_MODEL_PATH": "/models/chat.gguf", "LLM_CONTEXT_MB": 256, "LLAMA_PREFIX_CACHE_BYTES": 128 << 20}
+    assert llm_model.model_specs(config)["chat"]["context_bytes"] == (256 + 128) << 20
+
+
+def test_llm_stats_does_not_create_registry(monkeypatch):
+    monkeypatch.setattr(llm_model, "_registry", None)
+    monkeypatch.setattr(llm_model, "_schedulers", {})
+    app = Flask(__name__)
+    with app.app_context():
+        stats = llm_model.llm_stats()
+    assert stats["models"]["resident"] == {}
+    assert llm_model._registry is None
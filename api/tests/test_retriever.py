@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import extensions
+from app.rag import retriever
+from app.rag.vector_store import NumpyVectorStore
+
+
+class LetterVectors:
+    name = "test-letters"
+
+    def encode(self, texts, **kwargs):
+        return np.array([[text.count(c) + 0.1 for c in "aeiou"] for text in texts], dtype=np.float32)
+
+
+class ShortestFirst:
+    """Reranker double: prefers shorter chunks, which vector order does not."""
+
+    def __init__(self):
+        self.queries = []
+
+    def rerank(self, query, hits, top_k, deadline=None):
+        self.queries.append(query)
+        ranked = sorted(({**hit, "rerank_score": -len(hit["text"])} for hit in hits), key=lambda h: -h["rerank_score"])
+        return ranked[:top_k], {"reranked": len(hits), "skipped": False, "truncated": False}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = NumpyVectorStore(str(tmp_path / "store.npvec"))
+    store.create_collection("c", dimension=5)
+    monkeypatch.setattr(extensions, "_milvus_client", store)
+    monkeypatch.setattr(extensions, "collection_name", "c")
+    monkeypatch.setattr(extensions, "embed_model", LetterVectors())
+    extensions.insert_documents([
+        {"id": i, "text": text, "subject": "s"}
+        for i, text in enumerate(["banana bandana", "aaa", "eerie queue", "audio", "a long avocado salad"])
+    ])
+    monkeypatch.setattr(retriever, "get_reranker", lambda: None)
+    return store
+
+
+@pytest.fixture
+def reranker(store, monkeypatch):
+    reranker = ShortestFirst()
+    monkeypatch.setattr(retriever, "get_reranker", lambda: reranker)
+    return reranker
+
+
+def test_batch_search_matches_single_searches(store):
+    queries = ["banana", "queue", "banana"]
+    batch = extensions.hybrid_search_many(queries, top_k=3)
+    assert [[hit["id"] for hit in hits] for hits in batch] == [
+        [hit["id"] for hit in extensions.hybrid_search(query, top_k=3)] for query in queries
+    ]
+    assert extensions.get_rag_context_many(queries, top_k=2) == [
+        extensions.get_rag_context(query, top_k=2) for query in queries
+    ]
+
+
+def test_batch_context_matches_single_query_context(reranker):
+    queries = ["banana", "queue", "banana"]
+    batch = extensions.get_rag_context_many(queries, top_k=2)
+    assert reranker.queries == ["banana", "queue"]  # duplicate queries are retrieved once
+    assert batch == [extensions.get_rag_context(query, top_k=2) for query in queries]
+
+
+def test_retrieve_many_reranks_each_query(reranker):
+    results = retriever.retrieve_many(["banana", "queue"], top_k=3)
+    assert all("rerank_score" in hit for hits in results for hit in hits)
+    assert [hit["text"] for hit in results[0]] == sorted((hit["text"] for hit in results[0]), key=len)
+
+
+def test_retrieve_many_shares_one_rerank_budget(reranker, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(retriever, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    rerank = reranker.rerank
+
+    def slow_rerank(query, hits, top_k, deadline=None):
+        clock[0] += 1.0
+        return rerank(query, hits, top_k, deadline=deadline)
+
+    monkeypatch.setattr(reranker, "rerank", slow_rerank)
+    results = retriever.retrieve_many(["banana", "queue", "audio"], top_k=3, budget_ms=1500)
+    assert reranker.queries == ["banana", "queue"]
+    assert all("rerank_score" not in hit for hit in results[2])
+    assert len(results[2]) == 3
@@ -0,0 +1,32 @@
+import json
+
+from app.llm.runtime_profile import llama_runtime_kwargs
+
+
+def write_profile(tmp_path, model, **overrides):
+    profile = {
+        "model_path": str(model),
+        "model_size": model.stat().st_size,
+        "settings": {"n_threads": 6, "n_threads_batch": 6, "n_batch": 256},
+    }
+    profile.update(overrides)
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps(profile))
+    return str(path)
+
+
+def test_profile_only_fills_unset_keys(tmp_path):
+    model = tmp_path / "chat.gguf"
+    model.write_bytes(b"x" * 100)
+    config = {"LLAMA_PROFILE_PATH": write_profile(tmp_path, model), "LLAMA_N_THREADS": 4, "LLAMA_N_CTX": 2048}
+    kwargs = llama_runtime_kwargs(config, str(model))
+    assert kwargs == {"n_ctx": 2048, "n_threads": 4, "n_threads_batch": 6, "n_batch": 256}
+
+
+def test_profile_for_a_different_file_is_ignored(tmp_path):
+    model = tmp_path / "chat.gguf"
+    model.write_bytes(b"x" * 100)
+    stale = {"LLAMA_PROFILE_PATH": write_profile(tmp_path, model, model_size=99)}
+    assert llama_runtime_kwargs(stale, str(model)) == {}
+    legacy = {"LLAMA_PROFILE_PATH": write_profile(tmp_path, model, model_size=None)}
+    assert llama_runtime_kwargs(legacy, str(model)) == {}
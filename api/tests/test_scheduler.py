@@ -0,0 +1,213 @@
+import threading
+import time
+
+import pytest
+
+from app.llm.scheduler import AdmissionRejected, InferenceScheduler, request_key
+
+
+class FakeModel:
+    """Echoes the prompt; a prompt of "block" waits until the gate opens."""
+
+    def __init__(self):
+        self.served = []
+        self.gate = threading.Event()
+        self.blocking = threading.Event()
+
+    def create_chat_completion(self, messages, stream=False, **params):
+        prompt = messages[-1]["content"]
+        if prompt == "block":
+            self.blocking.set()
+            self.gate.wait(timeout=5)
+        self.served.append(prompt)
+        if stream:
+            return iter([{"choices": [{"delta": {"content": word}}]} for word in prompt.split(" ")])
+        return {"choices": [{"message": {"content": prompt}}], "usage": {"completion_tokens": 1}}
+
+
+def chat(prompt):
+    return [{"role": "user", "content": prompt}]
+
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+
+@pytest.fixture
+def make_scheduler(model):
+    schedulers = []
+
+    def make(**kwargs):
+        scheduler = InferenceScheduler(lambda index: model, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    model.gate.set()
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+def occupy_slot(scheduler, model, priority="interactive"):
+    request = scheduler.submit(chat("block"), priority=priority)
+    assert model.blocking.wait(timeout=2)
+    return request
+
+
+def test_request_key_normalizes_messages():
+    a = request_key([{"role": "User", "content": "hi\r\nthere "}], {"temperature": 0.7}, False)
+    b = request_key([{"role": "user", "content": "hi\nthere"}], {"temperature": 0.7}, False)
+    assert a == b
+    assert a != request_key([{"role": "user", "content": "hi\nthere"}], {"temperature": 0.2}, False)
+    assert a != request_key([{"role": "user", "content": "hi\nthere"}], {"temperature": 0.7}, True)
+
+
+def test_requests_served_in_arrival_order(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=1)
+    occupy_slot(scheduler, model)
+    first = scheduler.submit(chat("first"))
+    second = scheduler.submit(chat("second"))
+    model.gate.set()
+    second.result(timeout=2)
+    first.result(timeout=2)
+    assert model.served == ["block", "first", "second"]
+    assert scheduler.stats()["completed"] == 3
+
+
+def test_streamed_tokens(make_scheduler):
+    scheduler = make_scheduler(num_slots=1)
+    request = scheduler.submit(chat("one two three"), stream=True)
+    assert list(request.tokens()) == ["one", "two", "three"]
+    assert request.result(timeout=2) == "onetwothree"  # the pieces joined
+
+
+def test_interactive_served_before_bulk(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=1)
+    occupy_slot(scheduler, model)
+    bulk = scheduler.submit(chat("bulk"), priority="bulk")
+    interactive = scheduler.submit(chat("interactive"))
+    model.gate.set()
+    bulk.result(timeout=2)
+    interactive.result(timeout=2)
+    assert model.served == ["block", "interactive", "bulk"]
+
+
+def test_full_queue_is_rejected(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=1, max_depth={"bulk": 1})
+    occupy_slot(scheduler, model)
+    scheduler.submit(chat("first"), priority="bulk")
+    with pytest.raises(AdmissionRejected) as rejected:
+        scheduler.submit(chat("second"), priority="bulk")
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after >= 1
+    # The interactive class has its own queue and is still admitted
+    scheduler.check_admission("interactive")
+    stats = scheduler.stats()["classes"]["bulk"]
+    assert (stats["admitted"], stats["rejected"]) == (1, 1)
+
+
+def test_overdue_request_expires(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=1, deadlines={"bulk": 0.05})
+    occupy_slot(scheduler, model)
+    late = scheduler.submit(chat("late"), priority="bulk")
+    time.sleep(0.1)
+    model.gate.set()
+    with pytest.raises(AdmissionRejected) as expired:
+        late.result(timeout=2)
+    assert expired.value.status == 503
+    assert "late" not in model.served
+    assert scheduler.stats()["classes"]["bulk"]["expired"] == 1
+
+
+def test_reserved_slot_only_serves_interactive(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=2, reserved_slots=1)
+    occupy_slot(scheduler, model, priority="bulk")
+    waiting = scheduler.submit(chat("bulk"), priority="bulk")
+    interactive = scheduler.submit(chat("interactive"))
+    assert interactive.result(timeout=2)["choices"][0]["message"]["content"] == "interactive"
+    assert not waiting.done()
+    model.gate.set()
+    waiting.result(timeout=2)
+
+
+def test_reserved_slots_leave_one_shared_slot(make_scheduler):
+    assert make_scheduler(num_slots=2, reserved_slots=5).reserved_slots == 1
+    assert make_scheduler(num_slots=1, reserved_slots=1).reserved_slots == 0
+
+
+def test_identical_requests_share_one_generation(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=1)
+    occupy_slot(scheduler, model)
+    first = scheduler.submit(chat("same answer"), stream=True)
+    second = scheduler.submit(chat("same answer"), stream=True)
+    other = scheduler.submit(chat("same answer"))  # not streamed, so a different request
+    assert first is second
+    assert first.waiters == 2
+    assert other is not first
+    model.gate.set()
+    assert list(first.tokens()) == ["same", "answer"]
+    assert list(second.tokens()) == ["same", "answer"]
+    other.result(timeout=2)
+    assert model.served.count("same answer") == 2
+    stats = scheduler.stats()
+    assert stats["deduplicated"] == 1
+    assert stats["in_flight_keys"] == 0
+
+
+def test_duplicates_only_join_requests_of_equal_or_higher_priority(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=1)
+    occupy_slot(scheduler, model)
+    bulk = scheduler.submit(chat("same"), priority="bulk")
+    interactive = scheduler.submit(chat("same"))
+    assert interactive is not bulk  # does not wait behind the bulk queue
+    assert scheduler.submit(chat("same"), priority="bulk") is interactive
+    assert scheduler.submit(chat("same")) is interactive
+    model.gate.set()
+    bulk.result(timeout=2)
+    interactive.result(timeout=2)
+    assert model.served == ["block", "same", "same"]
+    assert scheduler.stats()["in_flight_keys"] == 0
+
+
+def test_stalled_stream_times_out(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=1, request_timeout=0.1)
+    stalled = occupy_slot(scheduler, model)
+    queued = scheduler.submit(chat("queued"), stream=True)
+    with pytest.raises(TimeoutError):
+        list(stalled.tokens())
+    # Time spent waiting in the queue does not count against the timeout
+    threading.Timer(0.2, model.gate.set).start()
+    assert list(queued.tokens()) == ["queued"]
+
+
+def test_single_flight_off(make_scheduler, model):
+    scheduler = make_scheduler(num_slots=1, single_flight=False)
+    occupy_slot(scheduler, model)
+    assert scheduler.submit(chat("x")) is not scheduler.submit(chat("x"))
+
+
+def test_failed_request_reaches_every_waiter(make_scheduler):
+    def broken(index):
+        raise RuntimeError("no model")
+
+    scheduler = make_scheduler(num_slots=1)
+    scheduler._model_loader = broken
+    request = scheduler.submit(chat("q"))
+    with pytest.raises(RuntimeError, match="no model"):
+        request.result(timeout=2)
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_model_is_leased_per_request(model):
+    leases = []
+    scheduler = InferenceScheduler(
+        lambda index: leases.append("acquire") or model,
+        model_release=lambda index: leases.append("release"),
+    )
+    try:
+        scheduler.submit(chat("a")).result(timeout=2)
+        scheduler.submit(chat("b")).result(timeout=2)
+    finally:
+        scheduler.shutdown()
+    assert leases == ["acquire", "release", "acquire", "release"]
@@ -0,0 +1,49 @@
+import numpy as np
+
+from app.chat.agents import semantic_cache
+from app.chat.agents.semantic_cache import SemanticCache, context_fingerprint
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_paraphrase_hits_same_bucket():
+    cache = SemanticCache(threshold=0.9)
+    fingerprint = context_fingerprint("docs")
+    cache.store(unit(1, 0.05), "learning", fingerprint, "answer")
+    assert cache.lookup(unit(1, 0), "learning", fingerprint) == "answer"
+    assert cache.lookup(unit(0, 1), "learning", fingerprint) is None
+
+
+def test_history_and_scope_change_the_fingerprint():
+    no_history = context_fingerprint("", "", None)
+    room_a = context_fingerprint("", "user: what is a derivative?", "room-1")
+    room_b = context_fingerprint("", "user: what is a derivative?", "room-2")
+    assert len({no_history, room_a, room_b}) == 3
+
+    cache = SemanticCache(threshold=0.9)
+    cache.store(unit(1, 0), "learning", room_a, "answer for room 1")
+    assert cache.lookup(unit(1, 0), "learning", room_b) is None
+
+
+def test_expired_entries_are_dropped_on_lookup(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now[0])
+    cache = SemanticCache(ttl_seconds=10)
+    cache.store(unit(1, 0), "learning", "f", "stale")
+    now[0] += 11
+    assert cache.lookup(unit(1, 0), "learning", "f") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = SemanticCache(max_entries=2)
+    cache.store(unit(1, 0), "learning", "a", "a")
+    cache.store(unit(1, 0), "learning", "b", "b")
+    assert cache.lookup(unit(1, 0), "learning", "a") == "a"
+    cache.store(unit(1, 0), "learning", "c", "c")
+    assert cache.lookup(unit(1, 0), "learning", "b") is None
+    assert cache.lookup(unit(1, 0), "learning", "a") == "a"
+    assert cache.stats()["evictions"] == 1
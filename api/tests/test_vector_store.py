@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from app.rag.vector_store import FilterError, NumpyVectorStore
+
+
+def row(doc_id, vector, subject="math", text=None):
+    return {"id": doc_id, "vector": vector, "text": text or f"doc {doc_id}", "subject": subject}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "store.npvec"))
+    store.create_collection("c", dimension=3)
+    return store
+
+
+def ids(hits):
+    return [hit["id"] for hit in hits]
+
+
+def test_search_ranks_by_cosine_and_applies_filter(store):
+    store.insert("c", [row(1, [1, 0, 0]), row(2, [0.9, 0.1, 0], subject="history"), row(3, [0, 1, 0])])
+    assert ids(store.search("c", [[1, 0, 0]], limit=2)[0]) == [1, 2]
+    assert ids(store.search("c", [[1, 0, 0]], filter="subject == 'math'", limit=3)[0]) == [1, 3]
+
+
+def test_query_filters_and_delete(store):
+    store.insert("c", [row(1, [1, 0, 0]), row(2, [0, 1, 0], subject="history")])
+    assert store.delete("c", filter="subject in ['history']") == {"delete_count": 1}
+    assert ids(store.query("c", filter="id >= 0")) == [1]
+
+
+def test_filter_columns_grow_with_inserts(store):
+    store.insert("c", [row(1, [1, 0, 0]), row(2, [0, 1, 0], subject="history")])
+    assert ids(store.query("c", filter="subject == 'math'")) == [1]
+    columns = store._get("c")._columns
+    subjects = columns["subject"]
+    store.insert("c", [row(3, [0, 0, 1]), {**row(4, [1, 1, 0]), "subject": None}])
+    assert store._get("c")._columns["subject"] is subjects  # extended, not rebuilt
+    assert ids(store.query("c", filter="subject == 'math'")) == [1, 3]
+    assert ids(store.query("c", filter="subject != 'math'")) == [2, 4]
+    assert ids(store.query("c", filter="subject < 'i'")) == [2]
+    store.insert("c", [{**row(5, [1, 0, 1]), "id": "five"}])  # id column is no longer numeric
+    assert ids(store.query("c", filter="id in [1, 'five']")) == [1, "five"]
+
+
+def test_partition_search_uses_partition_codes(store):
+    store.create_partition("c", "p")
+    store.insert("c", [row(1, [1, 0, 0])])
+    store.insert("c", [row(2, [1, 0, 0])], partition_name="p")
+    assert ids(store.search("c", [[1, 0, 0]], limit=5, partition_names=["p"])[0]) == [2]
+    assert ids(store.search("c", [[1, 0, 0]], limit=5, partition_names=["_default", "missing"])[0]) == [1]
+
+
+def test_invalid_filter_raises(store):
+    store.insert("c", [row(1, [1, 0, 0])])
+    with pytest.raises(FilterError):
+        store.query("c", filter="subject ==")
+
+
+def test_reinsert_replaces_previous_row(store):
+    store.insert("c", [row(1, [1, 0, 0], text="old")])
+    store.insert("c", [row(1, [0, 1, 0], text="new")])
+    assert [hit["text"] for hit in store.query("c", filter="id == 1", output_fields=["text"])] == ["new"]
+
+
+def test_delete_then_reinsert_survives_reopen(tmp_path, store):
+    store.insert("c", [row(1, [1, 0, 0], text="first")])
+    store.delete("c", ids=[1])
+    store.insert("c", [row(1, [0, 1, 0], text="second")])
+    assert [hit["text"] for hit in store.query("c", filter="id == 1", output_fields=["text"])] == ["second"]
+
+    reopened = NumpyVectorStore(store.directory)
+    assert [hit["text"] for hit in reopened.query("c", filter="id == 1", output_fields=["text"])] == ["second"]
+    assert ids(reopened.search("c", [[0, 1, 0]], limit=5)[0]) == [1]
+
+
+def test_read_only_worker_sees_deletes_in_log_order(store):
+    reader = NumpyVectorStore(store.directory, read_only=True)
+    store.insert("c", [row(1, [1, 0, 0]), row(2, [0, 1, 0])])
+    store.delete("c", ids=[1])
+    store.insert("c", [row(1, [0, 0, 1])])
+    store.delete("c", ids=[2])
+    assert ids(reader.query("c", filter="id >= 0")) == [1]
+    with pytest.raises(PermissionError):
+        reader.insert("c", [row(3, [1, 1, 1])])
+
+
+def test_ivf_search_matches_exact_on_small_data(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "ivf.npvec"), ivf_nlist=4, ivf_nprobe=4, ivf_min_rows=1)
+    store.create_collection("c", dimension=3)
+    rng = np.random.RandomState(0)
+    store.insert("c", [row(i, rng.rand(3).tolist()) for i in range(64)])
+    exact = NumpyVectorStore(store.directory, read_only=True)
+    query = [[0.2, 0.5, 0.9]]
+    assert ids(store.search("c", query, limit=5)[0]) == ids(exact.search("c", query, limit=5)[0])
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import runpy
+import threading
+
+import pytest
+
+import app
+from app.llm.worker_pool import LlamaWorkerPool, WorkerTimeoutError
+
+RUN_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "run.py")
+
+
+class FakeProcess:
+    pid = 1234
+
+    def is_alive(self):
+        return True
+
+
+def make_pool(replies, request_timeout=0.2):
+    """Pool with one in-thread fake worker that answers each chat with `replies`."""
+    pool = LlamaWorkerPool({"model_path": "model.gguf"}, size=1, request_timeout=request_timeout)
+    parent, child = multiprocessing.Pipe(duplex=True)
+    worker = pool._workers[0]
+    worker.process, worker.conn = FakeProcess(), parent
+
+    def serve():
+        try:
+            while child.recv()[0] == "chat":
+                for reply in replies:
+                    child.send(reply)
+        except EOFError:
+            pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    restarts = []
+    pool._restart = lambda w, reason: restarts.append(reason)
+    return pool, restarts
+
+
+def test_reply_within_deadline():
+    pool, restarts = make_pool([("result", {"choices": []})])
+    assert pool.create_chat_completion(messages=[]) == {"choices": []}
+    assert restarts == []
+    assert pool.stats()["workers"][0]["busy_seconds"] is None
+
+
+def test_stream_round_trip():
+    pool, restarts = make_pool([("chunk", {"n": 1}), ("chunk", {"n": 2}), ("done", None)])
+    assert list(pool.create_chat_completion(messages=[], stream=True)) == [{"n": 1}, {"n": 2}]
+    assert restarts == []
+    assert not pool._workers[0].lock.locked()
+
+
+def test_worker_error_is_raised():
+    pool, _ = make_pool([("error", "bad request")])
+    with pytest.raises(RuntimeError, match="bad request"):
+        pool.create_chat_completion(messages=[])
+    assert pool.stats()["workers"][0]["in_flight"] == 0
+
+
+def test_stuck_worker_is_restarted():
+    pool, restarts = make_pool([])
+    with pytest.raises(WorkerTimeoutError):
+        pool.create_chat_completion(messages=[])
+    assert len(restarts) == 1  # no retry on a second worker
+    worker = pool.stats()["workers"][0]
+    assert worker["timeouts"] == 1
+    assert worker["in_flight"] == 0
+
+
+def test_stalled_stream_is_restarted():
+    pool, restarts = make_pool([("chunk", {"n": 1}), ("chunk", {"n": 2})])
+    chunks = []
+    with pytest.raises(WorkerTimeoutError):
+        for chunk in pool.create_chat_completion(messages=[], stream=True):
+            chunks.append(chunk)
+    assert chunks == [{"n": 1}, {"n": 2}]
+    assert len(restarts) == 1
+    assert not pool._workers[0].lock.locked()
+
+
+def test_spawned_worker_does_not_create_the_app(monkeypatch):
+    # A spawned worker re-runs the parent's main script like this before _worker_main
+    monkeypatch.setattr(app, "create_app", lambda: pytest.fail("worker created the Flask app"))
+    namespace = runpy.run_path(RUN_PY, run_name="__mp_main__")
+    assert "app" not in namespace